@@ -0,0 +1,63 @@
+// Like, save, comment and follow through the JSON endpoints (/api/...) instead of a full page reload.
+// Elements opt in with data-json (endpoint) and data-action; without JS they still post or link as before.
+function csrfToken() {
+    return document.querySelector('[name=csrfmiddlewaretoken]')?.value || '';
+}
+
+const jsonActions = {
+    like(el, data) {
+        document.querySelectorAll(`[data-like-count="${data.tweet}"]`).forEach((count) => { count.textContent = data.likes; });
+    },
+    save(el, data) {
+        const icon = el.querySelector('i');
+        icon.classList.toggle('fa-solid', data.saved);
+        icon.classList.toggle('fa-regular', !data.saved);
+    },
+    comment(el, data) {
+        const list = document.getElementById(`commentsList-${data.tweet}`);
+        list.querySelector('.no-comments')?.remove();
+        list.insertAdjacentHTML('afterbegin', data.html);
+        document.getElementById(`commentCount-${data.tweet}`).textContent = `${data.comments} Comments`;
+        el.reset();
+    },
+    follow(el, data) {
+        const button = el.querySelector('button');
+        button.value = data.following ? 'unfollow' : 'follow';
+        if (button.classList.contains('follow-button')) {
+            button.classList.toggle('unfollow', data.following);
+            button.classList.toggle('follow', !data.following);
+            button.textContent = button.textContent.replace(/^\s*(Unfollow|Follow)/, data.following ? 'Unfollow' : 'Follow');
+        } else {
+            button.classList.toggle('following', data.following);
+            button.textContent = data.following ? 'Following' : 'Follow';
+        }
+        document.querySelectorAll(`[data-followers-count="${data.user}"]`).forEach((count) => { count.textContent = data.followers; });
+    },
+};
+
+async function sendJsonAction(el, body) {
+    body.set('csrfmiddlewaretoken', csrfToken());
+    const response = await fetch(el.dataset.json, { method: 'POST', body, credentials: 'same-origin' });
+    const data = await response.json();
+    if (response.status === 401) {
+        window.location.href = data.login_url;
+    } else if (response.ok) {
+        jsonActions[el.dataset.action](el, data);
+    }
+}
+
+document.addEventListener('submit', (event) => {
+    const form = event.target.closest('form[data-json]');
+    if (!form) return;
+    event.preventDefault();
+    const body = new FormData(form);
+    if (event.submitter?.name) body.set(event.submitter.name, event.submitter.value);
+    sendJsonAction(form, body);
+});
+
+document.addEventListener('click', (event) => {
+    const link = event.target.closest('a[data-json]');
+    if (!link) return;
+    event.preventDefault();
+    sendJsonAction(link, new FormData());
+});
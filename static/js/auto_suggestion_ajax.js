@@ -1,25 +1,52 @@
 const usernameInput = document.getElementById('username-input');
 const suggestionsDatalist = document.getElementById('username-suggestions');
 
+const SUGGEST_DELAY = 150;  // ms of quiet typing before a request goes out
+const suggestionCache = new Map();  // query -> usernames, typing back over a prefix costs nothing
+let suggestTimer = null;
+let pendingRequest = null;
+
+function showSuggestions(usernames) {
+    suggestionsDatalist.innerHTML = '';  // Clear previous suggestions
+    // Populate datalist with new suggestions
+    usernames.forEach(username => {
+        const option = document.createElement('option');
+        option.value = username; // Set the value for each suggestion
+        suggestionsDatalist.appendChild(option);
+    });
+}
+
+function fetchSuggestions(query) {
+    if (suggestionCache.has(query)) {
+        showSuggestions(suggestionCache.get(query));
+        return;
+    }
+    if (pendingRequest) {
+        pendingRequest.abort();  // an older answer arriving late must not replace a newer one
+    }
+    pendingRequest = new AbortController();
+    fetch(`/suggest-users/?username=${encodeURIComponent(query)}`, { signal: pendingRequest.signal })
+        .then(response => response.json())
+        .then(data => {
+            const usernames = data.map(user => user.username);
+            suggestionCache.set(query, usernames);
+            if (usernameInput.value.trim() === query) {
+                showSuggestions(usernames);
+            }
+        })
+        .catch(error => {
+            if (error.name !== 'AbortError') {
+                console.error('Error fetching suggestions:', error);
+            }
+        });
+}
+
 usernameInput.addEventListener('input', () => {
-    const query = usernameInput.value;
+    const query = usernameInput.value.trim();
+    clearTimeout(suggestTimer);
 
     if (query.length > 0) {
-        fetch(`/suggest-users/?username=${query}`)
-            .then(response => response.json())
-            .then(data => {
-                suggestionsDatalist.innerHTML = '';  // Clear previous suggestions
-                console.log(data)
-                // Populate datalist with new suggestions
-                data.forEach(user => {
-                    const option = document.createElement('option');
-                    option.value = user.username; // Set the value for each suggestion
-                    suggestionsDatalist.appendChild(option);
-                });
-            })
-            .catch(error => {
-                console.error('Error fetching suggestions:', error);
-            });
+        suggestTimer = setTimeout(() => fetchSuggestions(query), SUGGEST_DELAY);
     } else {
         suggestionsDatalist.innerHTML = '';  // Clear suggestions if input is empty
     }
@@ -0,0 +1,49 @@
+// Live updates from /live/ (tweetapp/realtime.py): the notification bell, like counts and new tweets
+const liveUrl = document.querySelector('[data-live-url]')?.dataset.liveUrl;
+const newTweetsBanner = document.getElementById('new-tweets');
+let newTweetCount = 0;
+
+function showNewTweets(text) {
+    if (!newTweetsBanner) return;
+    newTweetsBanner.textContent = text;
+    newTweetsBanner.hidden = false;
+}
+
+// the tweets on the page, the stream only carries like counts for these
+function liveStreamUrl() {
+    const ids = new Set([...document.querySelectorAll('[data-like-count]')].map((el) => el.dataset.likeCount));
+    return ids.size ? `${liveUrl}?tweets=${[...ids].join(',')}` : liveUrl;
+}
+
+function openLiveEvents() {
+    const liveEvents = new EventSource(liveStreamUrl());
+
+    liveEvents.addEventListener('notifications', (event) => {
+        const { unread } = JSON.parse(event.data);
+        // the count is the text after the bell icon
+        document.querySelectorAll('[data-unread-count]').forEach((el) => { el.lastChild.textContent = ` Notifications ${unread}`; });
+    });
+
+    liveEvents.addEventListener('likes', (event) => {
+        const { tweet, count } = JSON.parse(event.data);
+        document.querySelectorAll(`[data-like-count="${tweet}"]`).forEach((el) => { el.textContent = count; });
+    });
+
+    liveEvents.addEventListener('tweet', () => {
+        newTweetCount += 1;
+        showNewTweets(`${newTweetCount} new tweet${newTweetCount === 1 ? '' : 's'}, click to show`);
+    });
+
+    // we fell behind and events were dropped, the page may be stale
+    liveEvents.addEventListener('resync', () => showNewTweets('New activity, click to refresh'));
+    return liveEvents;
+}
+
+if (liveUrl && window.EventSource) {
+    let liveEvents = openLiveEvents();
+    // "Load more" added cards (load_more.js), subscribe to their like counts too
+    document.addEventListener('tweets-loaded', () => {
+        liveEvents.close();
+        liveEvents = openLiveEvents();
+    });
+}
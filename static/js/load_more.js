@@ -0,0 +1,41 @@
+const loadMoreButton = document.getElementById('load-more');
+// tweets by default, data-list names another list (the follower/following pages)
+const tweetList = document.getElementById(loadMoreButton?.dataset.list || 'tweet-list');
+
+// the last rendered page leaves a hidden .next-cursor marker, no marker means no more rows
+function nextCursor() {
+    const markers = tweetList.querySelectorAll('.next-cursor');
+    return markers.length ? markers[markers.length - 1] : null;
+}
+
+if (loadMoreButton && tweetList) {
+    if (!nextCursor()) {
+        loadMoreButton.style.display = 'none';
+    }
+
+    loadMoreButton.addEventListener('click', () => {
+        const marker = nextCursor();
+        if (!marker) {
+            loadMoreButton.style.display = 'none';
+            return;
+        }
+
+        loadMoreButton.disabled = true;
+        const separator = loadMoreButton.dataset.url.includes('?') ? '&' : '?';
+        fetch(`${loadMoreButton.dataset.url}${separator}cursor=${encodeURIComponent(marker.dataset.cursor)}`)
+            .then(response => response.text())
+            .then(html => {
+                marker.remove();
+                tweetList.insertAdjacentHTML('beforeend', html);
+                document.dispatchEvent(new Event('tweets-loaded'));
+                loadMoreButton.disabled = false;
+                if (!nextCursor()) {
+                    loadMoreButton.style.display = 'none';
+                }
+            })
+            .catch(error => {
+                loadMoreButton.disabled = false;
+                console.error('Error loading more tweets:', error);
+            });
+    });
+}
@@ -97,6 +97,28 @@ DATABASES = {
 }
 
 
+# Cache
+# local memory by default, point CACHE_BACKEND / CACHE_LOCATION at a shared backend when running more
+# than one process, e.g. django.core.cache.backends.redis.RedisCache + redis://127.0.0.1:6379/1
+# or django.core.cache.backends.filebased.FileBasedCache + /var/tmp/tweet_cache
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'tweet-default'),
+        'TIMEOUT': 300,
+    }
+}
+
+TWEET_CARD_CACHE = 'default'
+TWEET_CARD_CACHE_TIMEOUT = 60 * 60
+
+# follower/following id arrays per profile, see tweetapp/graph.py
+GRAPH_CACHE = 'default'
+GRAPH_CACHE_TIMEOUT = 60 * 60
+FOLLOW_LIST_PAGE_SIZE = 30   # rows per page of /profile/<pk>/followers and /following
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -141,6 +163,25 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR,'media')
 
+# static files are collected under content-hash names by `build_assets`, see tweetapp/assets.py
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'tweetapp.storage.ManifestStaticStorage'},
+}
+SERVE_STATIC = os.environ.get('TWEET_SERVE_STATIC') == '1'   # let Django serve STATIC_ROOT when no web server sits in front
+STATIC_CACHE_CONTROL = 'public, max-age=300'   # unhashed static names, hashed ones are cached for a year
+MEDIA_CACHE_CONTROL = 'public, max-age=3600'   # uploads from before content-addressed storage
+# {% bundle %} names -> source files, concatenated and minified into static/bundles/.
+# menu.js goes last: it throws on pages without a menu and would stop the rest of the bundle.
+ASSET_BUNDLES = {
+    'bundles/feed.css': ['css/profile_pic.css', 'css/menu.css', 'css/modal_form.css', 'css/right_panel.css', 'css/comment.css'],
+    'bundles/feed.js': ['js/popup.js', 'js/cmt.js', 'js/load_more.js', 'js/actions.js', 'js/menu.js'],
+    'bundles/profile.css': ['css/profile_pic.css', 'css/menu.css', 'css/modal_form.css', 'css/comment.css'],
+    'bundles/profile.js': ['js/cmt.js', 'js/load_more.js', 'js/actions.js', 'js/menu.js'],
+    'bundles/follows.js': ['js/load_more.js', 'js/actions.js', 'js/menu.js'],
+    'bundles/navbar.js': ['js/auto_suggestion_ajax.js', 'js/live.js', 'js/menu.js'],
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -161,3 +202,64 @@ EMAIL_HOST_PASSWORD = ''
 
 # twillo_setup
 
+
+# `manage.py test` runs the background work inline, see tweet/test_runner.py
+TEST_RUNNER = 'tweet.test_runner.TestRunner'
+
+# home timeline (fan-out on write)
+TIMELINE_MAX_LENGTH = 800   # entries kept per user, older ones get trimmed on the owner's first page read, by the scheduler and backfill_timelines
+TIMELINE_TRIM_INTERVAL = 60 * 60   # seconds between trim_timelines runs, and between read-time trims of one timeline
+TIMELINE_FANOUT_LIMIT = 5000   # authors with more followers than this are merged in at read time instead
+TIMELINE_PAGE_SIZE = 20
+FEED_COMMENTS_PER_TWEET = 5   # latest comments loaded with each tweet card
+
+# notifications are written by background workers from a local outbox, see tweetapp/notification_queue.py
+NOTIFICATIONS_ASYNC = True   # False delivers inline, the test runner does this (tweet/test_runner.py)
+NOTIFICATION_OUTBOX_PATH = BASE_DIR / 'notification_outbox.sqlite3'
+NOTIFICATION_WORKERS = 2   # 0: no in-process workers, run `manage.py notification_outbox drain` instead
+NOTIFICATION_BATCH_SIZE = 100
+NOTIFICATION_RETRY_INTERVAL = 30   # seconds between outbox sweeps, also the first retry delay of a failed batch
+NOTIFICATION_COALESCE_WINDOW = 60 * 60   # seconds an unread notification keeps absorbing similar ones
+NOTIFICATION_RETENTION_DAYS = 30   # read notifications, delivered event keys and outbox rows older than this are purged
+NOTIFICATION_RETENTION_INTERVAL = 60 * 60
+
+# async views run their independent queries on separate threads and connections, see tweetapp/aio.py
+ASYNC_VIEW_CONCURRENCY = True   # False runs the parts in order on the request's thread, the test runner does this
+
+# username typeahead index held in memory by each process, see tweetapp/user_search.py
+USER_SEARCH_TRIGRAM = True   # infix matches through SQLite FTS5 when the build has the trigram tokenizer
+USER_SEARCH_REFRESH = 10 * 60   # seconds between rebuilds, picks up renames made in other processes
+
+# image uploads are streamed, hashed and checked while they arrive, see tweetapp/uploads.py
+FILE_UPLOAD_HANDLERS = [
+    'tweetapp.uploads.ImageUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+MAX_IMAGE_UPLOAD_SIZE = 5 * 1024 * 1024
+IMAGE_UPLOAD_FIELDS = ('tweet_image', 'image')
+
+# uploaded images are resized off the request path, see tweetapp/images.py
+IMAGES_ASYNC = True   # False resizes during the request, the test runner does this
+IMAGE_WORKERS = 2
+IMAGE_VARIANTS = {'thumb': 96, 'feed': 640, 'full': 1600}   # longest edge in pixels
+
+# live notification/like/tweet events over Server-Sent Events (ASGI only), see tweetapp/realtime.py
+LIVE_EVENT_BUFFER = 100   # events queued per connection before a slow client is told to resync instead
+LIVE_KEEPALIVE = 20   # seconds between keepalive comments on an idle stream
+LIVE_MAX_TWEETS = 200   # tweet ids a page can subscribe to for live like counts
+
+# trending hashtags panel, per-minute counters in memory flushed to TrendingBucket, see tweetapp/trending.py
+TRENDING_WINDOW = 60 * 60   # seconds of history the panel ranks over
+TRENDING_FLUSH_INTERVAL = 60
+TRENDING_CACHE_TIMEOUT = 60
+TRENDING_SIZE = 5
+
+# "who to follow" on the profile list, friends of friends precomputed by tweetapp/recommendations.py
+RECOMMENDATION_SIZE = 20   # suggestions kept per profile
+RECOMMENDATION_ACTIVITY_DAYS = 7
+RECOMMENDATION_ACTIVITY_WEIGHT = 0.5   # score = mutual connections + weight * log(1 + tweets in the window)
+RECOMMENDATION_REFRESH = 6 * 60 * 60   # seconds between rebuilds by the scheduler
+
+# background jobs (tweetapp/scheduler.py), off unless TWEET_SCHEDULER=1, cron the management commands otherwise
+SCHEDULER_ENABLED = os.environ.get('TWEET_SCHEDULER') == '1'
@@ -0,0 +1,27 @@
+"""
+Test runner for `manage.py test` (TEST_RUNNER in settings.py).
+
+The settings default to the production behaviour: work that is handed to background threads there
+runs inline for the whole test run, so a test sees its effects as soon as the call returns. A test
+that exercises the background path turns it back on with override_settings.
+"""
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+TEST_OVERRIDES = {
+    'NOTIFICATIONS_ASYNC': False,   # notify() delivers straight away instead of going through the outbox
+    'IMAGES_ASYNC': False,   # image variants exist once the upload has been saved
+    'ASYNC_VIEW_CONCURRENCY': False,   # other connections can't see the test case's transaction
+}
+
+
+class TestRunner(DiscoverRunner):
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._overrides = override_settings(**TEST_OVERRIDES)
+        self._overrides.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._overrides.disable()
+        super().teardown_test_environment(**kwargs)
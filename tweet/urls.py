@@ -14,10 +14,13 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+
 from django.contrib import admin
-from django.urls import path,include
+from django.urls import path,include,re_path
 from django.conf import settings
-from django.conf.urls.static import static
+
+from tweetapp.serving import serve_media, serve_static
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -25,7 +28,7 @@ urlpatterns = [
     # path('auth/', include('authapp.urls'))    
 ]
 
-
-if settings.DEBUG:
-    urlpatterns+=static(settings.STATIC_URL, document_root= settings.STATIC_ROOT)
-    urlpatterns+=static(settings.MEDIA_URL, document_root= settings.MEDIA_ROOT)
\ No newline at end of file
+# media always, static when nothing in front serves STATIC_ROOT (runserver serves static/ itself in DEBUG)
+urlpatterns+=[re_path(r'^%s/(?P<path>.*)$' % re.escape(settings.MEDIA_URL.strip('/')), serve_media)]
+if settings.DEBUG or settings.SERVE_STATIC:
+    urlpatterns+=[re_path(r'^%s/(?P<path>.*)$' % re.escape(settings.STATIC_URL.strip('/')), serve_static)]
@@ -1,3 +1,155 @@
+import base64
+import json
+from typing import Any, Dict, Optional, Sequence
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q, QuerySet
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """
+    Turn the ordering values of the last row on a page into an opaque, url safe token.
+
+    Args:
+        values (Sequence): Values of the ordering fields, e.g. (created_at, id)
+
+    Returns:
+        str: Cursor token
+    """
+    raw = json.dumps([v.isoformat() if hasattr(v, 'isoformat') else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token: Optional[str]) -> Optional[list]:
+    """
+    Reverse of encode_cursor. A missing or tampered token gives None (first page). The values are
+    not checked here, keyset_values() converts them to the ordering fields' types.
+    """
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    return values if isinstance(values, list) else None
+
+
+def keyset_values(queryset: QuerySet, ordering: Sequence[str], values: Optional[Sequence[Any]]) -> Optional[list]:
+    """
+    The decoded cursor values converted to the types of the ordering fields.
+
+    A cursor is user input: a token that decodes to the wrong number of values, a null, or a value
+    the field can't parse (["x", 1] for created_at, id) gives None, so the page starts over
+    instead of failing with a 500.
+    """
+    if not values or len(values) != len(ordering):
+        return None
+    converted = []
+    for field, value in zip(ordering, values):
+        try:
+            model_field = queryset.model._meta.get_field(field.lstrip('-'))
+        except FieldDoesNotExist:
+            model_field = None
+        try:
+            if model_field is not None:
+                value = model_field.to_python(value)
+            if value is None or isinstance(value, (list, dict)):
+                return None
+            if model_field is not None:
+                model_field.run_validators(value)   # e.g. an id past the backend's integer range
+        except (ValidationError, TypeError, ValueError):
+            return None
+        converted.append(value)
+    return converted
+
+
+def keyset_filter(queryset: QuerySet, ordering: Sequence[str], values: Sequence[Any]) -> Optional[Q]:
+    """
+    Build the "comes after this row" condition for a keyset page.
+
+    For ordering ('-created_at', '-id') and values (t, 7) this gives
+    created_at < t OR (created_at = t AND id < 7), which the database answers
+    with an index seek, so page 500 costs the same as page 1. None when the
+    values don't fit the fields (see keyset_values).
+    """
+    values = keyset_values(queryset, ordering, values)
+    if values is None:
+        return None
+    condition = Q()
+    equal_so_far = Q()
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        condition |= equal_so_far & Q(**{f'{name}__{lookup}': value})
+        equal_so_far &= Q(**{name: value})
+    return condition
+
+
+def paginate_queryset(
+    queryset: QuerySet,
+    cursor: Optional[str] = None,
+    per_page: int = 20,
+    ordering: Sequence[str] = ('-created_at', '-id'),
+) -> Dict[str, Any]:
+    """
+    Keyset (cursor) pagination of a Django QuerySet.
+
+    The last field of `ordering` must be unique (normally the id) so rows with the
+    same timestamp are neither skipped nor repeated.
+
+    Args:
+        queryset (QuerySet): QuerySet to paginate
+        cursor (str, optional): Token from the previous page's `next_cursor`
+        per_page (int): Items per page
+        ordering (Sequence[str]): Model fields to order and seek on
+
+    Returns:
+        Dict: Page results plus the cursor of the next page (None on the last page)
+    """
+    results = list(_page_queryset(queryset, cursor, per_page, ordering))
+    return _page(results, per_page, ordering)
+
+
+async def apaginate_queryset(
+    queryset: QuerySet,
+    cursor: Optional[str] = None,
+    per_page: int = 20,
+    ordering: Sequence[str] = ('-created_at', '-id'),
+) -> Dict[str, Any]:
+    """
+    paginate_queryset for async views, the page is fetched with async iteration.
+    """
+    results = [row async for row in _page_queryset(queryset, cursor, per_page, ordering)]
+    return _page(results, per_page, ordering)
+
+
+def _page_queryset(queryset: QuerySet, cursor: Optional[str], per_page: int, ordering: Sequence[str]) -> QuerySet:
+    # one row more than the page, its presence tells whether there is a next page
+    queryset = queryset.order_by(*ordering)
+    condition = keyset_filter(queryset, ordering, decode_cursor(cursor))
+    if condition is not None:
+        queryset = queryset.filter(condition)
+    return queryset[:per_page + 1]
+
+
+def _page(results: list, per_page: int, ordering: Sequence[str]) -> Dict[str, Any]:
+    has_next = len(results) > per_page
+    results = results[:per_page]
+
+    next_cursor = None
+    if has_next:
+        last = results[-1]
+        next_cursor = encode_cursor([getattr(last, field.lstrip('-')) for field in ordering])
+
+    return {
+        'results': results,
+        'per_page': per_page,
+        'has_next': has_next,
+        'next_cursor': next_cursor,
+    }
+
+
 # import os
 # import re
 # import uuid
@@ -0,0 +1,73 @@
+"""
+Account creation.
+
+Every user needs a Profile that follows itself (its own tweets are on its timeline).
+provision_profile() writes both with two INSERTs: the profile row with its fields set, then the
+self-follow row straight into the through table. The create_profile receiver in models.py calls it
+for any user saved elsewhere (createsuperuser, the admin, the tests). create_account() is what
+register uses. It marks the user so the receiver leaves the profile to it, then writes the user,
+the profile with its phone number and the self-follow in one transaction: three INSERTs, where the
+old path took eight writes plus a reload.
+
+bulk_create_accounts() provisions many accounts for load testing (the import_users command). It
+uses bulk_create for the users, then the profiles, then the self-follows, one batch of each per
+batch_size accounts, and hashes the shared password once. No signals fire on that path, so it
+refreshes the username index itself at the end.
+"""
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import router, transaction
+from django.db.models.signals import m2m_changed
+
+from . import user_search
+from .graph import Follows
+from .models import Profile
+
+
+def provision_profile(user, **fields):
+    """Create the profile of a freshly saved user and its self-follow."""
+    profile = Profile.objects.create(user=user, **fields)
+    Follows.objects.create(from_profile_id=profile.id, to_profile_id=profile.id)
+    # written directly, tell the m2m receivers (username index follower counts) what followed_by.add would have
+    m2m_changed.send(
+        sender=Follows, instance=profile, action='post_add', reverse=True,
+        model=Profile, pk_set={profile.id}, using=router.db_for_write(Follows),
+    )
+    return profile
+
+
+def create_account(user, **profile_fields):
+    """Save a new User (password already set) together with its profile, e.g. create_account(user, phone_number=...)."""
+    with transaction.atomic():
+        user._defer_profile = True   # the create_profile receiver leaves it to us
+        user.save()
+        provision_profile(user, **profile_fields)
+    return user
+
+
+def bulk_create_accounts(accounts, password=None, batch_size=1000):
+    """
+    Create users and profiles from dicts with username, optional email and phone_number. Usernames
+    that already exist are skipped. All accounts get the same password, or an unusable one when it is
+    None. Returns the number of accounts created.
+    """
+    encoded = make_password(password)   # hashing is the slow part, done once for the whole import
+    created = 0
+    for start in range(0, len(accounts), batch_size):
+        batch = accounts[start:start + batch_size]
+        with transaction.atomic():
+            taken = set(User.objects.filter(username__in=[row['username'] for row in batch]).values_list('username', flat=True))
+            batch = list({row['username']: row for row in batch if row['username'] not in taken}.values())
+            User.objects.bulk_create(
+                [User(username=row['username'], email=row.get('email') or '', password=encoded) for row in batch],
+            )
+            # bulk_create can't hand back the ids on every backend, read them back by username
+            user_ids = dict(User.objects.filter(username__in=[row['username'] for row in batch]).values_list('username', 'id'))
+            Profile.objects.bulk_create(
+                [Profile(user_id=user_ids[row['username']], phone_number=row.get('phone_number') or None) for row in batch],
+            )
+            profile_ids = Profile.objects.filter(user_id__in=user_ids.values()).values_list('id', flat=True)
+            Follows.objects.bulk_create([Follows(from_profile_id=profile_id, to_profile_id=profile_id) for profile_id in profile_ids])
+        created += len(batch)
+    user_search.refresh()
+    return created
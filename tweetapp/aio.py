@@ -0,0 +1,45 @@
+"""
+Helpers for the async views (home, profile, user_notifications, suggest_users).
+
+Django's async ORM (aget, async for, ...) hands every query to one thread per request
+(thread_sensitive), so two awaited queries still run one after the other. gather() is for the
+parts of a page that don't depend on each other, such as the rendered cards, the viewer's
+bookmarks and the trending panel. Each part runs on its own executor thread with its own
+database connection, and the slowest one sets the response time instead of their sum.
+
+ASYNC_VIEW_CONCURRENCY = False turns this off (the test runner does). Test cases wrap everything in a
+transaction that other connections can't see, so the calls then run in order on the request's
+thread.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+
+def concurrent():
+    return getattr(settings, 'ASYNC_VIEW_CONCURRENCY', True)
+
+
+def _own_connection(call):
+    def run():
+        try:
+            return call()
+        finally:
+            close_old_connections()   # executor threads outlive the request, don't leave their connection open
+    return run
+
+
+async def gather(*calls):
+    """Run zero-argument sync callables (ORM work, cache reads, rendering) side by side, results in order."""
+    if not concurrent():
+        return [await sync_to_async(call)() for call in calls]
+    return await asyncio.gather(*(sync_to_async(_own_connection(call), thread_sensitive=False)() for call in calls))
+
+
+async def request_user(request):
+    """request.auser(), also stored as request.user so the templates don't load the user a second time."""
+    user = await request.auser()
+    request.user = user
+    return user
@@ -1,6 +1,20 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class TweetappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tweetapp'
+
+    def ready(self):
+        from . import notifications, recommendations, scheduler, timeline, trending, user_search
+        from . import graph  # noqa: F401  connects the follow graph cache signals
+        from . import search  # noqa: F401  connects the full-text index signals
+
+        scheduler.register('notification_retention', getattr(settings, 'NOTIFICATION_RETENTION_INTERVAL', 60 * 60), notifications.run_retention)
+        scheduler.register('user_search_refresh', getattr(settings, 'USER_SEARCH_REFRESH', 10 * 60), user_search.refresh)
+        scheduler.register('trending_flush', getattr(settings, 'TRENDING_FLUSH_INTERVAL', 60), trending.flush)
+        scheduler.register('timeline_trim', getattr(settings, 'TIMELINE_TRIM_INTERVAL', 60 * 60), timeline.trim_timelines)
+        scheduler.register('recommendations', recommendations.refresh_interval(), recommendations.rebuild)
+        if getattr(settings, 'SCHEDULER_ENABLED', False):
+            scheduler.start()
@@ -0,0 +1,144 @@
+"""
+Fragment cache for rendered tweet cards.
+
+The parts of a tweet card that look the same for every viewer (author header, content, latest
+comments) are rendered once and cached under the tweet id plus a version number. The version is
+bumped whenever a comment is added or the tweet is deleted, and the author's Profile.updated is
+part of the key so a new avatar or name shows up straight away. Per viewer bits (bookmark state,
+delete button, csrf forms, like count) stay in front_components/tweet_card.html and cost no queries.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Q
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .models import TweetComment
+
+
+CARD_PARTS = {
+    'head': 'front_components/tweet_card_head.html',
+    'content': 'front_components/tweet_card_content.html',
+    'comments': 'front_components/tweet_card_comments.html',
+}
+
+
+def get_cache():
+    return caches[getattr(settings, 'TWEET_CARD_CACHE', 'default')]
+
+
+def card_timeout():
+    return getattr(settings, 'TWEET_CARD_CACHE_TIMEOUT', 60 * 60)
+
+
+def comments_per_tweet():
+    return getattr(settings, 'FEED_COMMENTS_PER_TWEET', 5)
+
+
+def _version_key(tweet_id):
+    return f'tweet_card_version:{tweet_id}'
+
+
+def _incr(cache, key, delta=1, initial=0):
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        cache.add(key, initial, None)
+        return cache.incr(key, delta)
+
+
+def bump_card_version(tweet_id):
+    # a missing (evicted) version starts from the clock so an old card can never match again
+    _incr(get_cache(), _version_key(tweet_id), initial=time.time_ns())
+
+
+def _card_versions(cache, tweet_ids):
+    keys = {tweet_id: _version_key(tweet_id) for tweet_id in tweet_ids}
+    found = cache.get_many(keys.values())
+    versions = {}
+    for tweet_id, key in keys.items():
+        if key not in found:
+            cache.add(key, time.time_ns(), None)
+            found[key] = cache.get(key, 0)
+        versions[tweet_id] = found[key]
+    return versions
+
+
+def _card_key(tweet, version):
+    updated = tweet.user.profile.updated
+    return f'tweet_card:{tweet.id}:{version}:{updated.timestamp() if updated else 0}'
+
+
+def latest_comments_queryset(tweet_ids):
+    """
+    The latest comments of each tweet in one query: an id IN (... LIMIT n) seek per tweet on
+    comment_tweet_time_idx. A sliced Prefetch would have ROW_NUMBER() number every comment of
+    the page's tweets (and join each author) before keeping the first n of each.
+    """
+    query = Q()
+    for tweet_id in tweet_ids:
+        latest = TweetComment.objects.filter(tweet_id=tweet_id).order_by('-comment_time', '-id').values('id')
+        query |= Q(id__in=latest[:comments_per_tweet()])
+    if not query:
+        return TweetComment.objects.none()
+    return TweetComment.objects.filter(query).select_related('user').order_by('-comment_time', '-id')
+
+
+def attach_latest_comments(tweets):
+    latest = {tweet.id: [] for tweet in tweets}
+    for comment in latest_comments_queryset(list(latest)):
+        latest[comment.tweet_id].append(comment)
+    for tweet in tweets:
+        tweet.latest_comments = latest[tweet.id]
+
+
+def attach_cards(tweets):
+    """
+    Set tweet.card = {'head', 'content', 'comments'} (safe html) on every tweet of a page.
+
+    Cached cards are fetched with one get_many, only the misses get their latest comments
+    loaded (one query for all of them) and rendered.
+    """
+    tweets = list(tweets)
+    if not tweets:
+        return tweets
+
+    cache = get_cache()
+    versions = _card_versions(cache, [tweet.id for tweet in tweets])
+    keys = {tweet.id: _card_key(tweet, versions[tweet.id]) for tweet in tweets}
+    cached = cache.get_many(keys.values())
+
+    misses = [tweet for tweet in tweets if keys[tweet.id] not in cached]
+    if misses:
+        attach_latest_comments(misses)
+        rendered = {}
+        for tweet in misses:
+            card = {part: render_to_string(template, {'tweet': tweet}) for part, template in CARD_PARTS.items()}
+            rendered[keys[tweet.id]] = card
+        cache.set_many(rendered, card_timeout())
+        cached.update(rendered)
+
+    for tweet in tweets:
+        tweet.card = {part: mark_safe(html) for part, html in cached[keys[tweet.id]].items()}
+
+    if len(tweets) - len(misses):
+        _incr(cache, 'tweet_card_stats:hits', len(tweets) - len(misses))
+    if misses:
+        _incr(cache, 'tweet_card_stats:misses', len(misses))
+    return tweets
+
+
+def card_stats():
+    cache = get_cache()
+    stats = cache.get_many(['tweet_card_stats:hits', 'tweet_card_stats:misses'])
+    hits = stats.get('tweet_card_stats:hits', 0)
+    misses = stats.get('tweet_card_stats:misses', 0)
+    total = hits + misses
+    return {
+        'backend': cache.__class__.__name__,
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / total, 4) if total else None,
+    }
@@ -1,10 +1,13 @@
-from .models import Notification
+from django.utils.functional import SimpleLazyObject
+
+from .notifications import latest_unread, unread_count
 
 def notification_count(request):
+    # lazy so templates that never show the bell or the notification panel run no query at all
     if request.user.is_authenticated:
-        unread_count = Notification.objects.filter(
-            notified_user=request.user.profile,
-            is_read=False
-        )
-        return {'unread_notifications': unread_count.count(),'notifications':unread_count.values()[0:4]}
+        user = request.user
+        return {
+            'unread_notifications': SimpleLazyObject(lambda: unread_count(user.profile.id)),
+            'notifications': SimpleLazyObject(lambda: latest_unread(user.profile.id)),
+        }
     return {'unread_notifications': 0}
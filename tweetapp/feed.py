@@ -0,0 +1,29 @@
+"""
+Feed loader shared by every view that renders tweet cards (home, profile, saved posts).
+
+A tweet card needs the author and author profile and the latest comments with their authors
+(like and comment counts are plain columns on Tweet). Loading them lazily from the template costs
+several queries per tweet, here they are fetched up front so a page costs the same number of
+queries whatever its size. The rendered cards themselves come from the fragment cache in cards.py,
+which only loads comments for the cards it has to render.
+"""
+from .cards import attach_cards
+from .models import SavedPosts
+
+
+def feed_queryset(queryset):
+    """Join the author and author profile every tweet card renders onto a Tweet queryset."""
+    return queryset.select_related('user__profile')
+
+
+def load_feed(tweets):
+    """Evaluate a page of tweets and attach their rendered (cached) cards."""
+    return attach_cards(tweets)
+
+
+def saved_tweet_ids(user, tweets):
+    # which of the tweets on this page the viewer has bookmarked, one query for the whole page
+    return set(
+        SavedPosts.objects.filter(user=user, tweet_id__in=[tweet.id for tweet in tweets])
+        .values_list('tweet_id', flat=True)
+    )
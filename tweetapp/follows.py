@@ -0,0 +1,54 @@
+"""
+Follow and unfollow.
+
+set_following() is one transaction that writes only the through-table row: a guarded INSERT for a
+follow, which the (from_profile, to_profile) unique constraint turns into a no-op when the row is
+already there, and a DELETE for an unfollow. The Profile row is never rewritten, so `updated` (and
+the tweet cards keyed on it) stays put.
+
+The timeline copy and the notification happen inside the same transaction, and only when the
+row actually changed. A double click or a replayed POST gets no second notification and no second
+timeline copy. The m2m_changed signal is sent inside it too, but its receivers (the graph cache,
+the username index) apply their updates with transaction.on_commit: if the notification or the
+timeline copy fails, the rollback leaves the cache alone.
+"""
+from django.db import IntegrityError, router, transaction
+from django.db.models.signals import m2m_changed
+
+from . import timeline
+from .graph import Follows
+from .models import Profile
+from .notifications import notify
+
+
+def _send_changed(action, profile, target):
+    # the row is written directly, tell the m2m receivers (graph cache, username index) what follows.add/remove would have
+    m2m_changed.send(
+        sender=Follows, instance=profile, action=action, reverse=False,
+        model=Profile, pk_set={target.id}, using=router.db_for_write(Follows),
+    )
+
+
+def set_following(profile, target, following):
+    """
+    Make profile follow target, or with following=False stop following it.
+
+    Returns True when the state changed, False when it already was that way. A profile always
+    follows itself (its own tweets are on its timeline), that edge is never removed.
+    """
+    if profile.id == target.id:
+        return False
+    try:
+        with transaction.atomic():
+            if following:
+                Follows.objects.create(from_profile_id=profile.id, to_profile_id=target.id)
+                timeline.follow_author(profile.user, target.user)
+            else:
+                if not Follows.objects.filter(from_profile_id=profile.id, to_profile_id=target.id).delete()[0]:
+                    return False
+                timeline.unfollow_author(profile.user, target.user)
+            _send_changed('post_add' if following else 'post_remove', profile, target)
+            notify(notify_by=profile, notified_user=target, notify_type='follow' if following else 'unfollow')
+    except IntegrityError:
+        return False   # already following, maybe through a double click that raced this one
+    return True
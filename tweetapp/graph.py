@@ -0,0 +1,248 @@
+"""
+Cached follow graph.
+
+Each profile has two cache entries: the ids it follows and the ids that follow it. Both are
+sorted array('q') stored as raw bytes, 8 bytes per edge, so a profile with 10k followers costs
+80KB in the cache instead of a pickled list of ints or a query. With a loaded entry:
+
+- counts are len() of the array; follower_counts() also keeps a plain integer per profile for
+  callers that need the size of many follower lists without fetching them (the home timeline
+  classifies every followed author on each read)
+- "does A follow B" is a binary search in A's following array, which is what the follow
+  buttons need (follow_states() answers a whole page of rows at once)
+- mutual follows and follows in common are intersections of two sorted arrays, see intersect()
+
+Entries are built from the through table on a miss (get_many plus one query for all the misses)
+and then kept in step edge by edge. The m2m_changed receiver below updates the arrays of both
+ends when follows/followed_by are changed, so follow_unfollow, the signup self-follow and the
+admin all go through it. The update runs when the change commits (transaction.on_commit), so a
+follow that rolls back never reaches the cache. Like the unread counter, only an entry that exists
+is touched; a missing one is read from the table next time. The update is a read-modify-write on
+the cache, so two follows of the same profile at the same instant on different processes can lose
+one edge. GRAPH_CACHE_TIMEOUT bounds how long such a miss can last.
+"""
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.signals import m2m_changed, post_delete
+from django.dispatch import receiver
+
+from .models import Profile
+
+FOLLOWING = 'following'
+FOLLOWERS = 'followers'
+
+Follows = Profile.follows.through
+
+
+def get_cache():
+    return caches[getattr(settings, 'GRAPH_CACHE', 'default')]
+
+
+def graph_timeout():
+    return getattr(settings, 'GRAPH_CACHE_TIMEOUT', 60 * 60)
+
+
+def _key(direction, profile_id):
+    return f'graph:{direction}:{profile_id}'
+
+
+def _count_key(profile_id):
+    return f'graph:follower_count:{profile_id}'
+
+
+def _unpack(raw):
+    ids = array('q')
+    ids.frombytes(raw)
+    return ids
+
+
+def _load(direction, profile_ids):
+    """{profile_id: sorted array('q')} from the through table, one query for all of profile_ids."""
+    edges = {profile_id: [] for profile_id in profile_ids}
+    if direction == FOLLOWING:
+        rows = Follows.objects.filter(from_profile_id__in=profile_ids).values_list('from_profile_id', 'to_profile_id')
+    else:
+        rows = Follows.objects.filter(to_profile_id__in=profile_ids).values_list('to_profile_id', 'from_profile_id')
+    for profile_id, other_id in rows.order_by():
+        edges[profile_id].append(other_id)
+    return {profile_id: array('q', sorted(ids)) for profile_id, ids in edges.items()}
+
+
+def _get_many(direction, profile_ids):
+    profile_ids = set(profile_ids)
+    if not profile_ids:
+        return {}
+    cache = get_cache()
+    keys = {profile_id: _key(direction, profile_id) for profile_id in profile_ids}
+    found = cache.get_many(keys.values())
+    result = {profile_id: _unpack(found[key]) for profile_id, key in keys.items() if key in found}
+    missing = profile_ids - result.keys()
+    if missing:
+        loaded = _load(direction, missing)
+        cache.set_many({keys[profile_id]: ids.tobytes() for profile_id, ids in loaded.items()}, graph_timeout())
+        result.update(loaded)
+    return result
+
+
+def following_ids(profile_id):
+    """Sorted ids of the profiles profile_id follows (itself included, everyone follows themselves)."""
+    return _get_many(FOLLOWING, [profile_id])[profile_id]
+
+
+def follower_ids(profile_id):
+    return _get_many(FOLLOWERS, [profile_id])[profile_id]
+
+
+def following_map(profile_ids):
+    """{profile_id: following ids} for many profiles with one cache round trip."""
+    return _get_many(FOLLOWING, profile_ids)
+
+
+def follower_map(profile_ids):
+    return _get_many(FOLLOWERS, profile_ids)
+
+
+def following_count(profile_id):
+    return len(following_ids(profile_id))
+
+
+def follower_count(profile_id):
+    return len(follower_ids(profile_id))
+
+
+def follower_counts(profile_ids):
+    """{profile_id: follower count} from one integer cache entry each, one GROUP BY query for the misses."""
+    profile_ids = set(profile_ids)
+    if not profile_ids:
+        return {}
+    cache = get_cache()
+    keys = {profile_id: _count_key(profile_id) for profile_id in profile_ids}
+    found = cache.get_many(keys.values())
+    result = {profile_id: found[key] for profile_id, key in keys.items() if key in found}
+    missing = profile_ids - result.keys()
+    if missing:
+        counts = dict.fromkeys(missing, 0)
+        counts.update(
+            Follows.objects.filter(to_profile_id__in=missing).order_by()
+            .values('to_profile_id').annotate(n=Count('id')).values_list('to_profile_id', 'n')
+        )
+        cache.set_many({keys[profile_id]: n for profile_id, n in counts.items()}, graph_timeout())
+        result.update(counts)
+    return result
+
+
+def contains(ids, value):
+    i = bisect_left(ids, value)
+    return i < len(ids) and ids[i] == value
+
+
+def is_following(profile_id, other_id):
+    return contains(following_ids(profile_id), other_id)
+
+
+def follow_states(profile_id, other_ids):
+    """The subset of other_ids that profile_id follows, for a page of follow buttons."""
+    following = following_ids(profile_id)
+    return {other_id for other_id in other_ids if contains(following, other_id)}
+
+
+def intersect(a, b):
+    """Sorted array of the ids in both sorted arrays, binary searching the larger for each id of the smaller."""
+    if len(a) > len(b):
+        a, b = b, a
+    return array('q', (value for value in a if contains(b, value)))
+
+
+def mutual_ids(profile_id):
+    """Profiles that follow profile_id back."""
+    following, followers = following_ids(profile_id), follower_ids(profile_id)
+    return array('q', (value for value in intersect(following, followers) if value != profile_id))
+
+
+def common_following_ids(profile_id, other_id):
+    """Profiles followed by both."""
+    following = following_map([profile_id, other_id])
+    return intersect(following[profile_id], following[other_id])
+
+
+def _update(direction, profile_id, other_ids, add):
+    cache = get_cache()
+    key = _key(direction, profile_id)
+    raw = cache.get(key)
+    if raw is None:
+        return   # not cached, read from the table next time
+    ids = _unpack(raw)
+    for other_id in other_ids:
+        i = bisect_left(ids, other_id)
+        present = i < len(ids) and ids[i] == other_id
+        if add and not present:
+            ids.insert(i, other_id)
+        elif not add and present:
+            del ids[i]
+    cache.set(key, ids.tobytes(), graph_timeout())
+
+
+def _adjust_count(profile_id, delta):
+    try:
+        get_cache().incr(_count_key(profile_id), delta)
+    except ValueError:
+        pass   # not cached, counted from the table next time
+
+
+def _apply(follower_id, followed_ids, add):
+    _update(FOLLOWING, follower_id, followed_ids, add)
+    for followed_id in followed_ids:
+        _update(FOLLOWERS, followed_id, [follower_id], add)
+        _adjust_count(followed_id, 1 if add else -1)
+
+
+def record_follow(follower_id, followed_ids):
+    """Add the edges follower_id -> followed_ids to the cached arrays of both ends."""
+    _apply(follower_id, followed_ids, True)
+
+
+def record_unfollow(follower_id, followed_ids):
+    _apply(follower_id, followed_ids, False)
+
+
+def invalidate(profile_ids):
+    keys = [_key(direction, profile_id) for profile_id in profile_ids for direction in (FOLLOWING, FOLLOWERS)]
+    get_cache().delete_many(keys + [_count_key(profile_id) for profile_id in profile_ids])
+
+
+def _apply_edges(instance_id, pk_set, reverse, add):
+    if reverse:
+        # followed_by.add(...) on the followed profile
+        for follower_id in pk_set:
+            _apply(follower_id, [instance_id], add)
+    else:
+        _apply(instance_id, sorted(pk_set), add)
+
+
+@receiver(m2m_changed, sender=Follows)
+def track_follows(sender, instance, action, reverse, pk_set, using, **kwargs):
+    # the cache is changed once the edge is committed: before that a rollback would leave an edge
+    # in the cache that the table never had, and another process could cache the old state after us
+    if action == 'pre_clear':
+        # post_clear carries no ids, remember the other ends before they are gone
+        field = 'from_profile_id' if reverse else 'to_profile_id'
+        own = 'to_profile_id' if reverse else 'from_profile_id'
+        instance._graph_cleared = list(Follows.objects.using(using).filter(**{own: instance.id}).values_list(field, flat=True))
+    elif action == 'post_clear':
+        profile_ids = [instance.id, *getattr(instance, '_graph_cleared', ())]
+        transaction.on_commit(lambda: invalidate(profile_ids), using=using)
+    elif action in ('post_add', 'post_remove') and pk_set:
+        instance_id, pk_set = instance.id, set(pk_set)
+        transaction.on_commit(lambda: _apply_edges(instance_id, pk_set, reverse, action == 'post_add'), using=using)
+
+
+@receiver(post_delete, sender=Profile)
+def forget_profile(sender, instance, using, **kwargs):
+    # the cascade removes the edges without m2m signals, the other ends keep a dead id until they expire
+    profile_id = instance.id   # delete() sets it to None afterwards
+    transaction.on_commit(lambda: invalidate([profile_id]), using=using)
@@ -0,0 +1,101 @@
+"""
+The queries the feed, profile, saved posts, tag and notification pages run on every request.
+
+Each entry builds the queryset with placeholder ids, check_query_plans runs EXPLAIN QUERY PLAN on
+them and fails when one of them scans a whole table. Register new hot queries here when adding a
+listing so a missing index is caught before it reaches production.
+"""
+from django.db.models import Count, F
+from django.utils import timezone
+
+from tweet.utils import encode_cursor
+
+from . import cards, timeline
+from .feed import feed_queryset
+from .graph import Follows
+from .models import Notification, Recommendation, SavedPosts, TrendingBucket, Tweet
+from .tags import tag_links
+
+
+HOT_QUERIES = {}
+
+
+def hot_query(name):
+    def register(build):
+        HOT_QUERIES[name] = build
+        return build
+    return register
+
+
+@hot_query('profile tweets page')
+def profile_tweets():
+    return Tweet.objects.filter(user_id=1).order_by('-created_at', '-id')[:21]
+
+
+@hot_query('home timeline page')
+def home_timeline_page():
+    # the query home() runs for a reader following two celebrities, built by the same code
+    return feed_queryset(timeline.home_queryset(1, [2, 3], None, 20)).order_by(*timeline.ORDERING)[:21]
+
+
+@hot_query('home timeline next page')
+def home_timeline_next_page():
+    cursor = encode_cursor([timezone.now(), 1])
+    return feed_queryset(timeline.home_queryset(1, [2], cursor, 20)).order_by(*timeline.ORDERING)[:21]
+
+
+@hot_query('celebrity follower counts')
+def celebrity_follower_counts():
+    # graph.follower_counts on a cache miss
+    return Follows.objects.filter(to_profile_id__in=[1, 2]).order_by().values('to_profile_id').annotate(n=Count('id'))
+
+
+@hot_query('unread notifications')
+def unread_notifications():
+    return Notification.objects.filter(notified_user_id=1, is_read=False).order_by('-notify_time')[:50]
+
+
+@hot_query('unread notification count')
+def unread_notification_count():
+    return Notification.objects.filter(notified_user_id=1, is_read=False).values('id')
+
+
+@hot_query('saved posts page')
+def saved_posts_page():
+    return SavedPosts.objects.filter(user_id=1).order_by('-saved_at', '-id')[:21]
+
+
+@hot_query('saved state of a feed page')
+def saved_state():
+    return SavedPosts.objects.filter(user_id=1, tweet_id__in=[1, 2, 3]).values('tweet_id')
+
+
+@hot_query('latest comments of a feed page')
+def latest_comments():
+    # the query cards.attach_cards sends for a page of tweets, built by the same code
+    return cards.latest_comments_queryset(range(1, 21))
+
+
+@hot_query('tag feed page')
+def tag_feed_page():
+    return tag_links('django').order_by('-created_at', '-id')[:21]
+
+
+@hot_query('trending window')
+def trending_window():
+    return TrendingBucket.objects.filter(minute__gte=timezone.now()).values('hashtag_id')
+
+
+@hot_query('who to follow')
+def who_to_follow():
+    return Recommendation.objects.filter(profile_id=1).select_related('candidate__user').order_by('rank')[:20]
+
+
+@hot_query('followers page')
+def followers_page():
+    return Follows.objects.filter(to_profile_id=1).exclude(from_profile_id=F('to_profile_id')).order_by('-id')[:31]
+
+
+@hot_query('following page')
+def following_page():
+    return Follows.objects.filter(from_profile_id=1).exclude(from_profile_id=F('to_profile_id')).order_by('-id')[:31]
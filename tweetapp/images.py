@@ -0,0 +1,134 @@
+"""
+Resized variants of uploaded images (Tweet.tweet_image, Profile.image).
+
+After the upload is saved, process_upload hands the bytes to a small process pool
+(tweetapp/imaging.py does the Pillow work). The request does not wait for it. The pool:
+
+- decodes the image once
+- re-encodes the original without its EXIF/GPS metadata
+- writes every IMAGE_VARIANTS size as JPEG (PNG when the image has transparency), plus WebP and
+  AVIF when Pillow can write them
+
+The variant names are stored in the image_variants JSON field next to the image and the
+{% picture %} tag turns them into <picture>/srcset markup. Until the variants exist, the
+templates fall back to the original.
+"""
+import logging
+import multiprocessing
+import posixpath
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from . import imaging
+from .cards import bump_card_version
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def variant_widths():
+    return getattr(settings, 'IMAGE_VARIANTS', {'thumb': 96, 'feed': 640, 'full': 1600})
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: the web process has threads (outbox workers, scheduler) a fork would copy mid-lock
+            _pool = ProcessPoolExecutor(
+                max_workers=getattr(settings, 'IMAGE_WORKERS', 2),
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _pool
+
+
+def process_upload(instance, field_name):
+    """Queue variant generation for the file currently in instance.<field_name>, once the transaction commits."""
+    name = getattr(instance, field_name).name
+    if name:
+        transaction.on_commit(lambda: _submit(type(instance), instance.pk, field_name, name))
+
+
+def process_now(instance, field_name):
+    """Generate the variants in this process and wait for them (generate_image_variants command)."""
+    _submit(type(instance), instance.pk, field_name, getattr(instance, field_name).name, background=False)
+
+
+def _submit(model, pk, field_name, name, background=None):
+    storage = model._meta.get_field(field_name).storage
+    with storage.open(name, 'rb') as upload:
+        source = upload.read()
+    args = (source, variant_widths(), imaging.modern_formats())
+
+    if background is None:
+        background = getattr(settings, 'IMAGES_ASYNC', True)
+    if not background:
+        _store(model, pk, field_name, name, imaging.render(*args))
+        return
+    get_pool().submit(imaging.render, *args).add_done_callback(
+        lambda future: _finish(model, pk, field_name, name, future)
+    )
+
+
+def _finish(model, pk, field_name, name, future):
+    # runs on the pool's result thread, not a request thread
+    try:
+        _store(model, pk, field_name, name, future.result())
+    except Exception:
+        logger.exception("image variants for %s %s failed", model.__name__, pk)
+    finally:
+        close_old_connections()
+
+
+def _store(model, pk, field_name, name, result):
+    field = model._meta.get_field(field_name)
+    storage = field.storage
+    # the storage names every file after its own content, only the upload dir and the extension
+    # come from here. Not the upload's name: that is a blob path already (<dir>/<2 hex>/<sha256>),
+    # and saving next to it would nest blob directories inside blob directories
+    directory = field.upload_to
+
+    written = []
+    variants = {}
+    original = None
+    for variant, data in result.items():
+        entry = {'width': data['width'], 'height': data['height']}
+        for ext, content in data['files'].items():
+            if variant == 'original':
+                original = storage.save(posixpath.join(directory, f"original.{ext}"), ContentFile(content))
+                written.append(original)
+            else:
+                entry[ext] = storage.save(posixpath.join(directory, 'variants', f"{variant}.{ext}"), ContentFile(content))
+                written.append(entry[ext])
+        if variant != 'original':
+            variants[variant] = entry
+
+    changes = {field_name: original, 'image_variants': variants}
+    if any(field.name == 'updated' for field in model._meta.concrete_fields):
+        changes['updated'] = timezone.now()   # Profile.updated is part of the tweet card cache key
+    # only if the row still points at the upload we processed, a newer upload or a delete wins
+    if not model.objects.filter(pk=pk, **{field_name: name}).update(**changes):
+        for written_name in written:
+            storage.delete(written_name)
+        return
+
+    storage.delete(name)   # the copy that still carried the metadata
+    if model._meta.model_name == 'tweet':
+        bump_card_version(pk)
+
+
+def discard_variants(instance):
+    """Delete the variant files of instance's image. The caller saves the (now empty) image_variants."""
+    storage = instance._meta.get_field('tweet_image' if instance._meta.model_name == 'tweet' else 'image').storage
+    for entry in (instance.image_variants or {}).values():
+        for key, value in entry.items():
+            if key not in ('width', 'height'):
+                storage.delete(value)
+    instance.image_variants = {}
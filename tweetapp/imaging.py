@@ -0,0 +1,77 @@
+"""
+Image resizing run inside the image worker processes (see tweetapp/images.py).
+
+Only Pillow is imported here so a freshly spawned worker starts without loading Django. The
+upload is decoded once, turned upright from its EXIF orientation, and every variant is a resize
+of that one decoded image. Metadata (EXIF, GPS, comments) is never copied into the output.
+"""
+import io
+
+from PIL import Image, ImageOps
+
+try:   # AVIF is built into Pillow >= 11.2, older versions need the pillow-avif-plugin package
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pass
+
+QUALITY = {'JPEG': 82, 'WEBP': 80, 'AVIF': 60, 'PNG': None}
+EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp', 'AVIF': 'avif'}
+
+
+def modern_formats():
+    """WEBP / AVIF when this Pillow build can write them."""
+    extensions = Image.registered_extensions()
+    return [fmt for fmt, ext in (('AVIF', '.avif'), ('WEBP', '.webp')) if extensions.get(ext) == fmt and fmt in Image.SAVE]
+
+
+def _encode(image, fmt, quality=None):
+    out = io.BytesIO()
+    options = {'optimize': True} if fmt in ('JPEG', 'PNG') else {}
+    if QUALITY[fmt]:
+        options['quality'] = quality or QUALITY[fmt]
+    if fmt == 'JPEG':
+        options['progressive'] = True
+    image.save(out, fmt, **options)
+    return out.getvalue()
+
+
+def render(source, widths, formats):
+    """
+    source: bytes of the uploaded image
+    widths: {'thumb': 96, 'feed': 640, ...} longest edge of each variant in pixels
+    formats: extra formats to encode on top of the JPEG / PNG fallback
+
+    Returns {'original': {...}, 'thumb': {...}, ...}, each {'width', 'height', 'files': {ext: bytes}}.
+    'original' is the upload at full size re-encoded without its metadata.
+    """
+    with Image.open(io.BytesIO(source)) as opened:
+        original_format = opened.format
+        image = ImageOps.exif_transpose(opened)
+        image.load()
+
+    has_alpha = image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info)
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+    fallback = 'PNG' if has_alpha else 'JPEG'
+    # the original keeps its format where browsers can show it (a GIF or TIFF becomes the fallback)
+    original_format = original_format if original_format in ('PNG', 'WEBP') or (original_format == 'JPEG' and not has_alpha) else fallback
+
+    result = {
+        'original': {
+            'width': image.width,
+            'height': image.height,
+            'files': {EXTENSIONS[original_format]: _encode(image, original_format, quality=90)},
+        },
+    }
+    source = image
+    for name, width in sorted(widths.items(), key=lambda item: -item[1]):
+        # largest first, each variant is shrunk from the previous one instead of from the full image
+        variant = source.copy()
+        if max(variant.size) > width:
+            variant.thumbnail((width, width), Image.LANCZOS)
+        source = variant
+        result[name] = {
+            'width': variant.width,
+            'height': variant.height,
+            'files': {EXTENSIONS[fmt]: _encode(variant, fmt) for fmt in [fallback, *formats]},
+        }
+    return result
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from tweetapp import tags
+from tweetapp.models import Tweet
+
+
+class Command(BaseCommand):
+    help = "Extract #hashtags and @mentions from existing tweets into the tag and mention tables (no notifications are sent)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="tweets loaded per query")
+
+    def handle(self, *args, **options):
+        total_tweets = total_tags = total_mentions = 0
+        tweets = Tweet.objects.select_related('user').order_by('id')
+        for tweet in tweets.iterator(chunk_size=options['batch_size']):
+            hashtag_names, usernames = tags.index_tweet(tweet, notify_mentions=False, count_trending=False)
+            total_tweets += 1
+            total_tags += len(hashtag_names)
+            total_mentions += len(usernames)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Scanned {total_tweets} tweets: {total_tags} hashtags and {total_mentions} mentions indexed"
+        ))
@@ -0,0 +1,28 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from tweetapp import timeline
+
+
+class Command(BaseCommand):
+    help = "Fill (or rebuild) the materialized home timelines from the follow graph and trim them to TIMELINE_MAX_LENGTH"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help="only rebuild the timeline of this user id")
+        parser.add_argument('--batch-size', type=int, default=200, help="users loaded per query")
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('id')
+        if options['user']:
+            users = users.filter(id=options['user'])
+
+        total_users = total_added = total_trimmed = 0
+        for user in users.iterator(chunk_size=options['batch_size']):
+            added, trimmed = timeline.rebuild_timeline(user)
+            total_users += 1
+            total_added += added
+            total_trimmed += trimmed
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {total_users} timelines: {total_added} entries refreshed, {total_trimmed} trimmed"
+        ))
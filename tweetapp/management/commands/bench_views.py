@@ -0,0 +1,120 @@
+import asyncio
+import itertools
+import os
+import random
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import AsyncClient, Client, override_settings
+
+from tweetapp import accounts, notifications
+from tweetapp.models import Profile, Tweet
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the throughput of the home, profile, notification and typeahead views served through "
+        "the WSGI handler (a thread per request) and the ASGI handler (one event loop) under concurrent "
+        "load. It runs against a throwaway database, the real one is never touched"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help="requests per handler")
+        parser.add_argument('--concurrency', type=int, default=16, help="requests in flight at once")
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--tweets', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        # a file, not the shared in-memory test database, so threads get real concurrent readers
+        directory = tempfile.TemporaryDirectory()
+        connection.settings_dict['TEST'] = {**connection.settings_dict.get('TEST', {}), 'NAME': os.path.join(directory.name, 'bench.sqlite3')}
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with override_settings(DEBUG=False, ALLOWED_HOSTS=['testserver'], NOTIFICATIONS_ASYNC=False):
+                viewer, paths = self.seed(options)
+                for name, run in (('wsgi', self.run_wsgi), ('asgi', self.run_asgi)):
+                    elapsed, latencies = run(viewer, paths, options['requests'], options['concurrency'])
+                    latencies.sort()
+                    self.stdout.write(
+                        f"{name}: {len(latencies) / elapsed:7.1f} req/s   "
+                        f"p50 {statistics.median(latencies) * 1000:6.1f} ms   "
+                        f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:6.1f} ms   "
+                        f"({len(latencies)} requests, {options['concurrency']} concurrent)"
+                    )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            directory.cleanup()
+
+    def seed(self, options):
+        rng = random.Random(options['seed'])
+        accounts.bulk_create_accounts([{'username': f'bench{i}'} for i in range(options['users'])], password='bench')
+        users = list(User.objects.filter(username__startswith='bench').order_by('id'))
+        profiles = {profile.user_id: profile for profile in Profile.objects.all()}
+        for user in users:
+            followed = rng.sample(users, min(20, len(users)))
+            profiles[user.id].follows.add(*[profiles[other.id] for other in followed if other != user])
+        Tweet.objects.bulk_create(
+            [Tweet(user=rng.choice(users), tweet_title=f'tweet {i}', body=f'body of tweet {i}') for i in range(options['tweets'])],
+            batch_size=500,
+        )
+        call_command('backfill_timelines', stdout=StringIO())
+
+        viewer = users[0]
+        for fan in users[1:30]:
+            notifications.notify(profiles[fan.id], profiles[viewer.id], 'follow')
+        paths = ['/', f'/profile/{users[1].id}', '/notifications/', '/suggest-users/?username=bench1']
+
+        # warm the card cache and the username index so neither handler pays for them
+        client = Client()
+        client.force_login(viewer)
+        for path in paths:
+            client.get(path)
+        return viewer, paths
+
+    def run_wsgi(self, viewer, paths, total, concurrency):
+        clients = [Client() for _ in range(concurrency)]
+        for client in clients:
+            client.force_login(viewer)
+        counter = itertools.count()
+        latencies = []
+
+        def worker(client):
+            while (n := next(counter)) < total:
+                start = time.perf_counter()
+                response = client.get(paths[n % len(paths)])
+                latencies.append(time.perf_counter() - start)
+                assert response.status_code == 200, (paths[n % len(paths)], response.status_code)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            list(pool.map(worker, clients))
+        return time.perf_counter() - start, latencies
+
+    def run_asgi(self, viewer, paths, total, concurrency):
+        async def run():
+            clients = [AsyncClient() for _ in range(concurrency)]
+            for client in clients:
+                await client.aforce_login(viewer)
+            counter = itertools.count()
+            latencies = []
+
+            async def worker(client):
+                while (n := next(counter)) < total:
+                    start = time.perf_counter()
+                    response = await client.get(paths[n % len(paths)])
+                    latencies.append(time.perf_counter() - start)
+                    assert response.status_code == 200, (paths[n % len(paths)], response.status_code)
+
+            start = time.perf_counter()
+            await asyncio.gather(*(worker(client) for client in clients))
+            return time.perf_counter() - start, latencies
+
+        return asyncio.run(run())
@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from tweetapp import assets
+
+
+class Command(BaseCommand):
+    help = (
+        "Concatenate and minify the ASSET_BUNDLES, collect every static file under a content-hash name "
+        "and write .gz/.br copies next to them for the static view"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-collect', action='store_true', help="only rebuild static/bundles/, skip collectstatic and compression")
+        parser.add_argument('--no-compress', action='store_true', help="skip writing the .gz/.br copies")
+
+    def handle(self, *args, **options):
+        for name, (source_size, size) in assets.build_bundles().items():
+            self.stdout.write(f"{name}: {source_size} -> {size} bytes")
+        if options['no_collect']:
+            return
+
+        call_command('collectstatic', interactive=False, verbosity=options['verbosity'] - 1)
+        if not options['no_compress']:
+            written = assets.precompress(settings.STATIC_ROOT)
+            self.stdout.write(f"{written} compressed copies written{'' if assets.brotli else ' (gzip only, brotli is not installed)'}")
+        self.stdout.write(self.style.SUCCESS("Assets built, restart the web processes to pick up the new manifest"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from tweetapp import recommendations
+
+
+class Command(BaseCommand):
+    help = "Recompute the friends-of-friends \"who to follow\" suggestions of every profile and store the top RECOMMENDATION_SIZE"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="profiles written per transaction")
+
+    def handle(self, *args, **options):
+        profiles, rows = recommendations.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Stored {rows} suggestions for {profiles} profiles"))
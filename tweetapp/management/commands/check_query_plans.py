@@ -0,0 +1,47 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from tweetapp.hot_queries import HOT_QUERIES
+
+
+# "SCAN tweetapp_tweet" is a full table scan, "SCAN ... USING [COVERING] INDEX" walks a whole index
+FULL_SCAN = re.compile(r'\bSCAN (\w+)(?! USING)')
+
+
+class Command(BaseCommand):
+    help = "EXPLAIN QUERY PLAN every registered hot query and fail if any of them does a full table scan"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--verbose-plans', action='store_true', help="print every plan, not only the bad ones")
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if connection.vendor != 'sqlite':
+            raise CommandError(f"EXPLAIN QUERY PLAN is SQLite only, this database is {connection.vendor}")
+
+        failures = []
+        for name, build in HOT_QUERIES.items():
+            sql, params = build().query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                plan = [row[-1] for row in cursor.fetchall()]
+
+            scans = [line for line in plan if FULL_SCAN.search(line)]
+            sorts = [line for line in plan if 'TEMP B-TREE' in line]
+            if scans:
+                failures.append(name)
+                self.stdout.write(self.style.ERROR(f"FULL SCAN  {name}"))
+            elif sorts:
+                self.stdout.write(self.style.WARNING(f"SORTS      {name}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"ok         {name}"))
+
+            if scans or sorts or options['verbose_plans']:
+                for line in plan:
+                    self.stdout.write(f"    {line}")
+
+        if failures:
+            raise CommandError(f"{len(failures)} hot queries do a full table scan: {', '.join(failures)}")
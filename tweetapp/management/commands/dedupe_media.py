@@ -0,0 +1,134 @@
+import hashlib
+import os
+import posixpath
+import re
+import shutil
+import tempfile
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from tweetapp.models import MediaBlob, Profile, Tweet
+from tweetapp.storage import CHUNK_SIZE, blob_name, media_storage
+
+# already in the content-addressed layout: <dir>/<2 hex>/<64 hex>.<ext>
+BLOB = re.compile(r'(^|/)([0-9a-f]{2})/\2[0-9a-f]{62}\.\w+$')
+IMAGE_FIELDS = ((Tweet, 'tweet_image'), (Profile, 'image'))
+
+
+def sha256_of(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class Command(BaseCommand):
+    help = (
+        "Move uploaded images into the content-addressed layout: identical files collapse into one, "
+        "image fields and variants are repointed and the reference counts are rebuilt from the database. "
+        "Files are copied first and the originals removed last, so an interrupted run can simply be rerun"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="report what would change without touching anything")
+        parser.add_argument('--delete-orphans', action='store_true', help="also remove files no row points at")
+        parser.add_argument('--batch-size', type=int, default=500, help="rows loaded per query")
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        root = media_storage.location
+
+        # 1. hash every file not yet in the blob layout and decide where it goes
+        renamed = {}
+        targets = set()
+        saved_bytes = 0
+        for directory in ('profile_image', 'tweet_images'):
+            for dirpath, _, filenames in os.walk(os.path.join(root, directory)):
+                for filename in filenames:
+                    if filename.startswith('.upload-'):
+                        continue
+                    name = os.path.relpath(os.path.join(dirpath, filename), root).replace(os.sep, '/')
+                    if BLOB.search(name):
+                        continue
+                    path = os.path.join(dirpath, filename)
+                    target = blob_name(posixpath.dirname(name), sha256_of(path), posixpath.splitext(name)[1])
+                    if target in targets or os.path.exists(media_storage.path(target)):
+                        saved_bytes += os.path.getsize(path)
+                    renamed[name] = target
+                    targets.add(target)
+
+        duplicates = len(renamed) - len(targets)
+        self.stdout.write(f"{len(renamed)} files to move, {duplicates} duplicates, {saved_bytes} bytes to reclaim")
+        if dry_run:
+            return
+
+        # 2. copy each file to its blob name, the original stays until no row points at it. A copy
+        # goes through a temp file and a rename, so an interrupted run never leaves half a blob
+        for name, target in renamed.items():
+            destination = media_storage.path(target)
+            if os.path.exists(destination):
+                continue   # a duplicate, or copied by an earlier run
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(destination), prefix='.upload-')
+            with os.fdopen(fd, 'wb') as temp, open(media_storage.path(name), 'rb') as source:
+                shutil.copyfileobj(source, temp, CHUNK_SIZE)
+            os.replace(temp_path, destination)
+
+        # 3. repoint the rows and rebuild MediaBlob from every reference in one transaction: rows
+        # saved since the scan are counted too, and a failed run leaves the old names in place
+        with transaction.atomic():
+            refs = Counter()
+            for model, field_name in IMAGE_FIELDS:
+                rows = model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True}).only('id', field_name, 'image_variants')
+                for instance in rows.iterator(chunk_size=options['batch_size']):
+                    old = getattr(instance, field_name).name
+                    new = renamed.get(old, old)
+                    variants = instance.image_variants or {}
+                    changed = new != old
+                    for entry in variants.values():
+                        for key, value in entry.items():
+                            if key not in ('width', 'height'):
+                                entry[key] = renamed.get(value, value)
+                                changed |= entry[key] != value
+                                refs[entry[key]] += 1
+                    refs[new] += 1
+                    if changed:
+                        model.objects.filter(id=instance.id).update(**{field_name: new, 'image_variants': variants})
+
+            MediaBlob.objects.all().delete()
+            MediaBlob.objects.bulk_create(
+                [
+                    MediaBlob(name=name, digest=posixpath.splitext(posixpath.basename(name))[0], size=os.path.getsize(media_storage.path(name)), refs=count)
+                    for name, count in refs.items()
+                    if BLOB.search(name) and media_storage.exists(name)
+                ],
+                batch_size=options['batch_size'],
+            )
+
+        # 4. the originals go last, except one a row was saved under after the repoint
+        in_use = self.still_referenced(list(renamed), options['batch_size'])
+        for name in renamed:
+            if name not in in_use:
+                os.remove(media_storage.path(name))
+        kept = len(in_use)
+
+        orphans = [name for name in targets if refs[name] == 0]
+        if options['delete_orphans']:
+            for name in orphans:
+                os.remove(media_storage.path(name))
+        self.stdout.write(self.style.SUCCESS(
+            f"Moved {len(renamed) - kept} files into {len(targets)} blobs, "
+            f"{len(orphans)} unreferenced{' and deleted' if options['delete_orphans'] else ''}"
+            f"{f', {kept} originals still in use, run again to move them' if kept else ''}"
+        ))
+
+    def still_referenced(self, names, batch_size):
+        found = set()
+        for start in range(0, len(names), batch_size):
+            batch = names[start:start + batch_size]
+            for model, field_name in IMAGE_FIELDS:
+                found.update(model.objects.filter(**{f'{field_name}__in': batch}).values_list(field_name, flat=True))
+        return found
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from tweetapp import images
+from tweetapp.models import Profile, Tweet
+
+
+class Command(BaseCommand):
+    help = "Generate resized, metadata-free variants for tweet images and profile pictures uploaded before the image pipeline"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="redo images that already have variants")
+        parser.add_argument('--batch-size', type=int, default=200, help="rows loaded per query")
+
+    def handle(self, *args, **options):
+        for model, field_name in ((Tweet, 'tweet_image'), (Profile, 'image')):
+            rows = model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True}).order_by('id')
+            if not options['force']:
+                rows = rows.filter(image_variants={})
+            done = failed = 0
+            for instance in rows.only('id', field_name, 'image_variants').iterator(chunk_size=options['batch_size']):
+                try:
+                    if options['force']:
+                        images.discard_variants(instance)
+                    images.process_now(instance, field_name)
+                    done += 1
+                except Exception as error:   # a missing or corrupt file should not stop the run
+                    failed += 1
+                    self.stderr.write(f"{model.__name__} {instance.id}: {error}")
+            self.stdout.write(self.style.SUCCESS(f"{model.__name__}: {done} images processed, {failed} failed"))
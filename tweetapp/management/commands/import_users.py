@@ -0,0 +1,31 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tweetapp import accounts
+
+
+class Command(BaseCommand):
+    help = (
+        "Create accounts in bulk (users, profiles and self-follows with bulk_create), from a CSV file with "
+        "username,email,phone_number columns or generated with --generate N for load testing"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file', nargs='?', help="CSV with a header row, only username is required")
+        parser.add_argument('--generate', type=int, default=0, help="create N accounts named <prefix><n> instead of reading a file")
+        parser.add_argument('--prefix', default='loadtest', help="username prefix for --generate")
+        parser.add_argument('--password', help="password shared by every imported account, unusable when left out")
+        parser.add_argument('--batch-size', type=int, default=1000, help="accounts written per transaction")
+
+    def handle(self, *args, **options):
+        if options['generate']:
+            rows = [{'username': f"{options['prefix']}{n}"} for n in range(options['generate'])]
+        elif options['csv_file']:
+            with open(options['csv_file'], newline='') as f:
+                rows = [row for row in csv.DictReader(f) if row.get('username')]
+        else:
+            raise CommandError("give a CSV file or --generate N")
+
+        created = accounts.bulk_create_accounts(rows, password=options['password'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Created {created} accounts, {len(rows) - created} skipped (username taken)"))
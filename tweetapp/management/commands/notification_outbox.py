@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tweetapp import notification_queue
+
+
+class Command(BaseCommand):
+    help = "Inspect, drain or replay the local notification outbox"
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['stats', 'drain', 'replay', 'purge'])
+        parser.add_argument('--since-hours', type=float, help="replay: only events queued in the last N hours (at most NOTIFICATION_RETENTION_DAYS)")
+        parser.add_argument('--older-than-days', type=float, default=7, help="purge: delivered events older than this")
+
+    def handle(self, *args, **options):
+        outbox = notification_queue.get_outbox()
+        action = options['action']
+
+        if action == 'replay':
+            wanted = time.time() - options['since_hours'] * 3600 if options['since_hours'] else None
+            requeued, since = notification_queue.replay(wanted)
+            if wanted is None or since > wanted:
+                hours = (time.time() - since) / 3600
+                self.stdout.write(self.style.WARNING(
+                    f"Replaying the last {hours:.0f} hours only, older events may already be forgotten by deliver() "
+                    f"(NOTIFICATION_RETENTION_DAYS) and would be written twice"
+                ))
+            self.stdout.write(f"Marked {requeued} delivered events as pending again")
+            action = 'drain'
+
+        if action == 'drain':
+            started = time.monotonic()
+            delivered = notification_queue.drain()
+            elapsed = time.monotonic() - started
+            self.stdout.write(self.style.SUCCESS(f"Delivered {delivered} events in {elapsed:.2f}s"))
+        elif action == 'purge':
+            purged = outbox.purge(time.time() - options['older_than_days'] * 86400)
+            self.stdout.write(self.style.SUCCESS(f"Purged {purged} delivered events"))
+
+        stats = outbox.stats()
+        self.stdout.write(f"Outbox {outbox.path}: {stats['pending']} pending ({stats['failing']} failing), {stats['delivered']} delivered")
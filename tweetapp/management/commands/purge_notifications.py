@@ -0,0 +1,36 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from tweetapp.notifications import purge_read
+
+
+class Command(BaseCommand):
+    help = "Delete (optionally archive first) read notifications older than N days, in small batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=float, default=getattr(settings, 'NOTIFICATION_RETENTION_DAYS', 30))
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--pause', type=float, default=0, help="seconds to sleep between batches")
+        parser.add_argument('--archive', help="append the purged rows to this file as JSON lines")
+
+    def handle(self, *args, **options):
+        archive = open(options['archive'], 'a') if options['archive'] else None
+        started = time.monotonic()
+        total = batches = 0
+        try:
+            for deleted in purge_read(options['days'], options['batch_size'], archive):
+                total += deleted
+                batches += 1
+                elapsed = time.monotonic() - started
+                self.stdout.write(f"batch {batches}: {deleted} rows, {total} total, {total / elapsed:.0f} rows/s")
+                if options['pause']:
+                    time.sleep(options['pause'])
+        finally:
+            if archive:
+                archive.close()
+
+        elapsed = time.monotonic() - started
+        rate = total / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(f"Purged {total} notifications in {batches} batches, {elapsed:.2f}s ({rate:.0f} rows/s)"))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from tweetapp import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search tables of tweets and comments, streaming both in chunks"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if not search.available():
+            self.stdout.write("Full-text search needs SQLite FTS5, nothing to rebuild")
+            return
+
+        total = 0
+        with transaction.atomic():   # searches keep seeing the old rows until the new ones are complete
+            for total in search.reindex(options['chunk_size']):
+                self.stdout.write(f"  {total} tweets and comments indexed")
+        self.stdout.write(self.style.SUCCESS(f"Indexed {total} tweets and comments"))
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from tweetapp.models import Tweet, TweetComment, TweetLikes
+
+
+class Command(BaseCommand):
+    help = "Recount Tweet.likes_count / comments_count from the likes and comments tables and fix any drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="tweets checked per batch")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        checked = repaired = 0
+        last_id = 0
+
+        while True:
+            # walk the table by primary key so every batch is an index range, never an OFFSET
+            batch = list(
+                Tweet.objects.filter(id__gt=last_id)
+                .order_by('id')
+                .values_list('id', 'likes_count', 'comments_count')[:batch_size]
+            )
+            if not batch:
+                break
+            last_id = batch[-1][0]
+            ids = [row[0] for row in batch]
+
+            likes = dict(
+                TweetLikes.objects.filter(tweet_id__in=ids).order_by()
+                .values('tweet_id').annotate(total=Count('id')).values_list('tweet_id', 'total')
+            )
+            comments = dict(
+                TweetComment.objects.filter(tweet_id__in=ids).order_by()
+                .values('tweet_id').annotate(total=Count('id')).values_list('tweet_id', 'total')
+            )
+
+            drifted = [
+                Tweet(id=tweet_id, likes_count=likes.get(tweet_id, 0), comments_count=comments.get(tweet_id, 0))
+                for tweet_id, likes_count, comments_count in batch
+                if likes_count != likes.get(tweet_id, 0) or comments_count != comments.get(tweet_id, 0)
+            ]
+            if drifted:
+                Tweet.objects.bulk_update(drifted, ['likes_count', 'comments_count'])
+
+            checked += len(batch)
+            repaired += len(drifted)
+
+        self.stdout.write(self.style.SUCCESS(f"Checked {checked} tweets, repaired {repaired} counters"))
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.7 on 2026-10-18 10:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweetapp', '0011_alter_profile_phone_number'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Notification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('notify_time', models.DateTimeField(auto_now_add=True)),
+                ('notify_type', models.CharField(choices=[('like', 'Like'), ('comment', 'Comment'), ('follow', 'Follow'), ('unfollow', 'UnFollow')], max_length=10)),
+                ('is_read', models.BooleanField(default=False)),
+                ('notified_user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='received_notifications', to='tweetapp.profile')),
+                ('notify_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='tweetapp.profile')),
+                ('notify_tweet', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='tweetapp.tweet')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField()),
+                ('tweet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='tweetapp.tweet')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-created_at'], name='timeline_user_created_idx')],
+                'unique_together': {('user', 'tweet')},
+            },
+        ),
+    ]
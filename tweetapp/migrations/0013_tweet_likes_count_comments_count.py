@@ -0,0 +1,38 @@
+# Generated by Django 5.1.7 on 2026-10-18 10:32
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Tweet = apps.get_model('tweetapp', 'Tweet')
+    TweetLikes = apps.get_model('tweetapp', 'TweetLikes')
+    TweetComment = apps.get_model('tweetapp', 'TweetComment')
+
+    def counted(model):
+        rows = model.objects.filter(tweet=OuterRef('pk')).order_by().values('tweet').annotate(total=Count('pk')).values('total')
+        return Coalesce(Subquery(rows, output_field=IntegerField()), 0)
+
+    Tweet.objects.update(likes_count=counted(TweetLikes), comments_count=counted(TweetComment))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweetapp', '0012_notification_timelineentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tweet',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tweet',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 10:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweetapp', '0013_tweet_likes_count_comments_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='event_key',
+            field=models.CharField(blank=True, editable=False, max_length=32, null=True, unique=True),
+        ),
+    ]
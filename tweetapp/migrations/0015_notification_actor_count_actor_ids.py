@@ -0,0 +1,30 @@
+# Generated by Django 5.1.7 on 2026-10-18 10:37
+
+from django.db import migrations, models
+
+
+def fill_actor_ids(apps, schema_editor):
+    Notification = apps.get_model('tweetapp', 'Notification')
+    for notification in Notification.objects.only('id', 'notify_by_id').iterator():
+        Notification.objects.filter(id=notification.id).update(actor_ids=[notification.notify_by_id])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweetapp', '0014_notification_event_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='actor_count',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='actor_ids',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.RunPython(fill_actor_ids, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.1.7 on 2026-10-18 10:41
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_saves(apps, schema_editor):
+    # get_or_create raced before the constraint existed, keep the oldest save of each pair
+    SavedPosts = apps.get_model('tweetapp', 'SavedPosts')
+    duplicated = (
+        SavedPosts.objects.values('user_id', 'tweet_id')
+        .annotate(rows=Count('id'), keep=Min('id'))
+        .filter(rows__gt=1)
+    )
+    for pair in duplicated:
+        SavedPosts.objects.filter(user_id=pair['user_id'], tweet_id=pair['tweet_id']).exclude(id=pair['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweetapp', '0015_notification_actor_count_actor_ids'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_saves, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('is_read', False)), fields=['notified_user', '-notify_time'], name='notification_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='savedposts',
+            index=models.Index(fields=['user', '-saved_at', '-id'], name='savedposts_user_saved_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tweet',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='tweet_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tweet',
+            index=models.Index(fields=['-created_at', '-id'], name='tweet_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tweetcomment',
+            index=models.Index(fields=['tweet', 'comment_time', 'id'], name='comment_tweet_time_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='savedposts',
+            constraint=models.UniqueConstraint(fields=('user', 'tweet'), name='savedposts_user_tweet_unique'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.7 on 2026-10-18 12:05
+
+from django.db import migrations
+
+
+def create_search_table(apps, schema_editor):
+    # FTS5 virtual table, only SQLite has it, tweetapp/search.py falls back to LIKE elsewhere
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE tweetapp_tweet_search USING fts5("
+        "tweet_title, body, comments, tokenize='porter unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute(
+        "INSERT INTO tweetapp_tweet_search (rowid, tweet_title, body, comments) "
+        "SELECT t.id, t.tweet_title, t.body, COALESCE(("
+        "  SELECT group_concat(c.description, char(10)) FROM tweetapp_tweetcomment c WHERE c.tweet_id = t.id"
+        "), '') FROM tweetapp_tweet t"
+    )
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS tweetapp_tweet_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweetapp', '0016_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
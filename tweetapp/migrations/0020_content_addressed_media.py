@@ -0,0 +1,34 @@
+# Generated by Django 5.1.7 on 2026-10-18 10:55
+
+import tweetapp.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweetapp', '0019_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('digest', models.CharField(db_index=True, max_length=64)),
+                ('size', models.PositiveBigIntegerField()),
+                ('refs', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='profile',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=tweetapp.storage.get_media_storage, upload_to='profile_image'),
+        ),
+        migrations.AlterField(
+            model_name='tweet',
+            name='tweet_image',
+            field=models.ImageField(blank=True, null=True, storage=tweetapp.storage.get_media_storage, upload_to='tweet_images'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.7 on 2026-10-18 11:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweetapp', '0020_content_addressed_media'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Recommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('mutuals', models.PositiveIntegerField(default=0)),
+                ('computed_at', models.DateTimeField()),
+                ('candidate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='tweetapp.profile')),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to='tweetapp.profile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['profile', 'rank'], name='recommendation_rank_idx')],
+                'unique_together': {('profile', 'candidate')},
+            },
+        ),
+    ]
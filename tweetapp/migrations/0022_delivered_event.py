@@ -0,0 +1,20 @@
+# Generated by Django 5.1.7 on 2026-10-18 11:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweetapp', '0021_recommendations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeliveredEvent',
+            fields=[
+                ('event_key', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('delivered_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+    ]
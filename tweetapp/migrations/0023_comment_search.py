@@ -0,0 +1,49 @@
+# Generated by Django 5.1.7 on 2026-10-18 12:40
+
+from django.db import migrations
+
+TOKENIZE = "tokenize='porter unicode61 remove_diacritics 2'"
+
+
+def split_comment_search(apps, schema_editor):
+    # comments get FTS5 rows of their own, the tweet rows keep only title and body
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS tweetapp_tweet_search")
+    schema_editor.execute(f"CREATE VIRTUAL TABLE tweetapp_tweet_search USING fts5(tweet_title, body, {TOKENIZE})")
+    schema_editor.execute(
+        "INSERT INTO tweetapp_tweet_search (rowid, tweet_title, body) "
+        "SELECT id, COALESCE(tweet_title, ''), COALESCE(body, '') FROM tweetapp_tweet"
+    )
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE tweetapp_comment_search USING fts5(description, tweet_id UNINDEXED, {TOKENIZE})"
+    )
+    schema_editor.execute(
+        "INSERT INTO tweetapp_comment_search (rowid, description, tweet_id) "
+        "SELECT id, COALESCE(description, ''), tweet_id FROM tweetapp_tweetcomment"
+    )
+
+
+def merge_comment_search(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS tweetapp_comment_search")
+    schema_editor.execute("DROP TABLE IF EXISTS tweetapp_tweet_search")
+    schema_editor.execute(f"CREATE VIRTUAL TABLE tweetapp_tweet_search USING fts5(tweet_title, body, comments, {TOKENIZE})")
+    schema_editor.execute(
+        "INSERT INTO tweetapp_tweet_search (rowid, tweet_title, body, comments) "
+        "SELECT t.id, t.tweet_title, t.body, COALESCE(("
+        "  SELECT group_concat(c.description, char(10)) FROM tweetapp_tweetcomment c WHERE c.tweet_id = t.id"
+        "), '') FROM tweetapp_tweet t"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweetapp', '0022_delivered_event'),
+    ]
+
+    operations = [
+        migrations.RunPython(split_comment_search, merge_comment_search),
+    ]
@@ -4,6 +4,7 @@ from django.db.models.signals import post_save
 from django.dispatch import receiver
 import datetime 
 from phonenumber_field.modelfields import PhoneNumberField
+from .storage import get_media_storage
 # Create your models here.
 
 
@@ -15,7 +16,8 @@ class Profile(models.Model):
     fullname = models.CharField(max_length=300,null=True,blank=True)
     gender = models.CharField(max_length=10, choices=[('M', 'Male'), ('F', 'Female'), ('O', 'Other')], null=True, blank=True)
     date_of_birth = models.DateField(null=True, blank=True)
-    image  = models.ImageField(upload_to='profile_image',null=True,blank=True)
+    image  = models.ImageField(upload_to='profile_image',storage=get_media_storage,null=True,blank=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)   # resized copies written by tweetapp/images.py
     bio = models.TextField(null=True, blank=True)
     phone_number = PhoneNumberField(blank=True, null=True, help_text='Enter phone number with country code.')
 
@@ -34,14 +36,12 @@ class VerifyOtp(models.Model):
 
 # create profile when new user signs up
 @receiver(post_save, sender=User)
-def create_profile(sender,instance,created,**kwargs):
-    if created:
-        user_profile = Profile(user=instance)
-        user_profile.save()
-
-        # need show user post to itself so follow it self
-        user_profile.follows.set([instance.profile.id])
-        user_profile.save()  # 2 times save because 1st to create the profile then follow himself 
+def create_profile(sender,instance,created,raw=False,**kwargs):
+    # accounts.create_account() writes the profile itself (with the phone number) in the same transaction
+    if created and not raw and not getattr(instance, '_defer_profile', False):
+        from .accounts import provision_profile
+        # need show user post to itself so it follows itself, see provision_profile
+        provision_profile(instance)
 
 # post_save.connect(create_profile,sender=User)
 
@@ -49,18 +49,28 @@ def create_profile(sender,instance,created,**kwargs):
 class Tweet(models.Model):
     user = models.ForeignKey(User,related_name='tweets',on_delete=models.DO_NOTHING)
     tweet_title = models.CharField(max_length=35)
-    tweet_image = models.ImageField(upload_to='tweet_images',null=True,blank=True)
+    tweet_image = models.ImageField(upload_to='tweet_images',storage=get_media_storage,null=True,blank=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)   # resized copies written by tweetapp/images.py
     body = models.CharField(max_length=300)
     created_at = models.DateTimeField(auto_now_add=True)
+    # kept in step by add_likes / add_comments with F() updates, repaired by the reconcile_counters command
+    likes_count = models.PositiveIntegerField(default=0)
+    comments_count = models.PositiveIntegerField(default=0)
 
     def __str__(self) -> str:
         return f"{self.user} - {self.tweet_title} - {self.created_at:%d-%m-%Y : %H:%M}"
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='tweet_user_created_idx'),
+            models.Index(fields=['-created_at', '-id'], name='tweet_created_idx'),
+        ]
+
     def like_count(self):
-        return self.likes.count()
+        return self.likes_count
 
     def comment_count(self):
-        return self.comments.count() 
+        return self.comments_count 
     
 class TweetLikes(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -77,6 +87,11 @@ class TweetComment(models.Model):
     description = models.CharField(max_length=400)
     comment_time = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['tweet', 'comment_time', 'id'], name='comment_tweet_time_idx'),
+        ]
+
     def __str__(self):
         return f"{self.tweet} - {self.description}"
     
@@ -87,12 +102,93 @@ class SavedPosts(models.Model):
     tweet = models.ForeignKey(Tweet,on_delete=models.CASCADE)
     saved_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'tweet'], name='savedposts_user_tweet_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-saved_at', '-id'], name='savedposts_user_saved_idx'),
+        ]
+
+class MediaBlob(models.Model):
+    # one row per file in the content-addressed media storage (tweetapp/storage.py)
+    name = models.CharField(max_length=255, unique=True)
+    digest = models.CharField(max_length=64, db_index=True)   # sha256 of the content
+    size = models.PositiveBigIntegerField()
+    refs = models.PositiveIntegerField(default=0)   # image fields and variants pointing at the file
+
+    def __str__(self) -> str:
+        return f"{self.name} ({self.refs} refs)"
+
+class TimelineEntry(models.Model):
+    # materialized home timeline, one row per (reader, tweet) written when the tweet is posted
+    user = models.ForeignKey(User, related_name='timeline_entries', on_delete=models.CASCADE)
+    tweet = models.ForeignKey(Tweet, related_name='timeline_entries', on_delete=models.CASCADE)
+    created_at = models.DateTimeField()   # copy of tweet.created_at so a timeline slice is read straight off the index
+
+    class Meta:
+        unique_together = ('user', 'tweet')
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-tweet'], name='timeline_user_created_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.user} <- {self.tweet_id}"
+
+class Hashtag(models.Model):
+    name = models.CharField(max_length=50, unique=True)   # lowercased, without the '#'
+
+    def __str__(self) -> str:
+        return f"#{self.name}"
+
+class TweetHashtag(models.Model):
+    # written by tags.index_tweet when the tweet is posted, a tag feed is a seek on hashtag_feed_idx
+    tweet = models.ForeignKey(Tweet, related_name='hashtag_links', on_delete=models.CASCADE)
+    hashtag = models.ForeignKey(Hashtag, related_name='tweet_links', on_delete=models.CASCADE)
+    created_at = models.DateTimeField()   # copy of tweet.created_at
+
+    class Meta:
+        unique_together = ('hashtag', 'tweet')
+        indexes = [
+            models.Index(fields=['hashtag', '-created_at'], name='hashtag_feed_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.hashtag} - {self.tweet_id}"
+
+class Mention(models.Model):
+    tweet = models.ForeignKey(Tweet, related_name='mentions', on_delete=models.CASCADE)
+    user = models.ForeignKey(User, related_name='mentions', on_delete=models.CASCADE)
+    created_at = models.DateTimeField()   # copy of tweet.created_at
+
+    class Meta:
+        unique_together = ('user', 'tweet')
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='mention_user_created_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f"@{self.user} in {self.tweet_id}"
+
+class TrendingBucket(models.Model):
+    # per minute hashtag counts flushed from the in-memory counters in tweetapp/trending.py
+    hashtag = models.ForeignKey(Hashtag, related_name='trending_buckets', on_delete=models.CASCADE)
+    minute = models.DateTimeField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('hashtag', 'minute')
+        indexes = [
+            models.Index(fields=['minute'], name='trending_minute_idx'),
+        ]
+
 class Notification(models.Model):
     NOTIFY_TYPES = (
         ('like', 'Like'),
         ('comment', 'Comment'),
         ('follow', 'Follow'),
-        ('unfollow','UnFollow')
+        ('unfollow','UnFollow'),
+        ('mention', 'Mention'),
     )
 
     notify_by = models.ForeignKey("Profile", on_delete=models.CASCADE)
@@ -101,6 +197,43 @@ class Notification(models.Model):
     notify_type = models.CharField(max_length=10, choices=NOTIFY_TYPES)
     is_read = models.BooleanField(default=False) 
     notified_user = models.ForeignKey("Profile", on_delete=models.CASCADE, related_name="received_notifications") 
+    event_key = models.CharField(max_length=32, unique=True, null=True, blank=True, editable=False)   # outbox event that opened this row
+    # one unread row collects every like/comment/follow of the same kind within NOTIFICATION_COALESCE_WINDOW
+    actor_count = models.PositiveIntegerField(default=1)
+    actor_ids = models.JSONField(default=list, blank=True)   # distinct Profile ids in the order they acted, notify_by is the latest
+
+    class Meta:
+        indexes = [
+            # partial index: Django compiles is_read=False to "NOT is_read", which a plain (notified_user, is_read, ...)
+            # index cannot seek on, and unread rows are the only ones the inbox and the counter read
+            models.Index(fields=['notified_user', '-notify_time'], condition=models.Q(is_read=False), name='notification_unread_idx'),
+        ]
 
     def __str__(self):
         return f"{self.notify_by} {self.notify_type}d on your tweet {self.notify_tweet} at {self.notify_time}"
+
+    def others_count(self):
+        return max(self.actor_count - 1, 0)
+
+class DeliveredEvent(models.Model):
+    # key of every outbox event notifications.deliver() has applied, folded into a row or not, so a redelivery is a no-op
+    event_key = models.CharField(max_length=32, primary_key=True)
+    delivered_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+class Recommendation(models.Model):
+    # "who to follow" rows written by tweetapp/recommendations.py, the top RECOMMENDATION_SIZE per profile
+    profile = models.ForeignKey(Profile, related_name='recommendations', on_delete=models.CASCADE)
+    candidate = models.ForeignKey(Profile, related_name='+', on_delete=models.CASCADE)
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    mutuals = models.PositiveIntegerField(default=0)   # profiles the reader follows that follow the candidate
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('profile', 'candidate')
+        indexes = [
+            models.Index(fields=['profile', 'rank'], name='recommendation_rank_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.profile} -> {self.candidate} ({self.mutuals} mutuals)"
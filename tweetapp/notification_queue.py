@@ -0,0 +1,310 @@
+"""
+Background delivery of notifications.
+
+Request handlers call notifications.notify(), which appends an event to a local SQLite outbox
+(a separate file, so it survives a crash or restart and does not compete with the main database
+for locks) and wakes a small pool of worker threads. The workers take pending events in batches
+and hand them to notifications.deliver(), which writes them with one bulk_create per batch.
+The event is appended when the request's transaction commits, so a request that fails adds none.
+With NOTIFICATION_WORKERS = 0 the events only wait in the outbox for `notification_outbox drain`.
+Every event carries a unique key that deliver() records once it is applied (DeliveredEvent), so
+delivering the same event twice (a retry, a replay, two processes sharing the outbox) changes nothing.
+
+A batch that fails stays in the outbox with a retry time that doubles with every attempt (up to
+MAX_RETRY_DELAY). Besides the workers the pool runs a sweeper thread that, every
+NOTIFICATION_RETRY_INTERVAL seconds, hands the workers the events that are due again: failed
+ones whose backoff has passed and any event still undelivered a whole interval after it was
+queued (left behind by a crash or another process). On SQLite, which ignores SELECT ... FOR
+UPDATE, a process delivers one batch at a time; batches of two processes still collide on the
+database lock now and then, and the retry picks those up.
+
+Set NOTIFICATIONS_ASYNC = False to deliver inline instead (the test runner does this).
+"""
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+logger = logging.getLogger(__name__)
+
+
+def outbox_path():
+    return str(getattr(settings, 'NOTIFICATION_OUTBOX_PATH', settings.BASE_DIR / 'notification_outbox.sqlite3'))
+
+
+MAX_RETRY_DELAY = 60 * 60
+
+
+def batch_size():
+    return getattr(settings, 'NOTIFICATION_BATCH_SIZE', 100)
+
+
+def retry_interval():
+    return getattr(settings, 'NOTIFICATION_RETRY_INTERVAL', 30)
+
+
+def key_retention():
+    # seconds deliver() remembers an event key (DeliveredEvent), an older event can't be replayed safely
+    return getattr(settings, 'NOTIFICATION_RETENTION_DAYS', 30) * 86400
+
+
+class Outbox:
+    """Durable list of notification events, one row per event, delivered_at set once written."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as db:
+            db.execute(
+                """CREATE TABLE IF NOT EXISTS events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    event_key TEXT NOT NULL UNIQUE,
+                    payload TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    delivered_at REAL,
+                    retry_at REAL
+                )"""
+            )
+            columns = {row[1] for row in db.execute("PRAGMA table_info(events)")}
+            if 'retry_at' not in columns:   # an outbox file written before retries existed
+                db.execute("ALTER TABLE events ADD COLUMN retry_at REAL")
+            db.execute("CREATE INDEX IF NOT EXISTS events_pending ON events (delivered_at, id)")
+
+    def _connect(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def add(self, event):
+        db = self._connect()
+        cursor = db.execute(
+            "INSERT OR IGNORE INTO events (event_key, payload, created_at) VALUES (?, ?, ?)",
+            (event['key'], json.dumps(event), time.time()),
+        )
+        return cursor.lastrowid if cursor.rowcount else None
+
+    def pending(self, limit, after_id=0):
+        rows = self._connect().execute(
+            "SELECT id, payload FROM events WHERE delivered_at IS NULL AND id > ? ORDER BY id LIMIT ?",
+            (after_id, limit),
+        ).fetchall()
+        return [(row_id, json.loads(payload)) for row_id, payload in rows]
+
+    def fetch(self, ids):
+        if not ids:
+            return []
+        marks = ','.join('?' * len(ids))
+        rows = self._connect().execute(
+            f"SELECT id, payload FROM events WHERE delivered_at IS NULL AND id IN ({marks}) ORDER BY id",
+            list(ids),
+        ).fetchall()
+        return [(row_id, json.loads(payload)) for row_id, payload in rows]
+
+    def mark_delivered(self, ids):
+        marks = ','.join('?' * len(ids))
+        self._connect().execute(f"UPDATE events SET delivered_at = ? WHERE id IN ({marks})", [time.time(), *ids])
+
+    def mark_failed(self, ids, error):
+        # retry after interval * 2^attempts, MAX_RETRY_DELAY at most
+        marks = ','.join('?' * len(ids))
+        self._connect().execute(
+            f"UPDATE events SET attempts = attempts + 1, last_error = ?, "
+            f"retry_at = ? + MIN(?, ? * (1 << MIN(attempts, 20))) WHERE id IN ({marks})",
+            [str(error)[:500], time.time(), MAX_RETRY_DELAY, retry_interval(), *ids],
+        )
+
+    def claim_due(self, limit, now=None):
+        """
+        Ids of undelivered events to hand to the workers again: failed ones whose backoff has
+        passed, and never attempted ones queued over an interval ago. Each is leased for another
+        interval so the next sweep doesn't queue it twice.
+        """
+        now = time.time() if now is None else now
+        db = self._connect()
+        ids = [row[0] for row in db.execute(
+            "SELECT id FROM events WHERE delivered_at IS NULL AND COALESCE(retry_at, created_at + ?) <= ? ORDER BY id LIMIT ?",
+            (retry_interval(), now, limit),
+        )]
+        if ids:
+            marks = ','.join('?' * len(ids))
+            db.execute(f"UPDATE events SET retry_at = ? WHERE id IN ({marks})", [now + retry_interval(), *ids])
+        return ids
+
+    def requeue(self, since=None):
+        # make delivered events pending again, safe because delivery is idempotent
+        since = 0 if since is None else since
+        return self._connect().execute(
+            "UPDATE events SET delivered_at = NULL WHERE delivered_at IS NOT NULL AND created_at >= ?", (since,)
+        ).rowcount
+
+    def purge(self, older_than):
+        return self._connect().execute(
+            "DELETE FROM events WHERE delivered_at IS NOT NULL AND delivered_at < ?", (older_than,)
+        ).rowcount
+
+    def stats(self):
+        pending, failing = self._connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(attempts > 0), 0) FROM events WHERE delivered_at IS NULL"
+        ).fetchone()
+        delivered = self._connect().execute("SELECT COUNT(*) FROM events WHERE delivered_at IS NOT NULL").fetchone()[0]
+        return {'pending': pending, 'failing': failing, 'delivered': delivered}
+
+
+_outbox = None
+_outbox_lock = threading.Lock()
+
+
+def get_outbox():
+    global _outbox
+    with _outbox_lock:
+        if _outbox is None or _outbox.path != outbox_path():
+            _outbox = Outbox(outbox_path())
+        return _outbox
+
+
+_deliver_lock = threading.Lock()
+
+
+def replay(since=None):
+    """
+    Make events queued after `since` (a timestamp) pending again, returns (requeued, since). The
+    window is clamped to the key retention: past it deliver() no longer knows the event was
+    applied and would write it a second time.
+    """
+    oldest = time.time() - key_retention()
+    since = oldest if since is None else max(since, oldest)
+    return get_outbox().requeue(since), since
+
+
+def purge_delivered():
+    """Drop delivered events as old as the keys run_retention() forgets, returns how many."""
+    return get_outbox().purge(time.time() - key_retention())
+
+
+def deliver_rows(rows):
+    """Write one batch of outbox rows, returns how many were handled."""
+    from .notifications import deliver
+
+    if not rows:
+        return 0
+    ids = [row_id for row_id, _ in rows]
+    # deliver() locks the recipients' rows, which SQLite ignores: there a process writes one batch at
+    # a time instead of letting its workers fail each other with "database is locked"
+    lock = _deliver_lock if connection.vendor == 'sqlite' else nullcontext()
+    try:
+        with lock:
+            deliver([event for _, event in rows])
+    except Exception as error:
+        logger.exception("notification delivery failed for %d events", len(ids))
+        get_outbox().mark_failed(ids, error)
+        return 0
+    get_outbox().mark_delivered(ids)
+    return len(ids)
+
+
+def drain(limit=None):
+    """Deliver every pending event in the outbox from the calling thread (used by the management command)."""
+    delivered = 0
+    after_id = 0
+    while limit is None or delivered < limit:
+        rows = get_outbox().pending(batch_size(), after_id)
+        if not rows:
+            break
+        after_id = rows[-1][0]
+        delivered += deliver_rows(rows)
+    return delivered
+
+
+class WorkerPool:
+    """Threads that wait for outbox ids on an in-memory queue and deliver them in batches, plus the retry sweeper."""
+
+    def __init__(self, workers, linger=0.05):
+        self.queue = queue.Queue()
+        self.linger = linger
+        self.threads = [
+            threading.Thread(target=self._run, name=f'notification-worker-{i}', daemon=True)
+            for i in range(workers)
+        ]
+        self.threads.append(threading.Thread(target=self._sweep, name='notification-sweeper', daemon=True))
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, row_id):
+        self.queue.put(row_id)
+
+    def _next_batch(self):
+        ids = [self.queue.get()]
+        deadline = time.monotonic() + self.linger
+        while len(ids) < batch_size():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                ids.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return ids
+
+    def _run(self):
+        while True:
+            ids = self._next_batch()
+            try:
+                close_old_connections()
+                deliver_rows(get_outbox().fetch(ids))
+            except Exception:
+                logger.exception("notification worker crashed on a batch, the events stay pending in the outbox")
+            finally:
+                close_old_connections()
+                for _ in ids:
+                    self.queue.task_done()
+
+    def _sweep(self):
+        while True:
+            try:
+                for row_id in get_outbox().claim_due(10_000):
+                    self.submit(row_id)
+            except Exception:
+                logger.exception("notification sweeper failed, trying again in %ss", retry_interval())
+            time.sleep(retry_interval())
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # the sweeper's first pass picks up whatever a previous process left behind
+            _pool = WorkerPool(getattr(settings, 'NOTIFICATION_WORKERS', 2))
+        return _pool
+
+
+def enqueue(event):
+    if not getattr(settings, 'NOTIFICATIONS_ASYNC', True):
+        from .notifications import deliver
+        deliver([event])
+        return
+
+    # the event is written once the request's transaction commits, a request that rolls back
+    # leaves nothing behind and a worker never reads a row the request hasn't committed yet
+    transaction.on_commit(lambda: _add(event))
+
+
+def _add(event):
+    row_id = get_outbox().add(event)
+    if row_id and getattr(settings, 'NOTIFICATION_WORKERS', 2):
+        get_pool().submit(row_id)
@@ -0,0 +1,288 @@
+"""
+Notification helpers.
+
+The unread count shown in the navbar on every page is kept in the cache instead of being counted
+from the Notification table on each render. notify() bumps it when a notification is created and
+mark_read() lowers it, a missing key is simply recounted the next time it is read.
+
+notify() does not write the row itself, it queues an event that notification_queue delivers in
+the background (see that module), deliver() is the batch writer the workers call. Every change
+to a user's unread count is also pushed to their open pages (tweetapp/realtime.py).
+"""
+import json
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import realtime
+from .models import DeliveredEvent, Notification, Profile, Tweet
+from .notification_queue import enqueue, purge_delivered
+from tweet.utils import decode_cursor, keyset_filter, keyset_values
+
+
+def unread_timeout():
+    return getattr(settings, 'UNREAD_NOTIFICATIONS_CACHE_TIMEOUT', 60 * 10)
+
+
+def _unread_key(profile_id):
+    return f'unread_notifications:{profile_id}'
+
+
+def unread_count(profile_id):
+    key = _unread_key(profile_id)
+    count = cache.get(key)
+    if count is None:
+        count = Notification.objects.filter(notified_user_id=profile_id, is_read=False).count()
+        cache.add(key, count, unread_timeout())
+    return count
+
+
+def _adjust_unread(profile_id, delta):
+    # only touch a counter that exists, an absent one is recounted from the table on the next read
+    try:
+        if cache.incr(_unread_key(profile_id), delta) < 0:
+            cache.delete(_unread_key(profile_id))
+    except ValueError:
+        pass
+
+
+def notify(notify_by, notified_user, notify_type, notify_tweet=None):
+    event = {
+        'key': uuid.uuid4().hex,
+        'notify_by_id': notify_by.id,
+        'notified_user_id': notified_user.id,
+        'notify_tweet_id': notify_tweet.id if notify_tweet else None,
+        'notify_type': notify_type,
+    }
+    enqueue(event)
+    return event['key']
+
+
+OPPOSITE_TYPES = {'follow': 'unfollow', 'unfollow': 'follow'}
+
+
+def coalesce_window():
+    return timedelta(seconds=getattr(settings, 'NOTIFICATION_COALESCE_WINDOW', 60 * 60))
+
+
+def _group_key(notified_user_id, notify_tweet_id, notify_type):
+    return (notified_user_id, notify_tweet_id, notify_type)
+
+
+def deliver(events):
+    """
+    Write a batch of notify() events, coalescing them into aggregate rows.
+
+    Events with the same (notified_user, notify_tweet, notify_type) as an unread row younger than
+    NOTIFICATION_COALESCE_WINDOW are folded into it ("alice and 41 others liked your tweet")
+    instead of getting a row of their own. A follow followed by an unfollow (or the other way
+    round) from the same profile inside the window cancels out.
+
+    The key of every applied event is stored in DeliveredEvent, whether it opened a row, was folded
+    into one or was dropped, so an event that is delivered twice changes nothing. The batch runs in
+    one transaction that first locks the Profile rows of its recipients (SELECT ... FOR UPDATE, in
+    id order), so two workers or processes delivering to the same user take turns instead of
+    both reading the same aggregate row. SQLite ignores FOR UPDATE: there the outbox workers of a
+    process deliver one batch at a time, and a batch that collides with another process fails on
+    its write and is retried by the outbox sweeper (see notification_queue).
+    """
+    events = {event['key']: event for event in events}
+    if not events:
+        return []
+    with transaction.atomic():
+        created, removed = _apply_events(events)
+
+    for row in created:
+        _adjust_unread(row.notified_user_id, 1)
+    for row in removed:
+        _adjust_unread(row.notified_user_id, -1)
+    realtime.publish_unread(row.notified_user_id for row in created + removed)
+    return created
+
+
+def _apply_events(events):
+    """Write {key: event} inside deliver()'s transaction, returns the (created, removed) rows."""
+    recipients = {e['notified_user_id'] for e in events.values()}
+    list(Profile.objects.select_for_update().filter(id__in=recipients).order_by('id').values_list('id', flat=True))
+
+    done = set(DeliveredEvent.objects.filter(event_key__in=events).values_list('event_key', flat=True))
+    events = [event for key, event in events.items() if key not in done]
+    if not events:
+        return [], []
+    DeliveredEvent.objects.bulk_create([DeliveredEvent(event_key=e['key']) for e in events])
+
+    # the tweet or one of the profiles may have been deleted while the event was queued
+    profiles = set(Profile.objects.filter(
+        id__in={e['notify_by_id'] for e in events} | {e['notified_user_id'] for e in events}
+    ).values_list('id', flat=True))
+    tweets = set(Tweet.objects.filter(
+        id__in={e['notify_tweet_id'] for e in events if e['notify_tweet_id']}
+    ).values_list('id', flat=True))
+    events = [
+        e for e in events
+        if e['notify_by_id'] in profiles and e['notified_user_id'] in profiles
+        and (e['notify_tweet_id'] is None or e['notify_tweet_id'] in tweets)
+    ]
+    if not events:
+        return [], []
+
+    # every open aggregate row this batch could fold into, in one query
+    types = {e['notify_type'] for e in events}
+    types |= {OPPOSITE_TYPES[t] for t in types if t in OPPOSITE_TYPES}
+    open_rows = {}
+    for row in Notification.objects.filter(
+        notified_user_id__in={e['notified_user_id'] for e in events},
+        notify_type__in=types,
+        is_read=False,
+        notify_time__gte=timezone.now() - coalesce_window(),
+    ).order_by('notify_time'):
+        open_rows[_group_key(row.notified_user_id, row.notify_tweet_id, row.notify_type)] = row
+
+    new_rows, changed, emptied = [], set(), set()
+    now = timezone.now()
+    for e in events:
+        actor = e['notify_by_id']
+        opposite = OPPOSITE_TYPES.get(e['notify_type'])
+        if opposite:
+            toggled = open_rows.get(_group_key(e['notified_user_id'], None, opposite))
+            if toggled and actor in toggled.actor_ids:
+                # follow + unfollow in quick succession, nothing changed for the notified user
+                toggled.actor_ids.remove(actor)
+                toggled.actor_count = len(toggled.actor_ids)
+                if toggled.actor_ids:
+                    toggled.notify_by_id = toggled.actor_ids[-1]
+                else:
+                    emptied.add(id(toggled))
+                changed.add(id(toggled))
+                continue
+
+        key = _group_key(e['notified_user_id'], e['notify_tweet_id'], e['notify_type'])
+        row = open_rows.get(key)
+        if row is None or id(row) in emptied:
+            row = Notification(
+                event_key=e['key'],
+                notify_by_id=actor,
+                notified_user_id=e['notified_user_id'],
+                notify_tweet_id=e['notify_tweet_id'],
+                notify_type=e['notify_type'],
+                actor_ids=[actor],
+                actor_count=1,
+            )
+            open_rows[key] = row
+            new_rows.append(row)
+        elif actor not in row.actor_ids:
+            row.actor_ids.append(actor)
+            row.actor_count = len(row.actor_ids)
+            row.notify_by_id = actor
+            row.notify_time = now
+            changed.add(id(row))
+
+    created = [row for row in new_rows if id(row) not in emptied]
+    existing = [row for row in open_rows.values() if row.pk and id(row) in changed]
+    removed = [row for row in existing if id(row) in emptied]
+    updated = [row for row in existing if id(row) not in emptied]
+
+    if created:
+        Notification.objects.bulk_create(created)
+    if updated:
+        Notification.objects.bulk_update(updated, ['actor_ids', 'actor_count', 'notify_by', 'notify_time'])
+    if removed:
+        Notification.objects.filter(id__in=[row.pk for row in removed]).delete()
+    return created, removed
+
+
+def mark_read(profile, notification_id):
+    updated = Notification.objects.filter(id=notification_id, notified_user=profile, is_read=False).update(is_read=True)
+    if updated:
+        _adjust_unread(profile.id, -updated)
+        realtime.publish_unread([profile.id])
+    return updated
+
+
+def mark_all_read(profile, up_to=None):
+    """
+    Mark the unread notifications of `profile` as read with one UPDATE.
+
+    `up_to` is a cursor (tweet.utils.encode_cursor of notify_time, id) of the newest notification
+    the user has seen, rows that arrived or were coalesced after it stay unread.
+    """
+    unread = Notification.objects.filter(notified_user=profile, is_read=False)
+    values = keyset_values(unread, ('-notify_time', '-id'), decode_cursor(up_to))
+    if values:
+        # everything older than the newest seen row, plus that row itself
+        older = keyset_filter(unread, ('-notify_time', '-id'), values)
+        unread = unread.filter(older | Q(id=values[1], notify_time=values[0]))
+    updated = unread.update(is_read=True)
+
+    if up_to:
+        cache.delete(_unread_key(profile.id))
+    else:
+        cache.set(_unread_key(profile.id), 0, unread_timeout())
+    realtime.publish_unread([profile.id])   # the bell in the user's other tabs
+    return updated
+
+
+def purge_read(older_than_days, batch_size=1000, archive=None):
+    """
+    Delete read notifications older than `older_than_days` in batches of `batch_size` rows.
+
+    Each batch selects ids off the primary key and deletes them in its own short transaction, so
+    the table is never locked for long. When `archive` (a text file) is given the rows are written
+    to it as JSON lines first. Yields the number of rows removed per batch.
+    """
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    last_id = 0
+    while True:
+        ids = list(
+            Notification.objects.filter(is_read=True, notify_time__lt=cutoff, id__gt=last_id)
+            .order_by('id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return
+        last_id = ids[-1]
+        with transaction.atomic():
+            if archive is not None:
+                for row in Notification.objects.filter(id__in=ids).values():
+                    archive.write(json.dumps(row, cls=DjangoJSONEncoder) + '\n')
+            deleted, _ = Notification.objects.filter(id__in=ids).delete()
+        yield deleted
+
+
+def purge_delivered_keys(older_than_days):
+    """Forget the keys of events delivered more than `older_than_days` ago (keep them as long as the outbox keeps events)."""
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    return DeliveredEvent.objects.filter(delivered_at__lt=cutoff).delete()[0]
+
+
+def run_retention():
+    # scheduler hook, see TweetappConfig.ready
+    days = getattr(settings, 'NOTIFICATION_RETENTION_DAYS', 30)
+    # outbox rows go with their keys, a row whose key is gone could otherwise be replayed twice
+    purge_delivered()
+    purge_delivered_keys(days)
+    return sum(purge_read(days))
+
+
+def attach_recent_actors(notifications, sample_size=3):
+    """Set notification.recent_actors (latest first) and .more_actors for a page, with one profile query."""
+    wanted = {actor for n in notifications for actor in n.actor_ids[-sample_size:]}
+    actors = Profile.objects.select_related('user').in_bulk(wanted)
+    for n in notifications:
+        n.recent_actors = [actors[actor] for actor in reversed(n.actor_ids[-sample_size:]) if actor in actors] or [n.notify_by]
+        n.more_actors = max(n.actor_count - len(n.recent_actors), 0)
+    return notifications
+
+
+def latest_unread(profile_id, limit=4):
+    return list(
+        Notification.objects.filter(notified_user_id=profile_id, is_read=False)
+        .order_by('-notify_time')
+        .values()[:limit]
+    )
@@ -0,0 +1,202 @@
+"""
+Live updates pushed to open pages over Server-Sent Events (GET /live/, see views.live_events).
+
+Each open page holds one EventSource connection, and the connection holds a Subscription in the
+process-wide `hub`. Publishing is a plain function call from any thread: the views (likes, new
+tweets) and the notification workers. The event is handed over to the connection's event loop
+with call_soon_threadsafe, so nothing waits on a slow client. The events are:
+
+- `notifications` {unread}: sent to the notified user when a notification is created or removed
+- `likes` {tweet, count}: sent to the connections whose page shows that tweet. The page passes its
+  tweet ids when it opens the stream (/live/?tweets=1,2,3, at most LIVE_MAX_TWEETS) and reopens
+  it when "Load more" adds cards
+- `tweet` {id, author}: sent to the followers of the author who are connected
+
+Backpressure is applied per connection. Events wait in a small ordered dict keyed by what they
+describe, so ten likes on one tweet while a client is busy still leave one `likes` event. A client
+that falls more than LIVE_EVENT_BUFFER events behind has its backlog dropped and gets a single
+`resync` event instead. The page then offers a reload. Memory per connection stays bounded and
+one stalled reader never slows the others.
+
+The hub lives in process memory, so an event only reaches connections held by the process that
+published it. Run the ASGI app (tweet/asgi.py, e.g. `uvicorn tweet.asgi:application`) as a
+single worker, or route /live/ and the posting views to the same one. Under WSGI (runserver)
+/live/ answers 204, which tells EventSource not to reconnect, and the pages behave as before.
+"""
+import asyncio
+import itertools
+import json
+import threading
+
+from django.conf import settings
+
+
+def buffer_limit():
+    return getattr(settings, 'LIVE_EVENT_BUFFER', 100)
+
+
+def keepalive_interval():
+    return getattr(settings, 'LIVE_KEEPALIVE', 20)
+
+
+def max_tweets():
+    return getattr(settings, 'LIVE_MAX_TWEETS', 200)
+
+
+def parse_tweet_ids(value):
+    """The tweet ids of ?tweets=1,2,3, junk skipped and capped at LIVE_MAX_TWEETS."""
+    ids = set()
+    for part in (value or '').split(','):
+        if len(ids) >= max_tweets():
+            break
+        if part.strip().isdigit():
+            ids.add(int(part))
+    return frozenset(ids)
+
+
+class Subscription:
+    """One open connection. offer() and next_batch() both run on the connection's event loop."""
+
+    _unique = itertools.count()
+
+    def __init__(self, profile_id, loop, limit, tweet_ids=frozenset()):
+        self.profile_id = profile_id
+        self.tweet_ids = tweet_ids   # the tweets on the page, the only ones it gets likes for
+        self.loop = loop
+        self.limit = limit
+        self.pending = {}   # key -> event, insertion ordered, a newer event for the same key replaces the queued one
+        self.overflowed = False
+        self.wakeup = asyncio.Event()
+
+    def offer(self, key, event):
+        if key is None:
+            key = next(self._unique)
+        self.pending.pop(key, None)
+        self.pending[key] = event
+        if len(self.pending) > self.limit:
+            self.pending.clear()   # too far behind, drop the backlog and let the page resync
+            self.overflowed = True
+        self.wakeup.set()
+
+    async def next_batch(self, timeout):
+        """The queued events, oldest first. An empty list when nothing arrived within timeout seconds."""
+        try:
+            await asyncio.wait_for(self.wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        self.wakeup.clear()
+        if self.overflowed:
+            self.overflowed = False
+            return [{'type': 'resync'}]
+        events = list(self.pending.values())
+        self.pending.clear()
+        return events
+
+
+class Hub:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = {}   # profile id -> set of Subscription
+        self._watchers = {}   # tweet id -> set of Subscription showing it
+
+    def subscribe(self, profile_id, loop=None, limit=None, tweet_ids=frozenset()):
+        subscription = Subscription(profile_id, loop or asyncio.get_running_loop(), limit or buffer_limit(), tweet_ids)
+        with self._lock:
+            self._subscriptions.setdefault(profile_id, set()).add(subscription)
+            for tweet_id in tweet_ids:
+                self._watchers.setdefault(tweet_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.profile_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.profile_id]
+            for tweet_id in subscription.tweet_ids:
+                watchers = self._watchers.get(tweet_id)
+                if watchers is not None:
+                    watchers.discard(subscription)
+                    if not watchers:
+                        del self._watchers[tweet_id]
+
+    def connected(self):
+        """Profile ids with at least one open connection."""
+        with self._lock:
+            return set(self._subscriptions)
+
+    def watched(self, tweet_id):
+        """Whether a connected page shows tweet_id."""
+        with self._lock:
+            return tweet_id in self._watchers
+
+    def publish(self, profile_ids, event, key=None):
+        """Queue event for the given profiles' connections, or for every connection when profile_ids is None."""
+        with self._lock:
+            if profile_ids is None:
+                targets = [sub for subs in self._subscriptions.values() for sub in subs]
+            else:
+                targets = [sub for profile_id in profile_ids for sub in self._subscriptions.get(profile_id, ())]
+        self._deliver(targets, event, key)
+
+    def publish_watchers(self, tweet_id, event, key=None):
+        """Queue event for the connections whose page shows tweet_id."""
+        with self._lock:
+            targets = list(self._watchers.get(tweet_id, ()))
+        self._deliver(targets, event, key)
+
+    def _deliver(self, targets, event, key):
+        for subscription in targets:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, key, event)
+            except RuntimeError:
+                pass   # the loop shut down under a connection that never got to unsubscribe
+
+
+hub = Hub()
+
+
+def encode(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+async def event_stream(profile_id, initial=(), tweet_ids=frozenset()):
+    """The text/event-stream body for one connection, it ends when the client goes away."""
+    subscription = hub.subscribe(profile_id, tweet_ids=tweet_ids)
+    try:
+        yield 'retry: 5000\n\n' + ''.join(encode(event) for event in initial)
+        while True:
+            events = await subscription.next_batch(keepalive_interval())
+            # a comment line keeps proxies from timing the idle connection out
+            yield ''.join(encode(event) for event in events) if events else ': keepalive\n\n'
+    finally:
+        hub.unsubscribe(subscription)
+
+
+def publish_unread(profile_ids):
+    from .notifications import unread_count
+
+    for profile_id in set(profile_ids) & hub.connected():
+        hub.publish([profile_id], {'type': 'notifications', 'unread': unread_count(profile_id)}, key='notifications')
+
+
+def publish_likes(tweet_id, count=None):
+    from .models import Tweet
+
+    if not hub.watched(tweet_id):
+        return   # on nobody's page, not even worth the count query
+    if count is None:
+        count = Tweet.objects.filter(id=tweet_id).values_list('likes_count', flat=True).first()
+    if count is not None:
+        hub.publish_watchers(tweet_id, {'type': 'likes', 'tweet': tweet_id, 'count': count}, key=('likes', tweet_id))
+
+
+def publish_tweet(tweet):
+    connected = hub.connected()
+    if not connected:
+        return
+    author = tweet.user.profile
+    followers = author.followed_by.filter(id__in=connected).values_list('id', flat=True)
+    hub.publish(list(followers), {'type': 'tweet', 'id': tweet.id, 'author': tweet.user.username})
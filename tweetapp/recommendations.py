@@ -0,0 +1,152 @@
+"""
+"Who to follow" suggestions for the profile list page, from friends of friends.
+
+A candidate is a profile followed by the profiles the reader follows, but not by the reader. It
+scores one point per such mutual connection, plus RECOMMENDATION_ACTIVITY_WEIGHT * log(1 + tweets
+posted in the last RECOMMENDATION_ACTIVITY_DAYS), so a busy account beats a dormant one with the
+same mutuals. Readers with too few candidates (new accounts) are topped up with the most active
+authors.
+
+rebuild() is the batch job (scheduler or the build_recommendations command). It reads the whole
+follow graph in one streamed pass over the through table into sorted array('q') per profile. The
+friends-of-friends counts come from Counter.update over those arrays, which counts in C. Only the
+top RECOMMENDATION_SIZE per profile are kept (heapq.nlargest) and written to the Recommendation
+table. The page reads K rows off recommendation_rank_idx whatever the size of the graph. A profile
+the job hasn't reached yet (just signed up) gets its list computed on the spot from the cached
+graph (tweetapp/graph.py), and that list is stored the same way.
+"""
+import heapq
+import math
+from array import array
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from . import graph
+from .models import Profile, Recommendation, Tweet
+
+
+def size():
+    return getattr(settings, 'RECOMMENDATION_SIZE', 20)
+
+
+def activity_window():
+    return timedelta(days=getattr(settings, 'RECOMMENDATION_ACTIVITY_DAYS', 7))
+
+
+def activity_weight():
+    return getattr(settings, 'RECOMMENDATION_ACTIVITY_WEIGHT', 0.5)
+
+
+def refresh_interval():
+    return getattr(settings, 'RECOMMENDATION_REFRESH', 6 * 60 * 60)
+
+
+def load_graph():
+    """{profile_id: sorted array('q') of the ids it follows} for every profile, one streamed query."""
+    following = {profile_id: array('q') for profile_id in Profile.objects.values_list('id', flat=True)}
+    edges = graph.Follows.objects.order_by('from_profile_id', 'to_profile_id').values_list('from_profile_id', 'to_profile_id')
+    for follower_id, followed_id in edges.iterator(chunk_size=5000):
+        following.setdefault(follower_id, array('q')).append(followed_id)
+    return following
+
+
+def recent_activity():
+    """{profile_id: tweets in the activity window}, profiles that posted nothing are left out."""
+    tweets = Tweet.objects.filter(created_at__gte=timezone.now() - activity_window())
+    return dict(tweets.values('user__profile__id').annotate(n=Count('id')).values_list('user__profile__id', 'n').order_by())
+
+
+def most_active(activity, limit):
+    return heapq.nlargest(limit, activity, key=activity.get)
+
+
+def rank_candidates(profile_id, following, friends_following, activity, fallback=()):
+    """
+    [(score, mutuals, candidate_id)], best first, at most RECOMMENDATION_SIZE of them.
+
+    following is what profile_id follows, friends_following maps each of those to what they follow.
+    """
+    followed = set(following)
+    followed.add(profile_id)
+    mutuals = Counter()
+    for friend_id in following:
+        if friend_id != profile_id:
+            mutuals.update(friends_following.get(friend_id, ()))
+
+    weight = activity_weight()
+    top = heapq.nlargest(size(), (
+        (count + weight * math.log1p(activity.get(candidate_id, 0)), count, candidate_id)
+        for candidate_id, count in mutuals.items() if candidate_id not in followed
+    ))
+    if len(top) < size():
+        picked = {candidate_id for _, _, candidate_id in top}
+        for candidate_id in fallback:
+            if len(top) >= size():
+                break
+            if candidate_id not in followed and candidate_id not in picked:
+                top.append((weight * math.log1p(activity.get(candidate_id, 0)), 0, candidate_id))
+    return top
+
+
+def _rows(profile_id, ranked, now):
+    return [
+        Recommendation(profile_id=profile_id, candidate_id=candidate_id, rank=rank, score=score, mutuals=mutuals, computed_at=now)
+        for rank, (score, mutuals, candidate_id) in enumerate(ranked)
+    ]
+
+
+def _store(profile_ids, rows):
+    # one transaction per chunk, a reader sees either the old list or the new one
+    with transaction.atomic():
+        Recommendation.objects.filter(profile_id__in=profile_ids).delete()
+        Recommendation.objects.bulk_create(rows, batch_size=500)
+
+
+def rebuild(batch_size=500):
+    """Recompute the suggestions of every profile. Returns (profiles, rows written)."""
+    following = load_graph()
+    activity = recent_activity()
+    fallback = most_active(activity, size() * 2)
+    now = timezone.now()
+
+    profile_ids = sorted(following)
+    written = 0
+    for start in range(0, len(profile_ids), batch_size):
+        chunk = profile_ids[start:start + batch_size]
+        rows = []
+        for profile_id in chunk:
+            rows += _rows(profile_id, rank_candidates(profile_id, following[profile_id], following, activity, fallback), now)
+        _store(chunk, rows)
+        written += len(rows)
+    return len(profile_ids), written
+
+
+def refresh_profile(profile_id):
+    """Recompute the suggestions of one profile from the cached graph."""
+    following = graph.following_ids(profile_id)
+    friends_following = graph.following_map([friend_id for friend_id in following if friend_id != profile_id])
+    activity = recent_activity()
+    fallback = most_active(activity, size() * 2)
+    _store([profile_id], _rows(profile_id, rank_candidates(profile_id, following, friends_following, activity, fallback), timezone.now()))
+
+
+def _computed_key(profile_id):
+    return f'recommendations_computed:{profile_id}'
+
+
+def for_profile(profile_id):
+    """The stored suggestions of profile_id with candidate__user loaded, minus whoever it followed since."""
+    suggestions = Recommendation.objects.filter(profile_id=profile_id).select_related('candidate__user').order_by('rank')
+    rows = list(suggestions[:size()])
+    # nothing stored yet, compute once; an empty list stays empty until the next rebuild
+    if not rows and cache.add(_computed_key(profile_id), True, refresh_interval()):
+        refresh_profile(profile_id)
+        rows = list(suggestions[:size()])
+    following = graph.following_ids(profile_id)
+    return [row for row in rows if not graph.contains(following, row.candidate_id)]
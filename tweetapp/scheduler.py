@@ -0,0 +1,52 @@
+"""
+Tiny in-process scheduler for periodic housekeeping (notification retention and similar jobs).
+
+Jobs are registered from TweetappConfig.ready() and run on one daemon thread, only when
+SCHEDULER_ENABLED is on, so management commands, migrations and tests never start it. With
+several web processes enable it in one of them, or run the matching management commands from cron.
+"""
+import logging
+import threading
+import time
+
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+_jobs = {}
+_lock = threading.Lock()
+_thread = None
+
+
+def register(name, interval, func):
+    with _lock:
+        _jobs[name] = {'interval': interval, 'func': func, 'next_run': time.monotonic() + interval}
+
+
+def run_pending():
+    now = time.monotonic()
+    with _lock:
+        due = [(name, job) for name, job in _jobs.items() if job['next_run'] <= now]
+        for _, job in due:
+            job['next_run'] = now + job['interval']
+    for name, job in due:
+        try:
+            job['func']()
+        except Exception:
+            logger.exception("scheduled job %s failed", name)
+        finally:
+            close_old_connections()
+
+
+def _loop(tick):
+    while True:
+        time.sleep(tick)
+        run_pending()
+
+
+def start(tick=1.0):
+    global _thread
+    with _lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_loop, args=(tick,), name='tweetapp-scheduler', daemon=True)
+            _thread.start()
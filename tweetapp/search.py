@@ -0,0 +1,202 @@
+"""
+Full-text search over tweets.
+
+Each tweet is one row of the tweetapp_tweet_search FTS5 table (rowid = tweet id) holding its
+title and body, and each comment is one row of tweetapp_comment_search (rowid = comment id)
+carrying the id of its tweet. A new comment is one small INSERT, the tweet's own row and its other
+comments are never rewritten. Rows are written by the signals at the bottom of this module in the
+same transaction as the tweet or comment itself; rebuild_search_index refills both tables.
+
+A tweet matches when every word of the query appears in its title, body or any of its comments,
+so a hit on a comment finds the tweet it belongs to. Results are ordered by BM25 (title hits
+weigh more than body hits, body more than comments; a tweet's best matching comment counts) and
+paged with a (score, id) keyset cursor. On a database without FTS5 search falls back to a LIKE
+scan ordered by date.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from tweet.utils import decode_cursor, encode_cursor, paginate_queryset
+from .models import Tweet, TweetComment
+
+TABLE = 'tweetapp_tweet_search'
+COMMENT_TABLE = 'tweetapp_comment_search'
+COLUMN_WEIGHTS = (10.0, 4.0, 1.0)   # tweet_title, body, comments
+TERM = re.compile(r'\w+', re.UNICODE)
+
+
+def available():
+    return connection.vendor == 'sqlite'
+
+
+def match_phrases(query):
+    """User input as FTS5 phrases, one per word, the last one may be a prefix."""
+    terms = TERM.findall(query.lower())
+    if not terms:
+        return []
+    phrases = ['"%s"' % term for term in terms]
+    phrases[-1] += '*'   # still typing the last word
+    return phrases
+
+
+def write_tweets(cursor, documents):
+    # (tweet_id, title, body)
+    cursor.executemany(f"INSERT OR REPLACE INTO {TABLE} (rowid, tweet_title, body) VALUES (%s, %s, %s)", documents)
+
+
+def write_comments(cursor, documents):
+    # (comment_id, description, tweet_id)
+    cursor.executemany(
+        f"INSERT OR REPLACE INTO {COMMENT_TABLE} (rowid, description, tweet_id) VALUES (%s, %s, %s)", documents,
+    )
+
+
+def index_tweet(tweet_id):
+    if not available():
+        return
+    tweet = Tweet.objects.filter(id=tweet_id).values_list('tweet_title', 'body').first()
+    with connection.cursor() as cursor:
+        if tweet is None:
+            cursor.execute(f"DELETE FROM {TABLE} WHERE rowid = %s", [tweet_id])
+            return
+        write_tweets(cursor, [(tweet_id, tweet[0] or '', tweet[1] or '')])
+
+
+def unindex_tweet(tweet_id):
+    if available():
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {TABLE} WHERE rowid = %s", [tweet_id])
+
+
+def reindex(chunk_size=1000):
+    """
+    Rebuild both tables, streaming tweets and then comments in chunks so neither table is ever
+    held in memory. Yields the running total of rows written.
+    """
+    tweets = Tweet.objects.order_by('id').values_list('id', 'tweet_title', 'body').iterator(chunk_size=chunk_size)
+    comments = TweetComment.objects.order_by('id').values_list('id', 'description', 'tweet_id').iterator(chunk_size=chunk_size)
+    total = 0
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE}")
+        cursor.execute(f"DELETE FROM {COMMENT_TABLE}")
+        for rows, write in (
+            (((tweet_id, title or '', body or '') for tweet_id, title, body in tweets), write_tweets),
+            (((comment_id, text or '', tweet_id) for comment_id, text, tweet_id in comments), write_comments),
+        ):
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= chunk_size:
+                    write(cursor, batch)
+                    total += len(batch)
+                    batch = []
+                    yield total
+            if batch:
+                write(cursor, batch)
+                total += len(batch)
+                yield total
+
+
+def _matching_sql(phrases):
+    """SQL and params of (tweet id, score) for every tweet that has each phrase somewhere."""
+    covers = ' INTERSECT '.join(
+        f"SELECT id FROM (SELECT rowid AS id FROM {TABLE} WHERE {TABLE} MATCH %s"
+        f" UNION SELECT tweet_id FROM {COMMENT_TABLE} WHERE {COMMENT_TABLE} MATCH %s)"
+        for _ in phrases
+    )
+    covers_params = [phrase for phrase in phrases for _ in range(2)]
+
+    # any word scores, the intersection above makes sure all of them appear. The FTS queries are
+    # materialised: bm25() can't be called from a subquery SQLite flattens into a GROUP BY
+    expression = ' OR '.join(phrases)
+    title_weight, body_weight, comment_weight = COLUMN_WEIGHTS
+    sql = (
+        f"WITH tweet_hits AS MATERIALIZED ("
+        f"SELECT rowid AS id, bm25({TABLE}, {title_weight}, {body_weight}) AS score FROM {TABLE} WHERE {TABLE} MATCH %s"
+        f"), comment_hits AS MATERIALIZED ("
+        f"SELECT tweet_id AS id, bm25({COMMENT_TABLE}, {comment_weight}, 0.0) AS score FROM {COMMENT_TABLE} WHERE {COMMENT_TABLE} MATCH %s"
+        f") SELECT id, SUM(score) AS score FROM ("
+        f"SELECT id, score FROM tweet_hits UNION ALL SELECT id, MIN(score) FROM comment_hits GROUP BY id"
+        f") WHERE id IN ({covers}) GROUP BY id"
+    )
+    return sql, [expression, expression, *covers_params]
+
+
+def search_tweets(query, cursor=None, per_page=None):
+    """
+    One page of tweets matching `query`, best match first.
+    Returns the same dict as tweet.utils.paginate_queryset, results are Tweet ids.
+    """
+    per_page = per_page or settings.TIMELINE_PAGE_SIZE
+    phrases = match_phrases(query)
+    if not phrases:
+        return {'results': [], 'per_page': per_page, 'has_next': False, 'next_cursor': None}
+
+    if not available():
+        terms = TERM.findall(query)
+        condition = Q()
+        for term in terms:
+            condition &= Q(tweet_title__icontains=term) | Q(body__icontains=term) | Q(comments__description__icontains=term)
+        page = paginate_queryset(Tweet.objects.filter(condition).distinct().only('id', 'created_at'), cursor, per_page)
+        page['results'] = [tweet.id for tweet in page['results']]
+        return page
+
+    sql, params = _matching_sql(phrases)
+    sql = f"SELECT id, score FROM ({sql})"
+    after = decode_cursor(cursor)
+    try:
+        after = [float(after[0]), int(after[1])] if after and len(after) == 2 else None
+    except (TypeError, ValueError):
+        after = None   # tampered token, start over
+    if after and abs(after[1]) < 2 ** 63:
+        # bm25 is lower for better matches, so the next page continues upwards from the last score
+        sql += " WHERE score > %s OR (score = %s AND id > %s)"
+        params += [after[0], after[0], after[1]]
+    sql += " ORDER BY score, id LIMIT %s"
+    params.append(per_page + 1)
+
+    with connection.cursor() as db:
+        db.execute(sql, params)
+        rows = db.fetchall()
+
+    has_next = len(rows) > per_page
+    rows = rows[:per_page]
+    return {
+        'results': [tweet_id for tweet_id, _ in rows],
+        'per_page': per_page,
+        'has_next': has_next,
+        'next_cursor': encode_cursor([rows[-1][1], rows[-1][0]]) if has_next else None,
+    }
+
+
+@receiver(post_save, sender=Tweet)
+def index_saved_tweet(sender, instance, **kwargs):
+    if available():
+        with connection.cursor() as cursor:
+            write_tweets(cursor, [(instance.id, instance.tweet_title or '', instance.body or '')])
+
+
+@receiver(post_delete, sender=Tweet)
+def unindex_deleted_tweet(sender, instance, **kwargs):
+    # its comments are deleted one by one before it, each through unindex_deleted_comment
+    unindex_tweet(instance.id)
+
+
+@receiver(post_save, sender=TweetComment)
+def index_saved_comment(sender, instance, **kwargs):
+    if available():
+        with connection.cursor() as cursor:
+            write_comments(cursor, [(instance.id, instance.description or '', instance.tweet_id)])
+
+
+@receiver(post_delete, sender=TweetComment)
+def unindex_deleted_comment(sender, instance, **kwargs):
+    if available():
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {COMMENT_TABLE} WHERE rowid = %s", [instance.id])
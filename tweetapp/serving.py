@@ -0,0 +1,152 @@
+"""
+Static and media files served with the headers a browser or CDN needs to cache them properly.
+
+- Names that change whenever the content does (the hashed names `build_assets` collects, the
+  content-addressed media blobs) are sent with `Cache-Control: public, max-age=<1 year>, immutable`.
+  Everything else gets a short max-age and revalidates.
+- ETag and Last-Modified come from the file's mtime and size, and If-None-Match / If-Modified-Since
+  answer with 304 and no body.
+- A single `Range: bytes=...` request is answered with 206 (416 when it is out of bounds), so
+  media players and resumed downloads can fetch part of a file.
+- When the client accepts br or gzip and a .br/.gz sibling was written by `build_assets`, that
+  file is sent instead with Content-Encoding and `Vary: Accept-Encoding`. Nothing is compressed
+  while the request waits.
+
+Django's own static() view is only meant for development and sends none of this, so tweet/urls.py
+routes MEDIA_URL here, and STATIC_URL too when SERVE_STATIC is on (no web server in front).
+"""
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+HASHED_STATIC = re.compile(r'\.[0-9a-f]{12}\.\w+$')   # the names ManifestStaticFilesStorage writes
+BLOB_MEDIA = re.compile(r'(^|/)([0-9a-f]{2})/\2[0-9a-f]{62}\.\w+$')   # ContentAddressedStorage, see storage.blob_name
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def _accepts(request, encoding):
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, _, params = item.partition(';')
+        if coding.strip().lower() == encoding:
+            q = params.strip().removeprefix('q=')
+            try:
+                return not q or float(q) > 0
+            except ValueError:
+                return False
+    return False
+
+
+def _not_modified(request, etag, mtime):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+        return '*' in tags or etag in tags
+    since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return since is not None and int(mtime) <= since
+
+
+def _byte_range(request, size, etag, mtime):
+    """(start, end) inclusive for a satisfiable single range, None to send the whole file, False for 416."""
+    header = request.META.get('HTTP_RANGE', '')
+    match = RANGE.match(header.replace(' ', ''))
+    if not match or not (match[1] or match[2]):
+        return None   # absent, multipart or malformed ranges are ignored, RFC 9110 allows a full 200
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range and if_range != etag and parse_http_date_safe(if_range) != int(mtime):
+        return None   # the client's copy is stale, it needs the whole new file
+    if not match[1]:
+        start, end = max(size - int(match[2]), 0), size - 1   # bytes=-N, the last N bytes
+    else:
+        start = int(match[1])
+        end = min(int(match[2]), size - 1) if match[2] else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                return
+            length -= len(chunk)
+            yield chunk
+
+
+def serve_file(request, path, document_root, cache_control):
+    if any(part.startswith('.') for part in path.split('/')):
+        raise Http404   # dotfiles, including ContentAddressedStorage's in-flight .upload-* temp files
+    try:
+        fullpath = safe_join(document_root, path)
+    except ValueError:
+        raise Http404
+    if not os.path.isfile(fullpath):
+        raise Http404
+
+    content_type = mimetypes.guess_type(fullpath)[0] or 'application/octet-stream'
+    encoding, serve_path = None, fullpath
+    siblings = [(name, fullpath + ext) for name, ext in ENCODINGS if os.path.isfile(fullpath + ext)]
+    for name, sibling in siblings:
+        if _accepts(request, name):
+            encoding, serve_path = name, sibling
+            break
+
+    stat = os.stat(serve_path)
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}{"-" + encoding if encoding else ""}"'
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(stat.st_mtime),
+        'Cache-Control': cache_control,
+    }
+    if siblings:
+        headers['Vary'] = 'Accept-Encoding'
+
+    if _not_modified(request, etag, stat.st_mtime):
+        response = HttpResponseNotModified()
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+    byte_range = _byte_range(request, stat.st_size, etag, stat.st_mtime) if not encoding else None
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{stat.st_size}'
+    elif byte_range:
+        start, end = byte_range
+        response = FileResponse(_read_range(serve_path, start, end - start + 1), status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+        response['Content-Length'] = end - start + 1
+    else:
+        # filename of the original, not of the .gz/.br sibling
+        response = FileResponse(open(serve_path, 'rb'), content_type=content_type, filename=os.path.basename(fullpath))
+        if encoding:
+            response['Content-Encoding'] = encoding
+    if not encoding:
+        response['Accept-Ranges'] = 'bytes'
+    for header, value in headers.items():
+        response[header] = value
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    # a blob's name is its hash, older uploads keep their name but may be deleted or replaced
+    cache_control = IMMUTABLE if BLOB_MEDIA.search(path) else getattr(settings, 'MEDIA_CACHE_CONTROL', 'public, max-age=3600')
+    return serve_file(request, path, settings.MEDIA_ROOT, cache_control)
+
+
+@require_safe
+def serve_static(request, path):
+    cache_control = IMMUTABLE if HASHED_STATIC.search(path) else getattr(settings, 'STATIC_CACHE_CONTROL', 'public, max-age=300')
+    return serve_file(request, path, settings.STATIC_ROOT, cache_control)
@@ -0,0 +1,133 @@
+"""
+Content-addressed storage for uploaded images (Tweet.tweet_image, Profile.image and their variants).
+
+A saved file is hashed while it is copied and stored as <upload dir>/<2 hex>/<sha256>.<ext>, so
+the same picture uploaded ten times is one file on disk. MediaBlob counts the references to each
+file: save() adds one, delete() takes one away, and the file is only removed when the last
+reference goes. A save() of content that is already stored checks the file again once its
+reference is counted and writes it back if a concurrent delete() removed it. The existing
+`image.delete()` calls in the views therefore release instead of deleting. Files written before
+this storage existed have no MediaBlob row and are deleted directly, as before. `dedupe_media` moves them into the content-addressed layout.
+
+ManifestStaticStorage is the STATIC side of the same idea: `build_assets` collects every static
+file under a content-hash name, so the URL changes whenever the file does and both can be cached
+forever (see tweetapp/serving.py).
+"""
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+CHUNK_SIZE = 64 * 1024
+
+
+def blob_name(directory, digest, ext):
+    return posixpath.join(directory, digest[:2], f"{digest}{ext.lower()}")
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+
+    def get_available_name(self, name, max_length=None):
+        # the real name is only known once the content is hashed, see _save
+        return name
+
+    def _save(self, name, content):
+        directory, filename = posixpath.split(name)
+        ext = posixpath.splitext(filename)[1]
+
+        digest = getattr(content, 'sha256', None)
+        own_temp = not (digest and hasattr(content, 'temporary_file_path'))
+        if not own_temp:
+            # hashed by ImageUploadHandler while it was received, move the temp file instead of copying it
+            temp_path = content.temporary_file_path()
+        else:
+            # hash while copying to a temp file next to the destination, one pass over the content
+            hasher = hashlib.sha256()
+            os.makedirs(self.path(directory or '.'), exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=self.path(directory or '.'), prefix='.upload-')
+            with os.fdopen(fd, 'wb') as temp:
+                for chunk in content.chunks(CHUNK_SIZE):
+                    hasher.update(chunk)
+                    temp.write(chunk)
+            digest = hasher.hexdigest()
+
+        final = blob_name(directory, digest, ext)
+        size = os.path.getsize(temp_path)
+        os.makedirs(os.path.dirname(self.path(final)), exist_ok=True)
+        stored = self._move(temp_path, final)
+        self.add_reference(final, digest, size)
+        if not stored:
+            # same content stored already. A delete() that released the last reference before ours
+            # was counted may have unlinked it meanwhile, put the file back from our copy
+            if not os.path.exists(self.path(final)):
+                stored = self._move(temp_path, final)
+            # an upload's own temp file goes when the request closes it
+            if not stored and own_temp:
+                os.remove(temp_path)
+        return final
+
+    def _move(self, temp_path, name):
+        """Move temp_path to name, False when a file is there already."""
+        target = self.path(name)
+        try:
+            file_move_safe(temp_path, target)   # a rename when both are on the same filesystem
+        except FileExistsError:
+            return False
+        if self.file_permissions_mode is not None:
+            os.chmod(target, self.file_permissions_mode)
+        return True
+
+    def add_reference(self, name, digest, size):
+        from .models import MediaBlob
+
+        blobs = MediaBlob.objects.filter(name=name)
+        if blobs.update(refs=F('refs') + 1):
+            return
+        try:
+            with transaction.atomic():
+                MediaBlob.objects.create(name=name, digest=digest, size=size, refs=1)
+        except IntegrityError:
+            blobs.update(refs=F('refs') + 1)   # another upload of the same content got there first
+
+    def delete(self, name):
+        """Drop one reference, removing the file with the last one."""
+        from .models import MediaBlob
+
+        if not name:
+            raise ValueError("The name must be given to delete().")
+        with transaction.atomic():
+            blobs = MediaBlob.objects.select_for_update().filter(name=name)
+            if not blobs.exists():
+                return super().delete(name)   # written before content addressing, one owner
+            blobs.update(refs=F('refs') - 1)
+            if not blobs.filter(refs__lte=0).delete()[0]:
+                return
+            # unlinked while the row is still locked, a save() of the same content that takes a new
+            # reference after us finds the file gone and writes it again
+            super().delete(name)
+
+
+media_storage = ContentAddressedStorage()
+
+
+def get_media_storage():
+    return media_storage
+
+
+class ManifestStaticStorage(ManifestStaticFilesStorage):
+    """Hashed static names from the manifest, plain names for anything not collected yet (tests, a fresh checkout)."""
+
+    manifest_strict = False
+
+    def stored_name(self, name):
+        if self.hash_key(self.clean_name(name)) not in self.hashed_files:
+            return name
+        return super().stored_name(name)
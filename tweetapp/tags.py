@@ -0,0 +1,68 @@
+"""
+#hashtags and @mentions pulled out of tweet bodies.
+
+add_tweet calls index_tweet once the tweet is saved: every tag gets a TweetHashtag row and every
+mentioned user a Mention row plus a "mention" notification, so a tag feed or a "tweets that
+mention me" list is an index seek instead of a LIKE over Tweet.body. Tags are also counted in
+the trending counters (tweetapp/trending.py).
+"""
+import re
+
+from django.contrib.auth.models import User
+
+from . import trending
+from .models import Hashtag, Mention, TweetHashtag
+from .notifications import notify
+
+HASHTAG = re.compile(r'(?<![\w#&])#(\w{1,50})')
+MENTION = re.compile(r'(?<![\w@])@([\w.+-]{1,150})')
+
+
+def _unique(values):
+    return list(dict.fromkeys(values))
+
+
+def extract(text):
+    """(hashtags, usernames) in the order they first appear. Tags are lowercased."""
+    text = text or ''
+    hashtags = _unique(tag.lower() for tag in HASHTAG.findall(text))
+    # "@bob." at the end of a sentence mentions bob
+    usernames = _unique(name.rstrip('.') for name in MENTION.findall(text))
+    return hashtags, [name for name in usernames if name]
+
+
+def hashtags_for(names):
+    """Hashtag rows for `names`, creating the missing ones. Two queries whatever the number of tags."""
+    Hashtag.objects.bulk_create([Hashtag(name=name) for name in names], ignore_conflicts=True)
+    return list(Hashtag.objects.filter(name__in=names))
+
+
+def index_tweet(tweet, notify_mentions=True, count_trending=True):
+    hashtag_names, usernames = extract(f"{tweet.tweet_title or ''} {tweet.body or ''}")
+
+    if hashtag_names:
+        hashtags = hashtags_for(hashtag_names)
+        TweetHashtag.objects.bulk_create(
+            [TweetHashtag(tweet=tweet, hashtag=hashtag, created_at=tweet.created_at) for hashtag in hashtags],
+            ignore_conflicts=True,
+        )
+        if count_trending:
+            trending.record(hashtag.id for hashtag in hashtags)
+
+    if usernames:
+        mentioned = list(User.objects.filter(username__in=usernames).exclude(id=tweet.user_id).select_related('profile'))
+        Mention.objects.bulk_create(
+            [Mention(tweet=tweet, user=user, created_at=tweet.created_at) for user in mentioned],
+            ignore_conflicts=True,
+        )
+        if notify_mentions:
+            author = tweet.user.profile
+            for user in mentioned:
+                notify(notify_by=author, notified_user=user.profile, notify_type='mention', notify_tweet=tweet)
+
+    return hashtag_names, usernames
+
+
+def tag_links(name):
+    """TweetHashtag rows of #name, page them on ('-created_at', '-id') to read straight off hashtag_feed_idx."""
+    return TweetHashtag.objects.filter(hashtag__name=name.lower()).only('id', 'created_at', 'tweet_id')
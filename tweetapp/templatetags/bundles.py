@@ -0,0 +1,24 @@
+from django import template
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.templatetags.static import static
+from django.utils.html import format_html_join
+
+from tweetapp import assets
+
+register = template.Library()
+
+
+def is_built(name):
+    return name in getattr(staticfiles_storage, 'hashed_files', {})
+
+
+@register.simple_tag
+def bundle(name):
+    """
+    <link>/<script> for an ASSET_BUNDLES entry: the one minified, hashed file once `build_assets`
+    has collected it, the separate source files in DEBUG or before the first build.
+    """
+    urls = [name] if not settings.DEBUG and is_built(name) else assets.bundles()[name]
+    tag = '<link rel="stylesheet" href="{}">' if name.endswith('.css') else '<script src="{}"></script>'
+    return format_html_join('\n', tag, ((static(url),) for url in urls))
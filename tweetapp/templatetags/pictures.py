@@ -0,0 +1,36 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+register = template.Library()
+
+SOURCE_TYPES = (('avif', 'image/avif'), ('webp', 'image/webp'))
+
+
+def _srcset(storage, variants, names, ext):
+    return ', '.join(
+        f"{storage.url(variants[name][ext])} {variants[name]['width']}w"
+        for name in names if ext in variants.get(name, {})
+    )
+
+
+@register.simple_tag
+def picture(image, variants, names='feed,full', sizes='100vw', alt='', css_class=''):
+    """
+    <picture> for an ImageField with the variants written by tweetapp/images.py, AVIF and WebP
+    first and JPEG/PNG as the fallback. `names` picks the variants offered, the first one is the
+    plain src. Without variants (still processing, or an old upload) it is a plain <img> of the original.
+    """
+    names = [name for name in names.split(',') if name in (variants or {})]
+    if not names:
+        return format_html('<img src="{}" class="{}" alt="{}" loading="lazy">', image.url, css_class, alt)
+
+    storage = image.storage
+    fallback = 'png' if 'png' in variants[names[0]] else 'jpg'
+    sources = format_html_join(
+        '', '<source type="{}" srcset="{}" sizes="{}">',
+        ((mime, _srcset(storage, variants, names, ext), sizes) for ext, mime in SOURCE_TYPES if ext in variants[names[0]]),
+    )
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" class="{}" alt="{}" loading="lazy" decoding="async"></picture>',
+        sources, storage.url(variants[names[0]][fallback]), _srcset(storage, variants, names, fallback), sizes, css_class, alt,
+    )
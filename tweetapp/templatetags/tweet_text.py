@@ -0,0 +1,33 @@
+from django import template
+from django.urls import reverse
+from django.utils.html import conditional_escape, format_html
+from django.utils.http import urlencode
+from django.utils.safestring import mark_safe
+
+from tweetapp.tags import HASHTAG, MENTION
+
+register = template.Library()
+
+
+def _tag_link(match):
+    name = match.group(1)
+    return format_html('<a href="{}">#{}</a>', reverse('tag_feed', args=[name.lower()]), name)
+
+
+def _mention_link(match):
+    username = match.group(1).rstrip('.')
+    trailing = match.group(1)[len(username):]
+    if not username:
+        return match.group(0)
+    url = reverse('search_user') + '?' + urlencode({'username': username})
+    return format_html('<a href="{}">@{}</a>{}', url, username, trailing)
+
+
+@register.filter(is_safe=True)
+def link_tags(text):
+    """Escape tweet text and turn #tags into tag feed links and @names into profile links."""
+    # the patterns only match word characters and . + -, none of which escaping changes
+    html = conditional_escape(text or '')
+    html = HASHTAG.sub(_tag_link, html)
+    html = MENTION.sub(_mention_link, html)
+    return mark_safe(html)
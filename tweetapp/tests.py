@@ -1,3 +1,1165 @@
-from django.test import TestCase
+import hashlib
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import F
+from django.template import Context, Template
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+from django.utils import timezone
+
+from tweetapp.models import DeliveredEvent, MediaBlob, Mention, Notification, Profile, Recommendation, SavedPosts, TimelineEntry, TrendingBucket, Tweet, TweetComment, TweetLikes
+from tweetapp.storage import blob_name, media_storage
+from tweet.utils import encode_cursor, paginate_queryset
+from tweetapp import assets, cards, follows, graph, images, notification_queue, notifications, realtime, recommendations, search, tags, timeline, trending, user_search
+
+
+class KeysetPaginationTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('pager', password='pass')
+        now = timezone.now()
+        self.tweets = [Tweet.objects.create(user=self.user, tweet_title=f'title {i}', body='body') for i in range(7)]
+        # three tweets share a timestamp and straddle the first page boundary
+        Tweet.objects.filter(id__in=[tweet.id for tweet in self.tweets[2:5]]).update(created_at=now - timedelta(minutes=5))
+        for i, tweet in enumerate(self.tweets[:2]):
+            Tweet.objects.filter(id=tweet.id).update(created_at=now - timedelta(minutes=10 + i))
+        for i, tweet in enumerate(self.tweets[5:]):
+            Tweet.objects.filter(id=tweet.id).update(created_at=now - timedelta(minutes=i))
+        self.expected = list(Tweet.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def walk(self, per_page):
+        seen, cursor = [], None
+        while True:
+            page = paginate_queryset(Tweet.objects.all(), cursor, per_page)
+            seen += [tweet.id for tweet in page['results']]
+            if not page['has_next']:
+                return seen
+            cursor = page['next_cursor']
+
+    def test_pages_continue_without_gaps_or_repeats(self):
+        for per_page in (1, 2, 3, 4):
+            self.assertEqual(self.walk(per_page), self.expected)
+
+    def test_rows_with_equal_timestamps_across_a_page_boundary(self):
+        first = paginate_queryset(Tweet.objects.all(), None, 3)
+        second = paginate_queryset(Tweet.objects.all(), first['next_cursor'], 3)
+        self.assertEqual([tweet.id for tweet in first['results'] + second['results']], self.expected[:6])
+        self.assertEqual(first['results'][-1].created_at, second['results'][0].created_at)
+
+    def test_tampered_cursors_give_the_first_page(self):
+        first = [tweet.id for tweet in paginate_queryset(Tweet.objects.all(), None, 3)['results']]
+        for cursor in ('WyJ4IiwgMV0', encode_cursor([None, 1]), encode_cursor([1, 'x']), encode_cursor(['2024-01-01T00:00:00+00:00']),
+                       encode_cursor([[1], {'a': 1}]), encode_cursor(['2024-01-01T00:00:00+00:00', 2 ** 70]), '%%%', 'e30'):
+            self.assertEqual([tweet.id for tweet in paginate_queryset(Tweet.objects.all(), cursor, 3)['results']], first, cursor)
+
+        self.client.force_login(self.user)
+        for name, args in (('home_more', []), ('prof_more', [self.user.id]), ('saved_posts_more', []), ('followers_more', [self.user.id])):
+            self.assertEqual(self.client.get(reverse(name, args=args), {'cursor': 'WyJ4IiwgMV0'}).status_code, 200, name)
+        response = self.client.post(reverse('mark_all_notifications_read'), {'up_to': 'WyJ4IiwgMV0'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(search.search_tweets('title', 'WyJ4IiwgMV0', per_page=3)['per_page'], 3)
+
+
+class FeedQueryCountTest(TestCase):
+    # rendering a page of tweets must not cost extra queries per tweet
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user('viewer', password='secret')
+        cls.others = [User.objects.create_user(f'user{i}', password='secret') for i in range(3)]
+        for other in cls.others:
+            cls.viewer.profile.follows.add(other.profile)
+
+    def setUp(self):
+        cache.clear()
+
+    def post_tweets(self, count):
+        for i in range(count):
+            author = self.others[i % len(self.others)]
+            tweet = Tweet.objects.create(user=author, tweet_title=f'title {i}', body=f'body {i}')
+            timeline.fanout_tweet(tweet)
+            TweetLikes.objects.create(user=self.viewer, tweet=tweet)
+            for other in self.others:
+                TweetComment.objects.create(user=other, tweet=tweet, description=f'comment by {other}')
+            SavedPosts.objects.create(user=self.viewer, tweet=tweet)
+        call_command('reconcile_counters', stdout=StringIO())
+
+    def count_queries(self, url):
+        self.client.force_login(self.viewer)
+        notifications.unread_count(self.viewer.profile.id)   # the navbar counter lives in the cache
+        trending.top()   # so does the trending panel
+        profile_ids = list(Profile.objects.values_list('id', flat=True))
+        graph.following_map(profile_ids), graph.follower_map(profile_ids)   # and the follow counts
+        timeline.home_timeline(self.viewer)   # the read-time trim runs once per interval
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assertConstantQueries(self, url):
+        self.post_tweets(2)
+        small_page = self.count_queries(url)
+        self.post_tweets(12)
+        large_page = self.count_queries(url)
+        self.assertEqual(small_page, large_page)
+
+    def test_home(self):
+        self.assertConstantQueries(reverse('home'))
+
+    def test_profile(self):
+        self.assertConstantQueries(reverse('prof', args=[self.others[0].id]))
+
+    def test_saved_posts(self):
+        self.assertConstantQueries(reverse('saved_posts'))
+
+    def test_counts_and_comments_are_loaded(self):
+        self.post_tweets(1)
+        self.client.force_login(self.viewer)
+        response = self.client.get(reverse('home'))
+        tweet = response.context['tweets'][0]
+        self.assertEqual(tweet.likes_count, 1)
+        self.assertEqual(tweet.comments_count, 3)
+        self.assertEqual(len(tweet.latest_comments), 3)
+
+
+class TimelineTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('author', password='pass')
+        self.fans = [User.objects.create_user(f'fan{i}', password='pass') for i in range(2)]
+        for fan in self.fans:
+            fan.profile.follows.add(self.author.profile)
+
+    def post(self, title):
+        tweet = Tweet.objects.create(user=self.author, tweet_title=title, body='body')
+        timeline.fanout_tweet(tweet)
+        return tweet
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_author_over_the_fanout_limit_is_merged_in_on_read(self):
+        tweet = self.post('popular')
+        self.assertFalse(TimelineEntry.objects.filter(user=self.fans[0]).exists())
+        self.assertEqual(timeline.celebrity_user_ids(self.fans[0]), [self.author.id])
+        self.assertEqual(list(timeline.home_timeline(self.fans[0])), [tweet])
+
+    def test_home_pages_merge_celebrities_without_gaps(self):
+        celebrity = User.objects.create_user('celebrity', password='pass')
+        self.fans[0].profile.follows.add(celebrity.profile)
+        posted = []
+        for i in range(5):
+            posted.append(self.post(f'fanned out {i}'))
+            posted.append(Tweet.objects.create(user=celebrity, tweet_title=f'merged {i}', body='body'))
+        expected = [tweet.id for tweet in sorted(posted, key=lambda tweet: (tweet.created_at, tweet.id), reverse=True)]
+
+        with self.settings(TIMELINE_FANOUT_LIMIT=1):
+            self.assertEqual(timeline.celebrity_user_ids(self.fans[0]), [self.author.id, celebrity.id])
+            seen, cursor = [], None
+            while True:
+                page = paginate_queryset(timeline.home_timeline(self.fans[0], cursor, 3), cursor, 3)
+                seen += [tweet.id for tweet in page['results']]
+                cursor = page['next_cursor']
+                if cursor is None:
+                    break
+        self.assertEqual(seen, expected)
+
+    def test_follower_counts_follow_the_graph(self):
+        self.assertEqual(graph.follower_counts([self.author.profile.id]), {self.author.profile.id: 3})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.fans[0].profile.follows.remove(self.author.profile)
+        self.assertEqual(graph.follower_counts([self.author.profile.id]), {self.author.profile.id: 2})
+
+    @override_settings(TIMELINE_MAX_LENGTH=2)
+    def test_first_page_read_trims_the_readers_timeline(self):
+        tweets = [self.post(f't{i}') for i in range(4)]
+        timeline.home_timeline(self.fans[0], 'some-cursor')
+        self.assertEqual(TimelineEntry.objects.filter(user=self.fans[0]).count(), 4)
+        timeline.home_timeline(self.fans[0])
+        kept = TimelineEntry.objects.filter(user=self.fans[0]).order_by('-created_at', '-tweet_id').values_list('tweet_id', flat=True)
+        self.assertEqual(list(kept), [tweets[3].id, tweets[2].id])
+        self.assertEqual(TimelineEntry.objects.filter(user=self.fans[1]).count(), 4)
+
+    @override_settings(TIMELINE_MAX_LENGTH=2)
+    def test_trim_timelines_cuts_back_to_the_limit(self):
+        tweets = [self.post(f't{i}') for i in range(4)]
+        self.assertEqual(timeline.trim_timelines(), 6)   # two fans and the author, two rows each over the limit
+        kept = TimelineEntry.objects.filter(user=self.fans[0]).order_by('-created_at', '-tweet_id').values_list('tweet_id', flat=True)
+        self.assertEqual(list(kept), [tweets[3].id, tweets[2].id])
+
+
+class CounterTest(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user('author', password='secret')
+        self.reader = User.objects.create_user('reader', password='secret')
+        self.tweet = Tweet.objects.create(user=self.author, tweet_title='title', body='body')
+        self.client.force_login(self.reader)
+
+    def test_like_toggle_and_comment_update_counters(self):
+        url = reverse('add_likes', args=[self.tweet.id])
+        self.client.post(url, HTTP_REFERER='/')
+        self.tweet.refresh_from_db()
+        self.assertEqual(self.tweet.likes_count, 1)
+
+        self.client.post(url, HTTP_REFERER='/')
+        self.tweet.refresh_from_db()
+        self.assertEqual(self.tweet.likes_count, 0)
+
+        self.client.post(reverse('add_comments', args=[self.tweet.id]), {'description': 'hi', 'next': '/'})
+        self.tweet.refresh_from_db()
+        self.assertEqual(self.tweet.comments_count, 1)
+
+    def test_reconcile_repairs_drift(self):
+        TweetLikes.objects.create(user=self.reader, tweet=self.tweet)
+        Tweet.objects.filter(id=self.tweet.id).update(comments_count=7)
+        call_command('reconcile_counters', batch_size=1, stdout=StringIO())
+        self.tweet.refresh_from_db()
+        self.assertEqual((self.tweet.likes_count, self.tweet.comments_count), (1, 0))
+
+
+class TweetCardCacheTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('author', password='secret')
+        self.reader = User.objects.create_user('reader', password='secret')
+        self.tweet = Tweet.objects.create(user=self.author, tweet_title='title', body='body')
+        timeline.fanout_tweet(self.tweet)
+        self.client.force_login(self.author)
+
+    def test_cards_are_reused_and_invalidated_by_comments(self):
+        self.client.get(reverse('home'))
+        self.client.get(reverse('home'))
+        self.assertEqual(cards.card_stats()['hits'], 1)
+        self.assertEqual(cards.card_stats()['misses'], 1)
+
+        self.client.post(reverse('add_comments', args=[self.tweet.id]), {'description': 'fresh comment', 'next': '/'})
+        self.assertContains(self.client.get(reverse('home')), 'fresh comment')
+        self.assertEqual(cards.card_stats()['misses'], 2)
+
+    def test_shared_card_keeps_per_viewer_bits_out(self):
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, reverse('delete_tweet', args=[self.tweet.id]))
+
+        self.reader.profile.follows.add(self.author.profile)
+        timeline.follow_author(self.reader, self.author)
+        self.client.force_login(self.reader)
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, 'body')
+        self.assertNotContains(response, reverse('delete_tweet', args=[self.tweet.id]))
+
+    @override_settings(FEED_COMMENTS_PER_TWEET=2)
+    def test_latest_comments_are_limited_per_tweet(self):
+        other = Tweet.objects.create(user=self.author, tweet_title='other', body='body')
+        comments = {tweet.id: [TweetComment.objects.create(user=self.reader, tweet=tweet, description=f'{tweet.id}/{i}') for i in range(3)]
+                    for tweet in (self.tweet, other)}
+        tweets = [self.tweet, other, Tweet.objects.create(user=self.author, tweet_title='quiet', body='body')]
+        with self.assertNumQueries(1):
+            cards.attach_latest_comments(tweets)
+        self.assertEqual(tweets[0].latest_comments, comments[self.tweet.id][:0:-1])
+        self.assertEqual(tweets[1].latest_comments, comments[other.id][:0:-1])
+        self.assertEqual(tweets[2].latest_comments, [])
+
+
+class UnreadCounterTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('author', password='secret')
+        self.reader = User.objects.create_user('reader', password='secret')
+        self.tweet = Tweet.objects.create(user=self.author, tweet_title='title', body='body')
+
+    def test_counter_follows_likes_comments_and_reads(self):
+        profile_id = self.author.profile.id
+        self.assertEqual(notifications.unread_count(profile_id), 0)
+
+        self.client.force_login(self.reader)
+        self.client.post(reverse('add_likes', args=[self.tweet.id]), HTTP_REFERER='/')
+        self.client.post(reverse('add_comments', args=[self.tweet.id]), {'description': 'hi', 'next': '/'})
+        with self.assertNumQueries(0):
+            self.assertEqual(notifications.unread_count(profile_id), 2)
+
+        # only the owner can mark a notification as read
+        notification = Notification.objects.filter(notified_user_id=profile_id).first()
+        self.client.get(reverse('mark_as_read_notification', args=[notification.id]))
+        self.assertEqual(notifications.unread_count(profile_id), 2)
+
+        self.client.force_login(self.author)
+        self.client.get(reverse('mark_as_read_notification', args=[notification.id]))
+        self.client.get(reverse('mark_as_read_notification', args=[notification.id]))
+        self.assertEqual(notifications.unread_count(profile_id), 1)
+        self.assertContains(self.client.get(reverse('saved_posts')), 'Notifications 1')
+
+
+class NotificationOutboxTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.author = User.objects.create_user('author', password='secret')
+        self.reader = User.objects.create_user('reader', password='secret')
+        self.tweet = Tweet.objects.create(user=self.author, tweet_title='title', body='body')
+
+    def outbox_settings(self):
+        return override_settings(
+            NOTIFICATIONS_ASYNC=True, NOTIFICATION_WORKERS=0, NOTIFICATION_OUTBOX_PATH=Path(self.tmp.name) / 'outbox.sqlite3',
+        )
+
+    def test_events_wait_in_outbox_and_redelivery_is_idempotent(self):
+        with self.outbox_settings():
+            with self.captureOnCommitCallbacks(execute=True):
+                notifications.notify(self.reader.profile, self.author.profile, 'like', self.tweet)
+                notifications.notify(self.reader.profile, self.author.profile, 'comment', self.tweet)
+            self.assertFalse(Notification.objects.exists())
+            self.assertEqual(notification_queue.get_outbox().stats()['pending'], 2)
+
+            call_command('notification_outbox', 'drain', stdout=StringIO())
+            self.assertEqual(Notification.objects.count(), 2)
+
+            call_command('notification_outbox', 'replay', stdout=StringIO())
+            self.assertEqual(Notification.objects.count(), 2)
+            self.assertEqual(notifications.unread_count(self.author.profile.id), 2)
+
+    def test_events_for_deleted_tweets_are_dropped(self):
+        with self.outbox_settings():
+            with self.captureOnCommitCallbacks(execute=True):
+                notifications.notify(self.reader.profile, self.author.profile, 'like', self.tweet)
+            self.tweet.delete()
+            self.assertEqual(notification_queue.drain(), 1)
+            self.assertFalse(Notification.objects.exists())
+
+    def test_failed_batches_are_retried_with_backoff(self):
+        with self.outbox_settings(), override_settings(NOTIFICATION_RETRY_INTERVAL=10):
+            outbox = notification_queue.get_outbox()
+            row_id = outbox.add({'key': 'retry-me'})
+            now = time.time()
+            self.assertEqual(outbox.claim_due(10, now), [])   # just queued, the workers have it
+            self.assertEqual(outbox.claim_due(10, now + 11), [row_id])
+            self.assertEqual(outbox.claim_due(10, now + 12), [])   # leased to that sweep
+
+            outbox.mark_failed([row_id], 'database is locked')
+            outbox.mark_failed([row_id], 'database is locked')
+            self.assertEqual(outbox.claim_due(10, time.time() + 19), [])
+            self.assertEqual(outbox.claim_due(10, time.time() + 21), [row_id])
+
+    def test_replay_and_retention_stay_within_the_key_retention(self):
+        with self.outbox_settings(), override_settings(NOTIFICATION_RETENTION_DAYS=1):
+            outbox = notification_queue.get_outbox()
+            old, recent = outbox.add({'key': 'old'}), outbox.add({'key': 'recent'})
+            outbox.mark_delivered([old, recent])
+            outbox._connect().execute("UPDATE events SET created_at = ?, delivered_at = ? WHERE id = ?", [time.time() - 2 * 86400] * 2 + [old])
+
+            self.assertEqual(notification_queue.replay(None)[0], 1)   # the old key may be gone already
+            outbox.mark_delivered([recent])
+            notifications.run_retention()
+            self.assertEqual(outbox.stats(), {'pending': 0, 'failing': 0, 'delivered': 1})
+
+    def test_rolled_back_request_leaves_no_event(self):
+        with self.outbox_settings():
+            with self.captureOnCommitCallbacks(execute=True):
+                with self.assertRaises(RuntimeError), transaction.atomic():
+                    notifications.notify(self.reader.profile, self.author.profile, 'like', self.tweet)
+                    raise RuntimeError('request failed')
+            self.assertEqual(notification_queue.get_outbox().stats()['pending'], 0)
+
+
+class NotificationCoalescingTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('author', password='secret')
+        self.fans = [User.objects.create_user(f'fan{i}', password='secret') for i in range(5)]
+        self.tweet = Tweet.objects.create(user=self.author, tweet_title='title', body='body')
+
+    def test_likes_fold_into_one_row(self):
+        for fan in self.fans:
+            notifications.notify(fan.profile, self.author.profile, 'like', self.tweet)
+        notifications.notify(self.fans[0].profile, self.author.profile, 'like', self.tweet)
+
+        notification = Notification.objects.get()
+        self.assertEqual(notification.actor_count, 5)
+        self.assertEqual(notification.notify_by, self.fans[-1].profile)
+        self.assertEqual(notifications.unread_count(self.author.profile.id), 1)
+
+        self.client.force_login(self.author)
+        response = self.client.get(reverse('notification_list'))
+        self.assertContains(response, '@fan4')
+        self.assertContains(response, 'and 2 others')
+
+    def test_read_rows_are_not_reused(self):
+        notifications.notify(self.fans[0].profile, self.author.profile, 'like', self.tweet)
+        Notification.objects.update(is_read=True)
+        notifications.notify(self.fans[1].profile, self.author.profile, 'like', self.tweet)
+        self.assertEqual(Notification.objects.count(), 2)
+
+    def test_redelivering_a_folded_event_changes_nothing(self):
+        events = [
+            {'key': f'event{i}', 'notify_by_id': fan.profile.id, 'notified_user_id': self.author.profile.id,
+             'notify_tweet_id': self.tweet.id, 'notify_type': 'like'}
+            for i, fan in enumerate(self.fans[:2])
+        ]
+        notifications.deliver(events)
+        Notification.objects.update(is_read=True)
+        # event1 was folded into event0's row, it must not open a new one once that row is read
+        self.assertEqual(notifications.deliver(events[1:]), [])
+        self.assertEqual(Notification.objects.count(), 1)
+        self.assertEqual(DeliveredEvent.objects.count(), 2)
+
+    def test_follow_unfollow_toggle_cancels_out(self):
+        fan = self.fans[0].profile
+        notifications.notify(fan, self.author.profile, 'follow')
+        notifications.notify(fan, self.author.profile, 'unfollow')
+        self.assertFalse(Notification.objects.exists())
+        self.assertEqual(notifications.unread_count(self.author.profile.id), 0)
+
+        notifications.notify(fan, self.author.profile, 'follow')
+        notifications.notify(self.fans[1].profile, self.author.profile, 'follow')
+        notifications.notify(fan, self.author.profile, 'unfollow')
+        notification = Notification.objects.get()
+        self.assertEqual((notification.notify_type, notification.actor_ids), ('follow', [self.fans[1].profile.id]))
+
+
+class NotificationHousekeepingTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('author', password='secret')
+        self.fans = [User.objects.create_user(f'fan{i}', password='secret') for i in range(3)]
+        self.tweets = [Tweet.objects.create(user=self.author, tweet_title=f'title {i}', body='body') for i in range(3)]
+        for tweet in self.tweets:
+            notifications.notify(self.fans[0].profile, self.author.profile, 'like', tweet)
+        self.client.force_login(self.author)
+
+    def test_mark_all_up_to_cursor(self):
+        up_to = self.client.get(reverse('notification_list')).context['up_to']
+        late = Tweet.objects.create(user=self.author, tweet_title='late', body='body')
+        notifications.notify(self.fans[1].profile, self.author.profile, 'like', late)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(notifications.mark_all_read(self.author.profile, up_to), 3)
+        self.assertEqual(notifications.unread_count(self.author.profile.id), 1)
+
+        self.client.post(reverse('mark_all_notifications_read'))
+        self.assertEqual(notifications.unread_count(self.author.profile.id), 0)
+        self.assertFalse(Notification.objects.filter(is_read=False).exists())
+
+    def test_purge_only_removes_old_read_rows(self):
+        Notification.objects.filter(notify_tweet=self.tweets[0]).update(is_read=True)
+        Notification.objects.filter(notify_tweet__in=self.tweets[:2]).update(notify_time=timezone.now() - timedelta(days=40))
+
+        out = StringIO()
+        call_command('purge_notifications', days=30, batch_size=1, stdout=out)
+        self.assertIn('Purged 1 notifications', out.getvalue())
+        self.assertEqual(Notification.objects.count(), 2)
+
+
+class QueryPlanTest(TestCase):
+
+    def test_hot_queries_use_indexes(self):
+        out = StringIO()
+        call_command('check_query_plans', stdout=out)
+        self.assertNotIn('FULL SCAN', out.getvalue())
+
+
+class UserSearchTest(TestCase):
+
+    def setUp(self):
+        user_search._index = None
+        self.addCleanup(setattr, user_search, '_index', None)
+        self.quiet = User.objects.create_user('ann_quiet', password='pass')
+        self.popular = User.objects.create_user('ann_popular', password='pass')
+        self.exact = User.objects.create_user('ann', password='pass')
+        self.other = User.objects.create_user('joann', password='pass')
+        for name in ('fan1', 'fan2'):
+            User.objects.create_user(name, password='pass').profile.follows.add(self.popular.profile)
+
+    def test_exact_match_then_followers_then_infix(self):
+        self.assertEqual(user_search.suggest('ANN'), ['ann', 'ann_popular', 'ann_quiet', 'joann'])
+
+    def test_index_follows_signups_renames_and_follows(self):
+        user_search.get_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            newcomer = User.objects.create_user('ann_new', password='pass')
+            self.quiet.username = 'bob'
+            self.quiet.save()
+            for name in ('fan3', 'fan4', 'fan5'):
+                User.objects.create_user(name, password='pass').profile.follows.add(newcomer.profile)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(user_search.suggest('ann_'), ['ann_new', 'ann_popular'])
+            self.assertEqual(user_search.suggest('bo'), ['bob'])
+
+    def test_short_prefix_ranks_every_match(self):
+        index = user_search.UsernameIndex([(i, f'a{i:05d}') for i in range(1, 7000)], {6999: 5})
+        self.assertEqual(index.search('a', 1), ['a06999'])
+        index.adjust_followers(6000, 9)
+        self.assertEqual(index.search('a', 2), ['a06000', 'a06999'])
+        index.adjust_followers(6000, -9)
+        self.assertEqual(index.search('a', 2), ['a06999', 'a00001'])
+
+    def test_endpoint(self):
+        self.client.force_login(self.exact)
+        response = self.client.get(reverse('suggest_users'), {'username': 'jo'})
+        self.assertEqual(response.json(), [{'username': 'joann'}])
+
+
+class FollowGraphTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.ann, self.bob, self.cat = (User.objects.create_user(name, password='pass').profile for name in ('ann', 'bob', 'cat'))
+        self.ann.follows.add(self.bob, self.cat)
+        self.bob.follows.add(self.ann, self.cat)
+
+    def test_reads_are_served_from_the_cached_arrays(self):
+        graph.following_map([self.ann.id, self.bob.id]), graph.follower_map([self.ann.id, self.cat.id])
+        with self.assertNumQueries(0):
+            self.assertEqual(list(graph.following_ids(self.ann.id)), sorted([self.ann.id, self.bob.id, self.cat.id]))
+            self.assertEqual(graph.follower_count(self.cat.id), 3)
+            self.assertTrue(graph.is_following(self.ann.id, self.bob.id))
+            self.assertFalse(graph.is_following(self.ann.id, 0))
+            self.assertEqual(graph.follow_states(self.bob.id, [self.ann.id, self.cat.id, 0]), {self.ann.id, self.cat.id})
+            self.assertEqual(list(graph.mutual_ids(self.ann.id)), [self.bob.id])
+            self.assertEqual(list(graph.common_following_ids(self.ann.id, self.bob.id)), sorted([self.ann.id, self.bob.id, self.cat.id]))
+
+    def test_follows_update_both_ends_in_place(self):
+        graph.following_ids(self.cat.id), graph.follower_ids(self.ann.id)
+        self.client.force_login(self.cat.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('follow_unfollow', args=[self.ann.user_id]), {'follow': 'follow'})
+            self.bob.followed_by.remove(self.ann)
+        with self.assertNumQueries(0):
+            self.assertTrue(graph.is_following(self.cat.id, self.ann.id))
+            self.assertEqual(graph.follower_count(self.ann.id), 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ann.follows.clear()
+        self.assertEqual(graph.follower_count(self.cat.id), 2)
+        self.assertEqual(graph.following_count(self.bob.id), 3)   # never cached before the clear
+
+    def test_profile_page(self):
+        self.client.force_login(self.ann.user)
+        response = self.client.get(reverse('prof', args=[self.cat.user_id]))
+        self.assertEqual((response.context['following_count'], response.context['followers_count']), (1, 3))
+        self.assertContains(response, 'Unfollow @cat')
+
+
+class FollowTest(TransactionTestCase):
+    # a transaction test: the graph cache is updated when a follow commits, as it is in a request
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('author', password='pass')
+        self.fan = User.objects.create_user('fan', password='pass')
+        Tweet.objects.create(user=self.author, tweet_title='hello', body='world')
+        self.client.force_login(self.fan)
+        self.url = reverse('follow_json', args=[self.author.id])
+
+    def follow(self, action):
+        return self.client.post(self.url, {'follow': action}).json()
+
+    def test_rolled_back_follow_leaves_the_cache_alone(self):
+        graph.follower_ids(self.author.profile.id), graph.following_ids(self.fan.profile.id)
+        with mock.patch('tweetapp.follows.notify', side_effect=RuntimeError('notification store down')):
+            with self.assertRaises(RuntimeError):
+                follows.set_following(self.fan.profile, self.author.profile, True)
+        self.assertFalse(self.author.profile.followed_by.filter(id=self.fan.profile.id).exists())
+        with self.assertNumQueries(0):
+            self.assertFalse(graph.is_following(self.fan.profile.id, self.author.profile.id))
+            self.assertEqual(graph.follower_count(self.author.profile.id), 1)
+
+    def test_repeated_clicks_change_nothing(self):
+        updated = Profile.objects.get(user=self.fan).updated
+        graph.follower_ids(self.author.profile.id)
+        self.assertEqual(self.follow('follow'), {'user': self.author.id, 'following': True, 'followers': 2})
+        self.assertEqual(self.follow('follow')['followers'], 2)
+        self.assertEqual(self.author.profile.followed_by.count(), 2)
+        self.assertEqual(Notification.objects.get().notify_type, 'follow')
+        self.assertEqual(TimelineEntry.objects.filter(user=self.fan).count(), 1)
+        self.assertEqual(Profile.objects.get(user=self.fan).updated, updated)   # no profile row rewrite
+
+        for _ in range(2):
+            self.assertEqual(self.follow('unfollow'), {'user': self.author.id, 'following': False, 'followers': 1})
+        self.assertFalse(Notification.objects.exists())   # the unfollow cancelled the unread follow
+        self.assertFalse(TimelineEntry.objects.filter(user=self.fan).exists())
+
+    def test_a_repeated_follow_is_one_insert_attempt(self):
+        follows.set_following(self.fan.profile, self.author.profile, True)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertFalse(follows.set_following(self.fan.profile, self.author.profile, True))
+        control = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE')
+        statements = [query['sql'] for query in queries if not query['sql'].startswith(control)]
+        self.assertEqual(len(statements), 1)   # the INSERT the unique constraint refused, nothing else
+        self.assertTrue(statements[0].startswith('INSERT'))
+
+    def test_the_self_follow_stays(self):
+        self.client.post(reverse('follow_unfollow', args=[self.fan.id]), {'follow': 'unfollow'})
+        self.assertTrue(self.fan.profile.follows.filter(id=self.fan.profile.id).exists())
+
+
+class RegistrationTest(TestCase):
+
+    def test_register_writes_three_rows_in_one_transaction(self):
+        data = {'username': 'newbie', 'password1': 'a-long-passphrase', 'password2': 'a-long-passphrase',
+                'email': 'newbie@example.com', 'full_phone_number': '+14155552671'}
+        with CaptureQueriesContext(connection) as queries:
+            self.assertRedirects(self.client.post(reverse('signup'), data), reverse('signin'))
+        writes = [query['sql'].split()[0] for query in queries if query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))]
+        self.assertEqual(writes, ['INSERT', 'INSERT', 'INSERT'])
+
+        profile = Profile.objects.select_related('user').get(user__username='newbie')
+        self.assertEqual((profile.user.email, str(profile.phone_number)), ('newbie@example.com', '+14155552671'))
+        self.assertEqual(list(profile.follows.all()), [profile])
+        self.assertTrue(self.client.login(username='newbie', password='a-long-passphrase'))
+
+    def test_users_created_elsewhere_still_get_a_profile(self):
+        user = User.objects.create_user('plain', password='pass')
+        self.assertEqual(list(Profile.objects.get(user=user).follows.all()), [user.profile])
+
+    def test_bulk_import(self):
+        User.objects.create_user('load3', password='pass')
+        out = StringIO()
+        call_command('import_users', generate=5, prefix='load', password='secret', batch_size=2, stdout=out)
+        self.assertIn('Created 4 accounts, 1 skipped', out.getvalue())
+        profiles = Profile.objects.filter(user__username__startswith='load')
+        self.assertEqual(profiles.count(), 5)
+        self.assertEqual(graph.Follows.objects.filter(from_profile__in=profiles, to_profile_id=F('from_profile_id')).count(), 5)
+        self.assertTrue(self.client.login(username='load4', password='secret'))
+
+
+class FollowListTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.star = User.objects.create_user('star', password='pass').profile
+        self.viewer = User.objects.create_user('viewer', password='pass').profile
+        self.fans = [User.objects.create_user(f'fan{i}', password='pass').profile for i in range(7)]
+        for fan in self.fans:
+            fan.follows.add(self.star)
+        self.viewer.follows.add(self.fans[0], self.fans[5])
+        self.client.force_login(self.viewer.user)
+
+    @override_settings(FOLLOW_LIST_PAGE_SIZE=3)
+    def test_followers_paged_newest_first(self):
+        response = self.client.get(reverse('followers', args=[self.star.user_id]))
+        self.assertEqual(response.context['rows'], self.fans[:-4:-1])
+        self.assertEqual(response.context['viewer_following'], {self.fans[5].id})
+        self.assertContains(response, 'Following</button>', count=1)
+
+        seen = list(response.context['rows'])
+        cursor = response.context['next_cursor']
+        while cursor:
+            page = self.client.get(reverse('followers_more', args=[self.star.user_id]), {'cursor': cursor})
+            seen += page.context['rows']
+            cursor = page.context['next_cursor']
+        self.assertEqual(seen, self.fans[::-1])   # the star's own self-follow is not listed
+
+    @override_settings(FOLLOW_LIST_PAGE_SIZE=3)
+    def test_query_count_does_not_grow_with_the_page(self):
+        url = reverse('following', args=[self.fans[0].user_id])
+        self.client.get(url)   # session, user and the cached follow arrays
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(url)
+        for fan in self.fans[1:]:
+            self.fans[0].follows.add(fan)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(url)
+        self.assertEqual(len(response.context['rows']), 3)
+        self.assertEqual(len(small), len(large))
+
+
+class RecommendationTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.ann, self.bob, self.cat, self.dan, self.eve = (
+            User.objects.create_user(name, password='pass').profile for name in ('ann', 'bob', 'cat', 'dan', 'eve')
+        )
+        self.ann.follows.add(self.bob, self.cat)
+        self.bob.follows.add(self.dan)
+        self.cat.follows.add(self.dan, self.eve)
+        Tweet.objects.create(user=self.eve.user, tweet_title='busy', body='posting')
+
+    def test_ranked_by_mutuals_then_activity(self):
+        call_command('build_recommendations', stdout=StringIO())
+        ranked = list(Recommendation.objects.filter(profile=self.ann).order_by('rank').values_list('candidate', 'mutuals'))
+        self.assertEqual(ranked, [(self.dan.id, 2), (self.eve.id, 1)])
+        # nobody to go through yet, the most active author fills in
+        self.assertEqual(list(Recommendation.objects.filter(profile=self.dan).values_list('candidate', flat=True)), [self.eve.id])
+
+    def test_page_serves_the_stored_rows(self):
+        recommendations.rebuild()
+        self.client.force_login(self.ann.user)
+        response = self.client.get(reverse('profile_list'))
+        self.assertEqual([row.candidate for row in response.context['suggestions']], [self.dan, self.eve])
+        self.assertContains(response, 'Followed by 2 people you follow')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ann.follows.add(self.dan)   # followed since the last rebuild
+        self.assertEqual([row.candidate for row in self.client.get(reverse('profile_list')).context['suggestions']], [self.eve])
+
+    def test_new_profile_is_computed_on_first_visit(self):
+        newcomer = User.objects.create_user('newcomer', password='pass')
+        newcomer.profile.follows.add(self.cat)
+        self.client.force_login(newcomer)
+        response = self.client.get(reverse('profile_list'))
+        self.assertEqual([row.candidate for row in response.context['suggestions']], [self.eve, self.dan])
+
+
+class TweetSearchTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('writer', password='pass')
+        self.in_title = Tweet.objects.create(user=self.user, tweet_title='Django tips', body='a few notes')
+        self.in_body = Tweet.objects.create(user=self.user, tweet_title='notes', body='running django on sqlite')
+        self.in_comment = Tweet.objects.create(user=self.user, tweet_title='lunch', body='pasta again')
+        TweetComment.objects.create(user=self.user, tweet=self.in_comment, description='cooked while reading the django docs')
+
+    def test_ranked_and_paginated(self):
+        page = search.search_tweets('django', per_page=2)
+        self.assertEqual(page['results'], [self.in_title.id, self.in_body.id])
+        self.assertTrue(page['has_next'])
+
+        page = search.search_tweets('django', page['next_cursor'], per_page=2)
+        self.assertEqual(page['results'], [self.in_comment.id])
+        self.assertFalse(page['has_next'])
+
+    def test_index_follows_deletes_and_rebuild(self):
+        self.assertEqual(search.search_tweets('pasta cook')['results'], [self.in_comment.id])
+        TweetComment.objects.filter(tweet=self.in_comment).delete()
+        self.assertEqual(search.search_tweets('cooked')['results'], [])
+
+        self.in_title.delete()
+        call_command('rebuild_search_index', chunk_size=1, stdout=StringIO())
+        self.assertEqual(search.search_tweets('django')['results'], [self.in_body.id])
+
+    def test_new_comment_is_indexed_on_its_own(self):
+        with CaptureQueriesContext(connection) as queries:
+            TweetComment.objects.create(user=self.user, tweet=self.in_title, description='bookmarked for the weekend')
+        touched = [query['sql'] for query in queries if 'search' in query['sql']]
+        self.assertEqual(len(touched), 1)
+        self.assertIn(search.COMMENT_TABLE, touched[0])
+        self.assertEqual(search.search_tweets('tips weekend')['results'], [self.in_title.id])
+
+    def test_search_page(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('search'), {'q': 'sqlite'})
+        self.assertEqual([tweet.id for tweet in response.context['tweets']], [self.in_body.id])
+
+
+class HashtagMentionTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        trending._pending.clear()
+        self.author = User.objects.create_user('author', password='pass')
+        self.bob = User.objects.create_user('bob', password='pass')
+        self.client.force_login(self.author)
+
+    def post(self, body):
+        self.client.post(reverse('add_tweet'), {'tweet_title': 'title', 'body': body})
+        return Tweet.objects.latest('id')
+
+    def test_extract(self):
+        self.assertEqual(
+            tags.extract("#Django and #django, not a#tag or &#39; but #py_3. cc @bob. @author"),
+            (['django', 'py_3'], ['bob', 'author']),
+        )
+
+    def test_tags_mentions_and_notification(self):
+        tweet = self.post("shipping #Django today, thanks @bob and @nobody")
+        self.assertEqual(list(tags.tag_links('DJANGO').values_list('tweet_id', flat=True)), [tweet.id])
+        self.assertEqual(list(Mention.objects.values_list('user__username', flat=True)), ['bob'])
+        self.assertTrue(Notification.objects.filter(notified_user=self.bob.profile, notify_type='mention', notify_tweet=tweet).exists())
+
+        response = self.client.get(reverse('tag_feed', args=['django']))
+        self.assertEqual([t.id for t in response.context['tweets']], [tweet.id])
+        self.assertContains(response, reverse('tag_feed', args=['django']))
+
+    def test_trending_panel(self):
+        for body in ('#django', '#django #python', '#python #django'):
+            self.post(body)
+        trending.flush()
+        self.assertEqual(TrendingBucket.objects.get(hashtag__name='django').count, 3)
+
+        response = self.client.get(reverse('home'))
+        self.assertEqual(response.context['trending'], [{'name': 'django', 'uses': 3}, {'name': 'python', 'uses': 2}])
+
+    def test_trending_is_cached_per_limit(self):
+        for body in ('#django', '#django #python', '#python #django #sqlite'):
+            self.post(body)
+        trending.flush()
+        self.assertEqual([tag['name'] for tag in trending.top(1)], ['django'])
+        self.assertEqual([tag['name'] for tag in trending.top(3)], ['django', 'python', 'sqlite'])
+        self.assertEqual([tag['name'] for tag in trending.top(1)], ['django'])
+
+    @override_settings(TRENDING_FLUSH_INTERVAL=60)
+    def test_read_flushes_counts_older_than_the_interval(self):
+        trending._last_flush = time.monotonic()
+        self.post('#django')
+        self.assertEqual(trending.top(), [])   # recorded a moment ago, waits for the interval
+        trending._last_flush -= 60
+        self.assertEqual(trending.top(), [{'name': 'django', 'uses': 1}])
+        self.assertFalse(trending._pending)
+
+
+def jpeg_upload(name='photo.jpg', size=(2000, 1000)):
+    exif = Image.Exif()
+    exif[0x010F] = 'SecretCam'   # Make
+    out = BytesIO()
+    Image.new('RGB', size, 'red').save(out, 'JPEG', exif=exif)
+    return SimpleUploadedFile(name, out.getvalue(), content_type='image/jpeg')
+
+
+class ImagePipelineTest(TestCase):
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        cache.clear()
+        self.user = User.objects.create_user('snapper', password='pass')
+        self.client.force_login(self.user)
+
+    def test_variants_written_and_metadata_stripped(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('add_tweet'), {'tweet_title': 'pic', 'body': 'look', 'tweet_image': jpeg_upload()})
+
+        tweet = Tweet.objects.get()
+        self.assertEqual(tweet.image_variants['thumb']['width'], 96)
+        self.assertEqual(tweet.image_variants['feed']['width'], 640)
+        self.assertEqual(tweet.image_variants['full']['width'], 1600)
+        self.assertIn('webp', tweet.image_variants['feed'])
+        with tweet.tweet_image.open() as original:
+            self.assertNotIn(0x010F, Image.open(original).getexif())
+
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, '640w')
+
+        variant_names = [tweet.image_variants['feed']['jpg'], tweet.tweet_image.name]
+        self.client.get(reverse('delete_tweet', args=[tweet.id]), HTTP_REFERER='/')
+        for name in variant_names:
+            self.assertFalse(tweet.tweet_image.storage.exists(name))
+
+    def test_newer_upload_wins(self):
+        profile = self.user.profile
+        profile.image = jpeg_upload('me.jpg')
+        profile.save()
+        stale = profile.image.name
+        Profile.objects.filter(id=profile.id).update(image='profile_image/other.jpg')
+
+        images.process_now(profile, 'image')
+        profile.refresh_from_db()
+        self.assertEqual(profile.image.name, 'profile_image/other.jpg')
+        self.assertEqual(profile.image_variants, {})
+        self.assertTrue(profile.image.storage.exists(stale))
+
+
+class MediaDedupTest(TestCase):
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name, IMAGE_VARIANTS={'thumb': 96}))
+        self.storage = media_storage
+        self.users = [User.objects.create_user(f'twin{i}', password='pass') for i in range(2)]
+
+    def test_same_content_stored_once_and_released_by_reference(self):
+        for user in self.users:
+            self.client.force_login(user)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse('add_tweet'), {'tweet_title': 'pic', 'body': 'same', 'tweet_image': jpeg_upload()})
+
+        first, second = Tweet.objects.order_by('id')
+        self.assertEqual(first.tweet_image.name, second.tweet_image.name)
+        self.assertEqual(first.image_variants, second.image_variants)
+        self.assertEqual(MediaBlob.objects.get(name=first.tweet_image.name).refs, 2)
+
+        self.client.get(reverse('delete_tweet', args=[first.id]), HTTP_REFERER='/')
+        self.assertTrue(self.storage.exists(second.tweet_image.name))
+        self.assertEqual(MediaBlob.objects.get(name=second.tweet_image.name).refs, 1)
+
+        self.client.get(reverse('delete_tweet', args=[second.id]), HTTP_REFERER='/')
+        self.assertFalse(self.storage.exists(second.tweet_image.name))
+        self.assertFalse(MediaBlob.objects.exists())
+
+    def test_processed_files_stay_in_the_upload_dir_layout(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_login(self.users[0])
+            self.client.post(reverse('add_tweet'), {'tweet_title': 'pic', 'body': 'look', 'tweet_image': jpeg_upload()})
+        tweet = Tweet.objects.get()
+        self.assertRegex(tweet.tweet_image.name, r'^tweet_images/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+        self.assertRegex(tweet.image_variants['thumb']['jpg'], r'^tweet_images/variants/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+
+    def test_save_rewrites_a_file_released_meanwhile(self):
+        name = self.storage.save('profile_image/a.jpg', ContentFile(b'same bytes'))
+        # a delete() of the last reference unlinked the file while this save was counting its own
+        Path(self.storage.path(name)).unlink()
+        self.assertEqual(self.storage.save('profile_image/b.jpg', ContentFile(b'same bytes')), name)
+        self.assertEqual(Path(self.storage.path(name)).read_bytes(), b'same bytes')
+        self.assertEqual(MediaBlob.objects.get(name=name).refs, 2)
+
+    def test_dedupe_existing_files(self):
+        content = jpeg_upload().read()
+        for i, user in enumerate(self.users):
+            path = Path(self.storage.location, 'profile_image', f'addy_z12_{i}.jpg')
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(content)
+            Profile.objects.filter(user=user).update(image=f'profile_image/addy_z12_{i}.jpg')
+
+        call_command('dedupe_media', stdout=StringIO())
+
+        names = set(Profile.objects.filter(user__in=self.users).values_list('image', flat=True))
+        self.assertEqual(len(names), 1)
+        self.assertEqual(MediaBlob.objects.get(name=names.pop()).refs, 2)
+        self.assertEqual(len(list(Path(self.storage.location, 'profile_image').rglob('*.jpg'))), 1)
+
+    def test_dedupe_resumes_an_interrupted_run(self):
+        content = jpeg_upload().read()
+        legacy = Path(self.storage.location, 'profile_image', 'addy_z12.jpg')
+        legacy.parent.mkdir(parents=True, exist_ok=True)
+        legacy.write_bytes(content)
+        Profile.objects.filter(user=self.users[0]).update(image='profile_image/addy_z12.jpg')
+        # a previous run got as far as copying the file, the row still names the original
+        blob = Path(self.storage.path(blob_name('profile_image', hashlib.sha256(content).hexdigest(), '.jpg')))
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        blob.write_bytes(content)
+
+        call_command('dedupe_media', stdout=StringIO())
+        call_command('dedupe_media', stdout=StringIO())
+
+        self.assertFalse(legacy.exists())
+        self.assertEqual(Profile.objects.get(user=self.users[0]).image.name, blob.relative_to(self.storage.location).as_posix())
+        self.assertEqual(MediaBlob.objects.get().refs, 1)
+
+
+class ImageUploadHandlerTest(TestCase):
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name, IMAGE_VARIANTS={'thumb': 96}))
+        self.user = User.objects.create_user('uploader', password='pass')
+        self.client.force_login(self.user)
+
+    def post(self, upload):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('add_tweet'), {'tweet_title': 'pic', 'body': 'body', 'tweet_image': upload}, follow=True)
+
+    def test_image_is_hashed_while_streamed(self):
+        upload = jpeg_upload('holiday.png')   # a JPEG whatever the name says
+        digest = hashlib.sha256(upload.read()).hexdigest()
+        upload.seek(0)
+        with override_settings(IMAGE_VARIANTS={}):
+            with self.captureOnCommitCallbacks(execute=False):
+                self.client.post(reverse('add_tweet'), {'tweet_title': 'pic', 'body': 'body', 'tweet_image': upload})
+        self.assertEqual(Tweet.objects.get().tweet_image.name, f'tweet_images/{digest[:2]}/{digest}.jpg')
+
+    def test_not_an_image_is_refused(self):
+        response = self.post(SimpleUploadedFile('notes.jpg', b'#!/bin/sh\necho not a picture\n'))
+        self.assertFalse(Tweet.objects.exists())
+        self.assertContains(response, 'not a JPEG')
+
+    @override_settings(MAX_IMAGE_UPLOAD_SIZE=1000)
+    def test_oversized_upload_is_cut_off(self):
+        response = self.post(jpeg_upload())
+        self.assertFalse(Tweet.objects.exists())
+        self.assertContains(response, 'too big')
+        self.assertFalse(list(Path(media_storage.location).rglob('*.jpg')))
+
+
+class StaticAssetsTest(TestCase):
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.root = Path(media.name)
+        (self.root / 'notes.txt').write_bytes(b'0123456789' * 100)
+
+    def test_conditional_and_range_requests(self):
+        response = self.client.get('/media/notes.txt')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=3600')
+        etag = response['ETag']
+
+        self.assertEqual(self.client.get('/media/notes.txt', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        partial = self.client.get('/media/notes.txt', HTTP_RANGE='bytes=10-19')
+        self.assertEqual(partial.status_code, 206)
+        self.assertEqual(partial['Content-Range'], 'bytes 10-19/1000')
+        self.assertEqual(b''.join(partial.streaming_content), b'0123456789')
+        self.assertEqual(self.client.get('/media/notes.txt', HTTP_RANGE='bytes=5000-').status_code, 416)
+        self.assertEqual(self.client.get('/media/.upload-x').status_code, 404)
+
+    def test_precompressed_sibling_and_immutable_blobs(self):
+        assets.precompress(self.root)
+        response = self.client.get('/media/notes.txt', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(response['Content-Type'], 'text/plain')
+
+        digest = hashlib.sha256(b'blob').hexdigest()
+        (self.root / 'tweet_images' / digest[:2]).mkdir(parents=True)
+        (self.root / 'tweet_images' / digest[:2] / f'{digest}.jpg').write_bytes(b'blob')
+        response = self.client.get(f'/media/tweet_images/{digest[:2]}/{digest}.jpg')
+        self.assertIn('immutable', response['Cache-Control'])
+
+    def test_minify_and_unbuilt_bundle(self):
+        self.assertEqual(assets.minify_js("// note\nconst url = 'http://x/*y*/';  /* gone */\n\n  go(url);\n"), "const url = 'http://x/*y*/';\ngo(url);\n")
+        self.assertEqual(assets.minify_css('a > b ,  c {\n  color : red;\n}\n/* x */'), 'a>b,c{color :red}\n')
+        html = Template("{% load bundles %}{% bundle 'bundles/feed.js' %}").render(Context())
+        self.assertEqual(html.count('<script'), len(settings.ASSET_BUNDLES['bundles/feed.js']))
+
+
+class LiveEventsTest(TestCase):
+
+    def setUp(self):
+        cache.clear()   # unread counters of earlier tests' profiles, the ids get reused
+        self.enterContext(mock.patch.object(realtime, 'hub', realtime.Hub()))
+
+    def test_hub_coalesces_and_resyncs_slow_clients(self):
+        async def scenario():
+            subscription = realtime.hub.subscribe(1, limit=3)
+            try:
+                publisher = threading.Thread(target=lambda: [
+                    realtime.hub.publish(None, {'type': 'likes', 'tweet': 7, 'count': count}, key=('likes', 7))
+                    for count in range(5)
+                ])
+                publisher.start()
+                publisher.join()
+                self.assertEqual(await subscription.next_batch(1), [{'type': 'likes', 'tweet': 7, 'count': 4}])
+
+                for n in range(4):
+                    realtime.hub.publish([1], {'type': 'tweet', 'id': n})
+                self.assertEqual(await subscription.next_batch(1), [{'type': 'resync'}])
+                self.assertEqual(await subscription.next_batch(0.01), [])
+            finally:
+                realtime.hub.unsubscribe(subscription)
+
+            stream = realtime.event_stream(2)
+            await anext(stream)
+            self.assertEqual(realtime.hub.connected(), {2})
+            await stream.aclose()   # what a client disconnect does to the response
+            self.assertEqual(realtime.hub.connected(), set())
+
+        async_to_sync(scenario)()
+
+    async def test_stream_sends_unread_count_then_likes(self):
+        author = await sync_to_async(User.objects.create_user)('author', password='pass')
+        fan = await sync_to_async(User.objects.create_user)('fan', password='pass')
+        tweet = await Tweet.objects.acreate(user=author, tweet_title='hello', body='world')
+        await self.async_client.aforce_login(author)
+
+        response = await self.async_client.get(reverse('live_events'), {'tweets': f'{tweet.id},x,{tweet.id}'})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertIn(b'event: notifications\ndata: {"type": "notifications", "unread": 0}', await anext(stream))
+
+        await sync_to_async(TweetLikes.objects.create)(user=fan, tweet=tweet)
+        await Tweet.objects.filter(id=tweet.id).aupdate(likes_count=1)
+        await sync_to_async(realtime.publish_likes)(tweet.id)
+        self.assertIn(f'"tweet": {tweet.id}, "count": 1'.encode(), await anext(stream))
+
+    def assertUnwatchedCostsNothing(self, tweet_id):
+        with self.assertNumQueries(0):
+            realtime.publish_likes(tweet_id)   # on no page, no count query either
+
+    def test_likes_only_reach_pages_showing_the_tweet(self):
+        async def scenario():
+            showing = realtime.hub.subscribe(1, tweet_ids=realtime.parse_tweet_ids('7,8'))
+            elsewhere = realtime.hub.subscribe(2, tweet_ids=realtime.parse_tweet_ids('9'))
+            try:
+                await sync_to_async(self.assertUnwatchedCostsNothing)(10)
+                await sync_to_async(realtime.publish_likes)(7, 3)
+                self.assertEqual(await showing.next_batch(1), [{'type': 'likes', 'tweet': 7, 'count': 3}])
+                self.assertEqual(await elsewhere.next_batch(0.01), [])
+            finally:
+                realtime.hub.unsubscribe(showing)
+                realtime.hub.unsubscribe(elsewhere)
+            self.assertFalse(realtime.hub.watched(7))
+
+        async_to_sync(scenario)()
+
+    @override_settings(LIVE_MAX_TWEETS=2)
+    def test_tweet_ids_are_parsed_and_capped(self):
+        self.assertEqual(realtime.parse_tweet_ids('3, x,,-4,5,6'), {3, 5})
+        self.assertEqual(realtime.parse_tweet_ids(None), frozenset())
+
+    def test_wsgi_request_is_told_not_to_reconnect(self):
+        self.client.force_login(User.objects.create_user('reader', password='pass'))
+        self.assertEqual(self.client.get(reverse('live_events')).status_code, 204)
+
+
+class JsonActionTest(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user('author', password='pass')
+        self.fan = User.objects.create_user('fan', password='pass')
+        self.tweet = Tweet.objects.create(user=self.author, tweet_title='hello', body='world')
+        self.client.force_login(self.fan)
+
+    def test_like_toggles_and_returns_the_count(self):
+        url = reverse('like_json', args=[self.tweet.id])
+        with mock.patch('tweetapp.views.notify'), CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.post(url).json(), {'tweet': self.tweet.id, 'liked': True, 'likes': 1})
+        self.assertLessEqual(len(queries), 11)   # session and user included, no page is rendered
+        self.assertEqual(self.client.post(url).json()['likes'], 0)
+        self.assertFalse(TweetLikes.objects.exists())
+
+    def test_save_and_comment(self):
+        save = reverse('save_post_json', args=[self.tweet.id])
+        self.assertTrue(self.client.post(save).json()['saved'])
+        self.assertFalse(self.client.post(save).json()['saved'])
+
+        data = self.client.post(reverse('comment_json', args=[self.tweet.id]), {'description': 'nice <b>one</b>'}).json()
+        self.assertEqual(data['comments'], 1)
+        self.assertIn('nice &lt;b&gt;one&lt;/b&gt;', data['html'])
+
+
+    def test_anonymous_gets_401_not_a_redirect(self):
+        self.client.logout()
+        response = self.client.post(reverse('like_json', args=[self.tweet.id]))
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.client.get(reverse('like_json', args=[self.tweet.id])).status_code, 401)
+
+
+class AsyncViewTest(TransactionTestCase):
+    # a transaction test, so the queries gather() sends to other threads see the rows
+
+    async def test_pages_with_concurrent_queries(self):
+        viewer = await sync_to_async(User.objects.create_user)('viewer', password='pass')
+        author = await sync_to_async(User.objects.create_user)('writer', password='pass')
+        tweet = await Tweet.objects.acreate(user=author, tweet_title='async hello', body='body')
+        await SavedPosts.objects.acreate(user=viewer, tweet=tweet)
+        await sync_to_async(timeline.fanout_tweet)(tweet)
+        await sync_to_async(TimelineEntry.objects.create)(user=viewer, tweet=tweet, created_at=tweet.created_at)
+        await sync_to_async(notifications.notify)(author.profile, viewer.profile, 'follow')
+        await self.async_client.aforce_login(viewer)
+
+        with override_settings(ASYNC_VIEW_CONCURRENCY=True):
+            home = await self.async_client.get(reverse('home'))
+            self.assertContains(home, 'async hello')
+            self.assertContains(home, 'fa-solid fa-bookmark')   # the saved ids came from another thread
+            self.assertContains(await self.async_client.get(reverse('prof', args=[author.id])), 'async hello')
+            self.assertContains(await self.async_client.get(reverse('notification_list')), 'writer')
+            suggestions = await self.async_client.get(reverse('suggest_users'), {'username': 'wri'})
+            self.assertEqual(suggestions.json(), [{'username': 'writer'}])
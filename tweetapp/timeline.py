@@ -0,0 +1,168 @@
+"""
+Home timeline store.
+
+Every tweet is pushed into the timeline of each follower when it is posted (fan-out on write),
+so home() only reads an already sorted slice of TimelineEntry rows. Authors followed by more than
+TIMELINE_FANOUT_LIMIT profiles are skipped at write time and their tweets are merged in when the
+timeline is read (fan-out on read), so one popular post does not turn into thousands of inserts.
+A page reads page + 1 entries and page + 1 recent tweets per followed celebrity, each with a
+LIMITed index seek past the cursor, and sorts only those (home_queryset).
+
+Fan-out only adds rows. A timeline is cut back to TIMELINE_MAX_LENGTH when its owner reads the
+first page (at most once per TIMELINE_TRIM_INTERVAL), and trim_timelines() does every timeline
+(the scheduler, or the backfill_timelines command).
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from tweet.utils import decode_cursor, keyset_filter, keyset_values
+
+from . import graph
+from .models import Profile, TimelineEntry, Tweet
+
+ORDERING = ('-created_at', '-id')
+ENTRY_ORDERING = ('-created_at', '-tweet_id')
+
+
+def fanout_limit():
+    return getattr(settings, 'TIMELINE_FANOUT_LIMIT', 5000)
+
+
+def max_length():
+    return getattr(settings, 'TIMELINE_MAX_LENGTH', 800)
+
+
+def page_size():
+    return getattr(settings, 'TIMELINE_PAGE_SIZE', 20)
+
+
+def trim_interval():
+    return getattr(settings, 'TIMELINE_TRIM_INTERVAL', 60 * 60)
+
+
+def fanout_tweet(tweet):
+    author = tweet.user.profile
+    follower_ids = list(author.followed_by.values_list('user_id', flat=True)[:fanout_limit() + 1])
+
+    if len(follower_ids) > fanout_limit():
+        # too many followers, readers pick this tweet up at read time, only the author gets the row
+        follower_ids = [tweet.user_id]
+    elif tweet.user_id not in follower_ids:
+        follower_ids.append(tweet.user_id)
+
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user_id=user_id, tweet=tweet, created_at=tweet.created_at) for user_id in follower_ids],
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+
+
+def follow_author(follower_user, author_user):
+    # copy the recent tweets of a newly followed author so they show up without waiting for a new post
+    recent = Tweet.objects.filter(user=author_user).order_by('-created_at').values_list('id', 'created_at')[:max_length()]
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user=follower_user, tweet_id=tweet_id, created_at=created_at) for tweet_id, created_at in recent],
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+
+
+def unfollow_author(follower_user, author_user):
+    TimelineEntry.objects.filter(user=follower_user, tweet__user=author_user).delete()
+
+
+def celebrity_user_ids(user):
+    """
+    User ids of the followed authors whose tweets were not fanned out on write, classified with the
+    cached follower counts (graph.follower_counts) rather than a COUNT per followed author.
+    """
+    profile_id = user.profile.id
+    followed = [other_id for other_id in graph.following_ids(profile_id) if other_id != profile_id]
+    celebrities = [other_id for other_id, n in graph.follower_counts(followed).items() if n > fanout_limit()]
+    if not celebrities:
+        return []
+    return sorted(Profile.objects.filter(id__in=celebrities).values_list('user_id', flat=True))
+
+
+def _recent(queryset, ordering, values, per_page):
+    # one index seek: the rows after the cursor, newest first, a page and one at most
+    queryset = queryset.order_by(*ordering)
+    values = keyset_values(queryset, ordering, values)
+    if values is not None:
+        # the redundant created_at bound lets the seek start at the cursor, the OR alone can't
+        queryset = queryset.filter(keyset_filter(queryset, ordering, values), created_at__lte=values[0])
+    return queryset[:per_page + 1]
+
+
+def home_queryset(user_id, celebrity_ids, cursor=None, per_page=20):
+    """
+    The candidates for one home page: the next per_page + 1 timeline entries of user_id and the
+    next per_page + 1 tweets of each celebrity, all after `cursor`. Each source is a LIMITed seek
+    on its (user, -created_at, -id) index, so sorting the union costs at most
+    (1 + len(celebrity_ids)) * (per_page + 1) rows however long the timeline is.
+    """
+    values = decode_cursor(cursor)
+    entries = _recent(TimelineEntry.objects.filter(user_id=user_id), ENTRY_ORDERING, values, per_page)
+    query = Q(id__in=entries.values('tweet_id'))
+    for celebrity_id in celebrity_ids:
+        query |= Q(id__in=_recent(Tweet.objects.filter(user_id=celebrity_id), ORDERING, values, per_page).values('id'))
+    return Tweet.objects.filter(query).order_by(*ORDERING)
+
+
+def home_timeline(user, cursor=None, per_page=None):
+    """
+    Tweets for the home page of `user` after `cursor`, newest first. Paginate the result with the
+    same cursor and per_page (tweet.utils.paginate_queryset), it only holds that page's candidates.
+    """
+    if cursor is None:
+        trim_if_due(user)
+    return home_queryset(user.id, celebrity_user_ids(user), cursor, per_page or page_size())
+
+
+def rebuild_timeline(user):
+    """Refill the timeline of `user` from the authors it follows and trim it to TIMELINE_MAX_LENGTH."""
+    celebrities = set(celebrity_user_ids(user))
+    author_ids = set(Profile.objects.filter(followed_by__user=user).values_list('user_id', flat=True))
+    author_ids = (author_ids - celebrities) | {user.id}
+
+    recent = (
+        Tweet.objects.filter(user_id__in=author_ids)
+        .order_by('-created_at', '-id')
+        .values_list('id', 'created_at')[:max_length()]
+    )
+    created = TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user=user, tweet_id=tweet_id, created_at=created_at) for tweet_id, created_at in recent],
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+    return len(created), trim_timeline(user)
+
+
+def trim_timeline(user):
+    entries = TimelineEntry.objects.filter(user=user)
+    # the first entry past the limit, it and everything older goes
+    boundary = entries.order_by(*ENTRY_ORDERING).values_list('created_at', 'tweet_id')[max_length():max_length() + 1]
+    boundary = list(boundary)
+    if not boundary:
+        return 0
+    created_at, tweet_id = boundary[0]
+    deleted, _ = entries.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, tweet_id__lte=tweet_id)).delete()
+    return deleted
+
+
+def trim_if_due(user):
+    # fan-out only adds rows and the scheduler is off by default: the reader's own timeline is cut
+    # back when the first page is read, at most once per TIMELINE_TRIM_INTERVAL
+    if cache.add(f'timeline:trimmed:{user.id}', True, trim_interval()):
+        trim_timeline(user)
+
+
+def trim_timelines():
+    """Trim every timeline that grew past TIMELINE_MAX_LENGTH, fan-out only ever adds rows. Returns rows deleted."""
+    over = (
+        TimelineEntry.objects.order_by().values('user_id')
+        .annotate(n=Count('id')).filter(n__gt=max_length())
+        .values_list('user_id', flat=True)
+    )
+    return sum(trim_timeline(user_id) for user_id in list(over))
@@ -0,0 +1,111 @@
+"""
+Trending hashtags for the home page panel.
+
+record() counts tags into per-minute buckets held in memory, which costs no query on the
+add_tweet path. flush() adds the pending counts to TrendingBucket rows, so every process
+contributes, at most every TRENDING_FLUSH_INTERVAL seconds (from record() itself, from top()
+when counts have waited longer than that, or from the scheduler when it runs). top() sums the
+buckets of the last TRENDING_WINDOW seconds, a window that slides a minute at a time, and caches
+the answer per limit for TRENDING_CACHE_TIMEOUT seconds. It never reads the tweets table.
+"""
+import logging
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import TrendingBucket
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY = 'trending_hashtags'
+
+_pending = Counter()   # (hashtag_id, minute) -> uses not flushed yet
+_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+
+def window():
+    return timedelta(seconds=getattr(settings, 'TRENDING_WINDOW', 60 * 60))
+
+
+def flush_interval():
+    return getattr(settings, 'TRENDING_FLUSH_INTERVAL', 60)
+
+
+def _minute(now=None):
+    return (now or timezone.now()).replace(second=0, microsecond=0)
+
+
+def _flush_due():
+    # call with _lock held
+    return bool(_pending) and time.monotonic() - _last_flush >= flush_interval()
+
+
+def record(hashtag_ids):
+    minute = _minute()
+    with _lock:
+        for hashtag_id in hashtag_ids:
+            _pending[(hashtag_id, minute)] += 1
+        due = _flush_due()
+    if due:
+        flush()
+
+
+def _add(hashtag_id, minute, count):
+    bucket = TrendingBucket.objects.filter(hashtag_id=hashtag_id, minute=minute)
+    if bucket.update(count=F('count') + count):
+        return
+    try:
+        with transaction.atomic():
+            TrendingBucket.objects.create(hashtag_id=hashtag_id, minute=minute, count=count)
+    except IntegrityError:
+        # another process created the bucket between the update and the insert
+        bucket.update(count=F('count') + count)
+
+
+def flush():
+    """Write the pending counts and drop buckets that slid out of the window. Returns buckets written."""
+    global _last_flush
+    with _lock:
+        batch = dict(_pending)
+        _pending.clear()
+        _last_flush = time.monotonic()
+
+    try:
+        for (hashtag_id, minute), count in batch.items():
+            _add(hashtag_id, minute, count)
+        TrendingBucket.objects.filter(minute__lt=_minute() - window()).delete()
+    except DatabaseError:
+        logger.exception("flushing trending counters failed, keeping them for the next flush")
+        with _lock:
+            _pending.update(batch)
+        return 0
+    return len(batch)
+
+
+def top(limit=None):
+    """[{'name': ..., 'uses': ...}] most used tags in the window, busiest first."""
+    limit = limit or getattr(settings, 'TRENDING_SIZE', 5)
+    with _lock:
+        due = _flush_due()
+    # counts waiting longer than a flush interval (no tweet since, no scheduler) are written
+    # first, and the cached answer that misses them is not used
+    key = f'{CACHE_KEY}:{limit}'
+    tags = None if due and flush() else cache.get(key)
+    if tags is None:
+        tags = [
+            {'name': row['hashtag__name'], 'uses': row['uses']}
+            for row in TrendingBucket.objects.filter(minute__gte=_minute() - window())
+            .values('hashtag__name')
+            .annotate(uses=Sum('count'))
+            .order_by('-uses', 'hashtag__name')[:limit]
+        ]
+        cache.set(key, tags, getattr(settings, 'TRENDING_CACHE_TIMEOUT', 60))
+    return tags
@@ -0,0 +1,129 @@
+"""
+Upload handler for image fields (tweet_image, Profile.image).
+
+ImageUploadHandler is first in FILE_UPLOAD_HANDLERS and takes over any file posted under one of
+IMAGE_UPLOAD_FIELDS. Each chunk goes straight into a temporary file and is hashed as it arrives,
+so nothing bigger than a chunk is held in memory and ContentAddressedStorage can move the file
+into place without reading it again. The first bytes are checked against the known image
+signatures, and an upload that is not an image is skipped right away. A request whose
+Content-Length is already over MAX_IMAGE_UPLOAD_SIZE is cut off before any of the file is read,
+and a chunked upload is cut off as soon as it crosses the cap.
+
+The reason for a refusal is kept in request.upload_rejections. Views call image_rejected()
+before touching request.FILES, which turns it into a message for the user.
+"""
+import hashlib
+import posixpath
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.files.uploadhandler import SkipFile, StopFutureHandlers, StopUpload, TemporaryFileUploadHandler
+from django.template.defaultfilters import filesizeformat
+
+FORM_OVERHEAD = 64 * 1024   # room for the other form fields and multipart headers in Content-Length
+SNIFF_LENGTH = 12
+
+SIGNATURES = (
+    (b'\xff\xd8\xff', 'image/jpeg', '.jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png', '.png'),
+    (b'GIF87a', 'image/gif', '.gif'),
+    (b'GIF89a', 'image/gif', '.gif'),
+)
+
+
+def max_size():
+    return getattr(settings, 'MAX_IMAGE_UPLOAD_SIZE', 5 * 1024 * 1024)
+
+
+def image_fields():
+    return getattr(settings, 'IMAGE_UPLOAD_FIELDS', ('tweet_image', 'image'))
+
+
+def sniff(head):
+    """(content type, extension) from the first bytes of a file, None when it is no image we accept."""
+    for signature, content_type, ext in SIGNATURES:
+        if head.startswith(signature):
+            return content_type, ext
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp', '.webp'
+    if head[4:12] in (b'ftypavif', b'ftypavis'):
+        return 'image/avif', '.avif'
+    return None
+
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        self.request_length = content_length or 0
+        if not hasattr(self.request, 'upload_rejections'):
+            self.request.upload_rejections = {}
+
+    def reject(self, reason):
+        self.request.upload_rejections[self.field_name] = reason
+        self.upload_interrupted()
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        self.active = field_name in image_fields()
+        if not self.active:
+            return   # not ours, the default handlers take it
+
+        self.field_name = field_name
+        if self.request_length > max_size() + FORM_OVERHEAD:
+            self.request.upload_rejections[field_name] = 'too_large'
+            raise StopUpload(connection_reset=True)   # never read the body of an upload we will refuse
+
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        self.hasher = hashlib.sha256()
+        self.head = b''
+        self.image_type = None
+        raise StopFutureHandlers
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.active:
+            return raw_data
+
+        if start + len(raw_data) > max_size():
+            self.reject('too_large')
+            raise StopUpload(connection_reset=True)
+
+        if self.image_type is None:
+            self.head += raw_data[:SNIFF_LENGTH]
+            if len(self.head) >= SNIFF_LENGTH:
+                self.image_type = sniff(self.head)
+                if self.image_type is None:
+                    self.reject('not_an_image')
+                    raise SkipFile
+
+        self.hasher.update(raw_data)
+        self.file.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if not self.active:
+            return None
+        self.image_type = self.image_type or sniff(self.head)
+        upload = super().file_complete(file_size)
+        upload.sha256 = self.hasher.hexdigest()
+        upload.image_type = self.image_type
+        if self.image_type:
+            # the extension follows the content, not whatever the client called the file
+            upload.content_type = self.image_type[0]
+            upload.name = posixpath.splitext(upload.name)[0] + self.image_type[1]
+        else:
+            self.request.upload_rejections[self.field_name] = 'not_an_image'
+        return upload
+
+
+REJECTION_MESSAGES = {
+    'too_large': "That image is too big, the limit is {limit}.",
+    'not_an_image': "That file is not a JPEG, PNG, GIF, WebP or AVIF image.",
+}
+
+
+def image_rejected(request, field_name):
+    """True (and an error message queued for the user) when the upload under field_name was refused."""
+    request.FILES   # make sure the body has been parsed and the handlers have run
+    reason = getattr(request, 'upload_rejections', {}).get(field_name)
+    if reason:
+        messages.error(request, REJECTION_MESSAGES[reason].format(limit=filesizeformat(max_size())))
+    return bool(reason)
@@ -5,23 +5,41 @@ appname="tweetapp"
 urlpatterns = [
 
     path('',home,name='home'),
+    path('more/',home,{'template_name':'front_components/home_tweets.html'},name='home_more'),
     path('profile_list/',profile_list,name='profile_list'),
     path('profile/<int:pk>',profile,name='prof'),
+    path('profile/<int:pk>/more',profile,{'template_name':'front_components/profile_tweets.html'},name='prof_more'),
+    path('profile/<int:pk>/followers',follow_list,{'direction':'followers'},name='followers'),
+    path('profile/<int:pk>/followers/more',follow_list,{'direction':'followers','template_name':'front_components/follow_rows.html'},name='followers_more'),
+    path('profile/<int:pk>/following',follow_list,{'direction':'following'},name='following'),
+    path('profile/<int:pk>/following/more',follow_list,{'direction':'following','template_name':'front_components/follow_rows.html'},name='following_more'),
     path('add_tweet/',add_tweet,name='add_tweet'),
     path('add_likes/<int:id>',add_likes,name="add_likes"),
     path('add_comments/<int:id>', add_comments, name="add_comments"),
     path('follow_unfollow/<int:id>',follow_unfollow,name="follow_unfollow"),
+    path('api/like/<int:id>/',like_json,name="like_json"),
+    path('api/save/<int:id>/',save_post_json,name="save_post_json"),
+    path('api/comment/<int:id>/',comment_json,name="comment_json"),
+    path('api/follow/<int:id>/',follow_json,name="follow_json"),
     path('search_user/',search_user,name="search_user"),
     path('suggest-users/', suggest_users, name='suggest_users'),
+    path('search/',search,name="search"),
+    path('tag/<str:name>/',tag_feed,name="tag_feed"),
+    path('tag/<str:name>/more/',tag_feed,{'template_name':'front_components/home_tweets.html'},name="tag_feed_more"),
+    path('search/more/',search,{'template_name':'front_components/home_tweets.html'},name="search_more"),
     path('savepost/<int:id>',add_Save_Post,name="add_post"),
     path('saved_posts/',saved_posts,name="saved_posts"),
+    path('saved_posts/more/',saved_posts,{'template_name':'front_components/saved_tweets.html'},name="saved_posts_more"),
     path('delete_tweet/<int:pk>/',delete_tweet,name="delete_tweet"),
     path('update_profile/<str:username>/',update_profile,name="update_profile"),
     path('login/',signin,name="signin"),
     path('register/',register,name="signup"),
     path('logout/',logout_user,name="logout"),
+    path('cache_stats/',tweet_card_cache_stats,name="tweet_card_cache_stats"),
     path('notifications/',user_notifications,name="notification_list"),
     path('mark_as_read/<int:id>/',mark_as_read_notification,name="mark_as_read_notification"),
+    path('live/',live_events,name="live_events"),
+    path('mark_all_as_read/',mark_all_notifications_read,name="mark_all_notifications_read"),
     path('password_reset/',auth_view.PasswordResetView.as_view(),name="password_reset"),
     path('password_reset_done/',auth_view.PasswordResetDoneView.as_view(),name="password_reset_done"),
     path('password_reset_confirm/<uidb64>/<token>',auth_view.PasswordResetConfirmView.as_view(),name="password_reset_confirm"),
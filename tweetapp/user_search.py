@@ -0,0 +1,267 @@
+"""
+Username typeahead index used by suggest_users.
+
+Usernames are kept lowercased in one sorted list, so every name starting with a prefix is a
+contiguous slice found with two binary searches (the flattened form of a prefix trie, without a
+node object per character). Matches are ranked exact match first, then by follower count; the
+whole slice is ranked with a bounded heap (heapq.nsmallest), so a short prefix still finds its
+most followed users wherever they sort. One and two letter prefixes match a large share of all
+users, so their top MEMO_SIZE is kept per prefix and updated in place as follower counts change:
+a user whose rank improved is slotted in, and only a listed user dropping or leaving (which can
+let an unlisted one in) sends the prefix back to a full scan. With USER_SEARCH_TRIGRAM on, an in-memory SQLite FTS5
+table with the trigram tokenizer fills the remaining slots with infix matches ("dev" -> "webdev").
+
+The index lives in the process. It is built on first use, kept current by the User signals and
+the follows relation, and rebuilt every USER_SEARCH_REFRESH seconds by the scheduler to pick up
+changes made in other processes.
+"""
+import bisect
+import heapq
+import logging
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Profile
+
+logger = logging.getLogger(__name__)
+
+MEMO_PREFIX_LENGTH = 2
+MEMO_SIZE = 50   # ranked matches kept per memoised prefix, more than a typeahead ever shows
+
+
+class TrigramIndex:
+    """Infix matches through an in-memory FTS5 trigram table, None when FTS5 is not compiled in."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(':memory:', check_same_thread=False)
+        self.db.execute("CREATE VIRTUAL TABLE names USING fts5(username, tokenize='trigram')")
+
+    @classmethod
+    def create(cls):
+        try:
+            return cls()
+        except sqlite3.OperationalError:
+            logger.warning("SQLite has no FTS5 trigram tokenizer, user search falls back to prefix matches only")
+            return None
+
+    def load(self, rows):
+        with self.lock:
+            self.db.executemany("INSERT INTO names (rowid, username) VALUES (?, ?)", rows)
+
+    def put(self, user_id, username):
+        with self.lock:
+            self.db.execute("DELETE FROM names WHERE rowid = ?", (user_id,))
+            self.db.execute("INSERT INTO names (rowid, username) VALUES (?, ?)", (user_id, username))
+
+    def remove(self, user_id):
+        with self.lock:
+            self.db.execute("DELETE FROM names WHERE rowid = ?", (user_id,))
+
+    def search(self, query, limit):
+        if len(query) < 3:   # the trigram tokenizer needs at least three characters
+            return []
+        phrase = '"' + query.replace('"', '""') + '"'
+        with self.lock:
+            return [row[0] for row in self.db.execute(
+                "SELECT rowid FROM names WHERE names MATCH ? LIMIT ?", (phrase, limit)
+            )]
+
+
+class UsernameIndex:
+
+    def __init__(self, users, followers, trigram=False):
+        # users: iterable of (user_id, username)
+        self.lock = threading.RLock()
+        self.names = {}
+        self.followers = dict(followers)
+        for user_id, username in users:
+            self.names[user_id] = username
+        self.keys = sorted((username.lower(), user_id) for user_id, username in self.names.items())
+        self.memo = {}
+        self.trigram = TrigramIndex.create() if trigram else None
+        if self.trigram:
+            self.trigram.load(self.names.items())
+        self.built_at = time.monotonic()
+
+    @classmethod
+    def from_database(cls):
+        users = User.objects.values_list('id', 'username').iterator(chunk_size=5000)
+        followers = (
+            Profile.objects.annotate(total=Count('followed_by'))
+            .values_list('user_id', 'total')
+            .iterator(chunk_size=5000)
+        )
+        return cls(users, followers, trigram=getattr(settings, 'USER_SEARCH_TRIGRAM', True))
+
+    def _sort_key(self, prefix, user_id):
+        name = self.names[user_id].lower()
+        return (name != prefix, -self.followers.get(user_id, 0), name)
+
+    def _memo_prefixes(self, name):
+        return [name[:length] for length in range(1, min(len(name), MEMO_PREFIX_LENGTH) + 1)]
+
+    def _promote(self, user_id):
+        # user_id ranks higher than before (more followers, new name): slot it into the lists it now makes
+        for prefix in self._memo_prefixes(self.names[user_id].lower()):
+            ranked = self.memo.get(prefix)
+            if ranked is None:
+                continue
+            if user_id not in ranked:
+                if len(ranked) >= MEMO_SIZE and self._sort_key(prefix, user_id) >= self._sort_key(prefix, ranked[-1]):
+                    continue
+                ranked.append(user_id)
+            ranked.sort(key=lambda other: self._sort_key(prefix, other))
+            del ranked[MEMO_SIZE:]
+
+    def _demote(self, name, user_id, gone=False):
+        # a listed user ranking lower (or leaving the prefix) may let in one the list doesn't hold
+        for prefix in self._memo_prefixes(name):
+            ranked = self.memo.get(prefix)
+            if ranked is None or user_id not in ranked:
+                continue
+            if len(ranked) >= MEMO_SIZE:
+                del self.memo[prefix]   # rescanned on the next search
+            elif gone:
+                ranked.remove(user_id)   # a short list holds every match, nothing can take the slot
+            else:
+                ranked.sort(key=lambda other: self._sort_key(prefix, other))
+
+    def put(self, user_id, username):
+        with self.lock:
+            old = self.names.get(user_id)
+            if old == username:
+                return
+            if old is not None:
+                self._remove_key(old.lower(), user_id)
+            self.names[user_id] = username
+            bisect.insort(self.keys, (username.lower(), user_id))
+            self._promote(user_id)
+            if self.trigram:
+                self.trigram.put(user_id, username)
+
+    def remove(self, user_id):
+        with self.lock:
+            old = self.names.pop(user_id, None)
+            if old is not None:
+                self._remove_key(old.lower(), user_id)
+            self.followers.pop(user_id, None)
+            if self.trigram:
+                self.trigram.remove(user_id)
+
+    def _remove_key(self, name, user_id):
+        position = bisect.bisect_left(self.keys, (name, user_id))
+        if position < len(self.keys) and self.keys[position] == (name, user_id):
+            del self.keys[position]
+        self._demote(name, user_id, gone=True)
+
+    def adjust_followers(self, user_id, delta):
+        with self.lock:
+            self.followers[user_id] = max(self.followers.get(user_id, 0) + delta, 0)
+            name = self.names.get(user_id)
+            if name and delta > 0:
+                self._promote(user_id)
+            elif name and delta < 0:
+                self._demote(name.lower(), user_id)
+
+    def _rank(self, prefix, limit):
+        start = bisect.bisect_left(self.keys, (prefix,))
+        end = bisect.bisect_left(self.keys, (prefix + '\uffff',), start)
+        # every match is considered, the heap only ever holds `limit` of them
+        best = heapq.nsmallest(
+            limit, self.keys[start:end], key=lambda key: (key[0] != prefix, -self.followers.get(key[1], 0), key[0]),
+        )
+        return [user_id for _, user_id in best]
+
+    def search(self, query, limit=10):
+        prefix = query.strip().lower()
+        if not prefix:
+            return []
+        with self.lock:
+            if len(prefix) <= MEMO_PREFIX_LENGTH and limit <= MEMO_SIZE:
+                ranked = self.memo.get(prefix)
+                if ranked is None:
+                    ranked = self.memo[prefix] = self._rank(prefix, MEMO_SIZE)
+                ranked = ranked[:limit]
+            else:
+                ranked = self._rank(prefix, limit)
+
+            if self.trigram and len(ranked) < limit:
+                seen = set(ranked)
+                infix = [user_id for user_id in self.trigram.search(prefix, limit * 5) if user_id not in seen]
+                infix.sort(key=lambda user_id: -self.followers.get(user_id, 0))
+                ranked += infix[:limit - len(ranked)]
+
+            return [self.names[user_id] for user_id in ranked if user_id in self.names]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = UsernameIndex.from_database()
+        return _index
+
+
+def loaded_index():
+    # signal handlers only update an index that exists, they never trigger the initial build
+    return _index
+
+
+def refresh():
+    global _index
+    if _index is None:
+        return
+    index = UsernameIndex.from_database()
+    with _index_lock:
+        _index = index
+
+
+def suggest(query, limit=10):
+    return get_index().search(query, limit)
+
+
+@receiver(post_save, sender=User)
+def index_username(sender, instance, **kwargs):
+    index = loaded_index()
+    if index is not None:
+        index.put(instance.id, instance.username)
+
+
+@receiver(post_delete, sender=User)
+def unindex_username(sender, instance, **kwargs):
+    index = loaded_index()
+    if index is not None:
+        index.remove(instance.id)
+
+
+@receiver(m2m_changed, sender=Profile.follows.through)
+def count_followers(sender, instance, action, reverse, pk_set, **kwargs):
+    # post_clear carries no ids, the periodic refresh corrects the counts after a clear
+    index = loaded_index()
+    if index is None or not pk_set or action not in ('post_add', 'post_remove'):
+        return
+    delta = 1 if action == 'post_add' else -1
+    if reverse:
+        # followed_by.add(...) on the followed profile
+        changes = [(instance.user_id, delta * len(pk_set))]
+    else:
+        changes = [(user_id, delta) for user_id in Profile.objects.using(kwargs['using']).filter(id__in=pk_set).values_list('user_id', flat=True)]
+
+    def adjust():
+        # counted once the follow commits, a rolled back one leaves the ranking alone
+        for user_id, change in changes:
+            index.adjust_followers(user_id, change)
+    transaction.on_commit(adjust, using=kwargs['using'])
@@ -1,4 +1,4 @@
-from django.shortcuts import get_object_or_404, render,HttpResponse,redirect
+from django.shortcuts import aget_object_or_404, get_object_or_404, render,HttpResponse,redirect
 from .models import *
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
@@ -9,7 +9,28 @@ from .forms import UpdateProfileForm
 import os
 from django.core.files.storage import default_storage
 from django.conf import settings
-from django.db.models import OuterRef, Subquery
+from django.db.models import OuterRef, Subquery, F
+from . import timeline
+from .feed import feed_queryset, load_feed, saved_tweet_ids
+from .cards import bump_card_version, card_stats
+from .notifications import attach_recent_actors, mark_all_read, mark_read, notify
+from django.contrib.admin.views.decorators import staff_member_required
+from tweet.utils import apaginate_queryset, encode_cursor, paginate_queryset
+from .user_search import suggest
+from . import user_search
+from .search import search_tweets
+from . import images, tags, trending
+from .uploads import image_rejected
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import require_POST
+from django.template.loader import render_to_string
+from django.db import IntegrityError, transaction
+from functools import wraps
+from django.http import StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
+from . import accounts, aio, follows, graph, realtime, recommendations
+from .notifications import unread_count
 # Create your views here.
 
 
@@ -26,63 +47,96 @@ from django.db.models import OuterRef, Subquery
 #         return None 
 
 
-def home(request):
-    if request.user.is_authenticated:
-        saved_posts = SavedPosts.objects.filter(user = request.user)
-        list_id_of_saved_posts=saved_posts.values_list('tweet_id',flat=True)
-        tweets = Tweet.objects.all().order_by('-created_at')
-        print(list_id_of_saved_posts)
-        return render(request,'home.html',{'tweets':tweets or None,'list_id_of_saved_posts':list_id_of_saved_posts})
+async def home(request, template_name='home.html'):
+    user = await aio.request_user(request)
+    if user.is_authenticated:
+        cursor = request.GET.get('cursor')
+        # bounded candidates for this page only: timeline entries plus a recent slice per followed celebrity
+        home_tweets = await sync_to_async(timeline.home_timeline)(user, cursor, settings.TIMELINE_PAGE_SIZE)
+        page = await apaginate_queryset(feed_queryset(home_tweets), cursor, settings.TIMELINE_PAGE_SIZE)
+        # the cards, the bookmarks and the trending panel only need the page, fetch them side by side
+        tweets, list_id_of_saved_posts, trending_tags, following_count = await aio.gather(
+            lambda: load_feed(page['results']),
+            lambda: saved_tweet_ids(user, page['results']),
+            trending.top,
+            lambda: graph.following_count(user.profile.id),
+        )
+        return await sync_to_async(render)(request,template_name,{'tweets':tweets or None,'list_id_of_saved_posts':list_id_of_saved_posts,'next_cursor':page['next_cursor'],'trending':trending_tags,'following_count':following_count})
     else:
-        return render(request,'home.html')
+        return await sync_to_async(render)(request,template_name)
   
 
 
 def profile_list(request):
     if request.user.is_authenticated:     
-        profiles = Profile.objects.exclude(user=request.user)
-        return render(request, 'profile_list.html', {"profiles": profiles})
+        suggestions = recommendations.for_profile(request.user.profile.id)
+        return render(request, 'profile_list.html', {"suggestions": suggestions})
     else:   
         messages.warning(request, "You must be logged into this Page ...")
         return redirect('home')
 
 
-def profile(request,pk):
-    if request.user.is_authenticated:
-        profile = get_object_or_404(Profile,user_id=pk)
-        if profile:
-            tweets = Tweet.objects.filter(user = profile.user).order_by('-created_at')
+async def profile(request,pk,template_name='profile.html'):
+    user = await aio.request_user(request)
+    if user.is_authenticated:
+        profile = await aget_object_or_404(Profile.objects.select_related('user'),user_id=pk)
+        page = await apaginate_queryset(feed_queryset(Tweet.objects.filter(user_id=profile.user_id)), request.GET.get('cursor'), settings.TIMELINE_PAGE_SIZE)
 
-            return render(request,'profile.html',{'profile':profile,'tweets':tweets})
-        else:
-            return render(request,'notexists.html')
+        tweets, list_id_of_saved_posts, counts, is_following = await aio.gather(
+            lambda: load_feed(page['results']),
+            lambda: saved_tweet_ids(user, page['results']),
+            lambda: (graph.following_count(profile.id), graph.follower_count(profile.id)),
+            lambda: graph.is_following(user.profile.id, profile.id),
+        )
+
+        return await sync_to_async(render)(request,template_name,{
+            'profile':profile,'tweets':tweets,'list_id_of_saved_posts':list_id_of_saved_posts,'next_cursor':page['next_cursor'],
+            'following_count':counts[0],'followers_count':counts[1],'is_following':is_following,
+        })
 
     else:
         messages.warning(request, "You must be logged into this Page ...")
         return redirect('home')
 
+FOLLOW_LISTS = {
+    # direction: (column holding the listed profile, column holding the rows, page title)
+    'followers': ('to_profile_id', 'from_profile_id', 'Followers'),
+    'following': ('from_profile_id', 'to_profile_id', 'Following'),
+}
+
+
+@login_required(login_url='/login/')
+def follow_list(request, pk, direction, template_name='follow_list.html'):
+    profile = get_object_or_404(Profile.objects.select_related('user'), user_id=pk)
+    own, other, title = FOLLOW_LISTS[direction]
+    # seek on the through table by its id (newest follow first), the self-follow every profile has is left out
+    edges = graph.Follows.objects.filter(**{own: profile.id}).exclude(from_profile_id=F('to_profile_id')).only('id', other)
+    page = paginate_queryset(edges, request.GET.get('cursor'), settings.FOLLOW_LIST_PAGE_SIZE, ordering=('-id',))
+    ids = [getattr(edge, other) for edge in page['results']]
+    found = Profile.objects.select_related('user').in_bulk(ids)
+    return render(request, template_name, {
+        'profile': profile, 'direction': direction, 'title': title,
+        'rows': [found[profile_id] for profile_id in ids if profile_id in found],
+        'next_cursor': page['next_cursor'],
+        # the follow button of every row from the viewer's cached following array, no query per row
+        'viewer_following': graph.follow_states(request.user.profile.id, ids),
+        'following_count': graph.following_count(profile.id),
+        'followers_count': graph.follower_count(profile.id),
+    })
+
+def _set_follow(request, target, action):
+    """Follow or unfollow target as request.user ("unfollow" unfollows, anything else follows). Returns (following, followers of target)."""
+    following = action != "unfollow"
+    follows.set_following(request.user.profile, target, following)
+    return following, graph.follower_count(target.id)
+
+
+@login_required(login_url='/login/')
 def follow_unfollow(request,id):
-        profile_follow_unfollow = get_object_or_404(Profile,user_id=id)
+        profile_follow_unfollow = get_object_or_404(Profile.objects.select_related('user'),user_id=id)
         if request.method == "POST":
-            current_user_profile  = request.user.profile
-            action = request.POST.get('follow',None)
-            if action=="unfollow":
-                current_user_profile.follows.remove(profile_follow_unfollow)
-                Notification.objects.create(
-                    notify_by=current_user_profile,  
-                    notified_user=profile_follow_unfollow,  
-                    notify_type="unfollow"
-                )
-            else:
-                current_user_profile.follows.add(profile_follow_unfollow) 
-                Notification.objects.create(
-                        notify_by=current_user_profile,  
-                        notified_user=profile_follow_unfollow,  
-                        notify_type="follow"
-                    )
-                
-            current_user_profile.save()  
-            return profile(request,id)
+            _set_follow(request, profile_follow_unfollow, request.POST.get('follow',None))
+            return redirect('prof',pk=id)
         return render(request,'profile.html')
 
 # @login_required(login_url='/login/')     
@@ -91,6 +145,8 @@ def add_tweet(request):
         logged_user = request.user
 
         if request.method ==  "POST":
+            if image_rejected(request, 'tweet_image'):
+                return redirect('home')
             tweet_title = request.POST.get('tweet_title') or None
             tweet_body = request.POST.get('body')  or None
             tweet_image = request.FILES.get('tweet_image')  or None
@@ -102,6 +158,10 @@ def add_tweet(request):
             new_tweet.tweet_image = tweet_image
             
             new_tweet.save()
+            timeline.fanout_tweet(new_tweet)
+            tags.index_tweet(new_tweet)
+            images.process_upload(new_tweet, 'tweet_image')
+            realtime.publish_tweet(new_tweet)
             messages.success(request, 'Your tweet has been posted! Successfully')
             return redirect('home')
     else:
@@ -130,9 +190,12 @@ def delete_tweet(request,pk):
     #         os.remove(tweet_image_path)    
     
     if tweet_image:
+        images.discard_variants(tweet)
         tweet_image.delete()
 
+    tweet_id = tweet.id
     tweet.delete()
+    bump_card_version(tweet_id)
     next_url = request.META.get("HTTP_REFERER")
     messages.success(request,"Tweet deleted successfully")
     return redirect (next_url)
@@ -141,46 +204,57 @@ def delete_tweet(request,pk):
 
 
 
-def add_likes(request,id):
-    tweet = get_object_or_404(Tweet,id=id)
-    if tweet:
-        like, created = TweetLikes.objects.get_or_create(user=request.user, tweet=tweet)
-        print(f"Like created: {created}, Total Likes: {tweet.like_count()}") 
-        # print(Notification.objects.all().values())
-        if created:
-            Notification.objects.create(
+def _toggle_like(request, tweet):
+    """Like tweet, or take the like back if it was liked already. Returns (liked, new like count)."""
+    # one DELETE for an unlike, and an INSERT on top for a like
+    liked = not TweetLikes.objects.filter(user=request.user, tweet=tweet).delete()[0]
+    if liked:
+        try:
+            with transaction.atomic():
+                TweetLikes.objects.create(user=request.user, tweet=tweet)
+        except IntegrityError:
+            liked = False   # a double click that raced this one already liked it
+        else:
+            Tweet.objects.filter(id=tweet.id).update(likes_count=F('likes_count') + 1)
+            notify(
                 notify_by=request.user.profile,
                 notified_user=tweet.user.profile,
                 notify_tweet=tweet,
                 notify_type="like"
             )
+    else:
+        Tweet.objects.filter(id=tweet.id, likes_count__gt=0).update(likes_count=F('likes_count') - 1)
+    likes = Tweet.objects.filter(id=tweet.id).values_list('likes_count', flat=True).first() or 0
+    realtime.publish_likes(tweet.id, likes)
+    return liked, likes
 
-        if not created:
-            like.delete()  
-
-
-        next_url = request.POST.get('next',None)
-        print(f"Tweet: {tweet}, User: {request.user}")
-        print(f"next_url: {next_url or None}, like: {like}, created: {created}")
-        # if next_url: 
-        #     return redirect('prof',pk=next_url) 
 
+def add_likes(request,id):
+    tweet = get_object_or_404(Tweet.objects.select_related('user__profile'),id=id)
+    if tweet:
+        _toggle_like(request, tweet)
         # print(request.POST)
         # return redirect('home')    
         return redirect(request.META.get("HTTP_REFERER"))
 
+def _add_comment(request, tweet, description):
+    comment = TweetComment.objects.create(user=request.user,tweet=tweet,description = description)
+    Tweet.objects.filter(id=tweet.id).update(comments_count=F('comments_count') + 1)
+    bump_card_version(tweet.id)
+    notify(
+        notify_by=request.user.profile,
+        notified_user=tweet.user.profile,
+        notify_tweet=tweet,
+        notify_type="comment"
+    )
+    return comment
+
+
 def add_comments(request,id):
-    tweet = get_object_or_404(Tweet,id=id)
+    tweet = get_object_or_404(Tweet.objects.select_related('user__profile'),id=id)
     if tweet:
         if request.method == "POST":
-            description = request.POST.get('description')
-            TweetComment.objects.create(user=request.user,tweet=tweet,description = description) 
-            Notification.objects.create(
-                notify_by=request.user.profile,
-                notified_user=tweet.user.profile,
-                notify_tweet=tweet,
-                notify_type="comment"
-            )   
+            _add_comment(request, tweet, request.POST.get('description'))
 
             print("Commented >>>")
             messages.success(request,"Comment added successfully !!!")
@@ -192,6 +266,58 @@ def add_comments(request,id):
         messages.warning(request,"please login to add comments")
         return redirect('home')
 
+
+def _json_login_required(view):
+    # the JSON endpoints answer 401 instead of redirecting, fetch() would follow the redirect to a login page
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': 'login required', 'login_url': settings.LOGIN_URL}, status=401)
+        return view(request, *args, **kwargs)
+    return wrapped
+
+
+@_json_login_required
+@require_POST
+def like_json(request, id):
+    tweet = get_object_or_404(Tweet.objects.select_related('user__profile').only('id', 'user__id', 'user__profile__id'), id=id)
+    liked, likes = _toggle_like(request, tweet)
+    return JsonResponse({'tweet': tweet.id, 'liked': liked, 'likes': likes})
+
+
+@_json_login_required
+@require_POST
+def save_post_json(request, id):
+    get_object_or_404(Tweet.objects.only('id'), id=id)
+    saved = not SavedPosts.objects.filter(user=request.user, tweet_id=id).delete()[0]
+    if saved:
+        SavedPosts.objects.get_or_create(user=request.user, tweet_id=id)
+    return JsonResponse({'tweet': id, 'saved': saved})
+
+
+@_json_login_required
+@require_POST
+def comment_json(request, id):
+    description = (request.POST.get('description') or '').strip()
+    if not description:
+        return JsonResponse({'error': 'empty comment'}, status=400)
+    tweet = get_object_or_404(Tweet.objects.select_related('user__profile').only('id', 'user__id', 'user__profile__id'), id=id)
+    comment = _add_comment(request, tweet, description[:TweetComment._meta.get_field('description').max_length])
+    comments = Tweet.objects.filter(id=tweet.id).values_list('comments_count', flat=True).first()
+    html = render_to_string('front_components/comment_item.html', {'comment': comment}, request=request)
+    return JsonResponse({'tweet': tweet.id, 'comments': comments, 'html': html})
+
+
+@_json_login_required
+@require_POST
+def follow_json(request, id):
+    target = get_object_or_404(Profile.objects.select_related('user'), user_id=id)
+    if target.user_id == request.user.id:
+        return JsonResponse({'error': 'you cannot follow yourself'}, status=400)
+    following, followers = _set_follow(request, target, request.POST.get('follow'))
+    return JsonResponse({'user': id, 'following': following, 'followers': followers})
+
+
 def signin(request):
     if request.method == "POST":
         username = request.POST["username"] 
@@ -226,13 +352,10 @@ def register(request):
         
         
         if form.is_valid():
-            user = form.save()
-            print(user)
+            user = form.save(commit=False)
             user.email = email  # Assign the email to the user instance
-            user.save()
-            profile = get_object_or_404(Profile,user = user)                    
-            profile.phone_number = phone_number
-            profile.save()
+            # user, profile with the phone number and the self-follow in one transaction
+            accounts.create_account(user, phone_number=phone_number)
 
             messages.success(request,"User created successfully please login now")
             return redirect('signin')
@@ -251,18 +374,41 @@ def search_user(request):
         username = request.GET.get('username')
         username = User.objects.filter(username=username).first()
         if username:
-            return profile(request,username.id)
+            return redirect('prof',pk=username.id)
         else:
             return render(request,"notexists.html")
     return JsonResponse({'success': False, 'message': 'Invalid request'}, status=400)  
 
+@login_required(login_url='/login/')
+def tag_feed(request, name, template_name='tag.html'):
+    page = paginate_queryset(tags.tag_links(name), request.GET.get('cursor'), settings.TIMELINE_PAGE_SIZE)
+    found = {tweet.id: tweet for tweet in feed_queryset(Tweet.objects.filter(id__in=[link.tweet_id for link in page['results']]))}
+    tweets = load_feed([found[link.tweet_id] for link in page['results'] if link.tweet_id in found])
+    list_id_of_saved_posts = saved_tweet_ids(request.user, tweets)
+    return render(request, template_name, {'tag': name.lower(), 'tweets': tweets, 'list_id_of_saved_posts': list_id_of_saved_posts, 'next_cursor': page['next_cursor']})
+
+@login_required(login_url='/login/')
+def search(request, template_name='search.html'):
+    query = request.GET.get('q', '').strip()
+    page = search_tweets(query, request.GET.get('cursor'), settings.TIMELINE_PAGE_SIZE)
+    # ids come back in rank order, load the cards in one go and put them back in that order
+    found = {tweet.id: tweet for tweet in feed_queryset(Tweet.objects.filter(id__in=page['results']))}
+    tweets = load_feed([found[tweet_id] for tweet_id in page['results'] if tweet_id in found])
+    list_id_of_saved_posts = saved_tweet_ids(request.user, tweets)
+    return render(request, template_name, {'query': query, 'tweets': tweets, 'list_id_of_saved_posts': list_id_of_saved_posts, 'next_cursor': page['next_cursor']})
+
 @login_required(login_url='/login/') 
-def suggest_users(request):
+@cache_control(private=True, max_age=30)
+async def suggest_users(request):
     query = request.GET.get('username', '')
     if len(query)>0:
-        # Perform a case-insensitive search for usernames containing the query
-        users = User.objects.filter(username__icontains=query).values('username')[:10]
-        suggestions = list(users)  # Convert queryset to list
+        # served from the in-memory username index, prefix matches ranked by followers then infix matches.
+        # once it is built there is no database involved, the first call loads it on a thread
+        if user_search.loaded_index() is not None:
+            usernames = suggest(query, limit=10)
+        else:
+            usernames = await sync_to_async(suggest)(query, limit=10)
+        suggestions = [{'username': username} for username in usernames]
         return JsonResponse(suggestions, safe=False)
     return JsonResponse([], safe=False)          
 
@@ -271,15 +417,20 @@ def update_profile(request, username):
     user = get_object_or_404(User, username=username)
     user_profile = get_object_or_404(Profile, user=user)
 
+    if request.method == "POST" and image_rejected(request, 'image'):
+        return redirect('update_profile', username=username)
+
     if request.method == "POST" and "update" in request.POST:
         form = UpdateProfileForm(request.POST, request.FILES, instance=user_profile)
         print(request.FILES.get('image') or None,"\n",request.POST)
         if 'image-clear' in request.POST:  # 'image-clear' is the name of the checkbox field in the form so i could get to know that user want to delete previous file now want to upload any profile pic
             if user_profile.image:
+                images.discard_variants(user_profile)
                 user_profile.image.delete() 
 
         new_profile_img = request.FILES.get('image')  # Get the uploaded file directly from request.FILES
         if new_profile_img and user_profile.image:
+            images.discard_variants(user_profile)
             user_profile.image.delete() 
 
         if form.is_valid():
@@ -289,6 +440,8 @@ def update_profile(request, username):
             # old_profile_image = user_profile.image
             # print(old_profile_image)
             form.save() 
+            if new_profile_img:
+                images.process_upload(user_profile, 'image')
 
             # if old_profile_image and new_profile_img and new_profile_img!=old_profile_image:
             #     old_profile_image_path = old_profile_image.path
@@ -328,20 +481,24 @@ def add_Save_Post(request,id):
         messages.success(request,"Something went wrong")
         return redirect('home')
         
-def saved_posts(request):
-    saved_posts_for_users = SavedPosts.objects.filter(user=request.user)
-
-    list_of_all_saved_posts = saved_posts_for_users.values_list('tweet_id',flat=True)
-    tweets = Tweet.objects.filter(id__in=list_of_all_saved_posts).annotate(
-        saved_at=Subquery(
-            saved_posts_for_users.filter(tweet_id=OuterRef('id')).values('saved_at')[:1]
-        )
+def saved_posts(request,template_name='saved_posts.html'):
+    page = paginate_queryset(
+        SavedPosts.objects.filter(user=request.user).only('id', 'saved_at', 'tweet_id'),
+        request.GET.get('cursor'),
+        settings.TIMELINE_PAGE_SIZE,
+        ordering=('-saved_at', '-id'),
     )
-    print(tweets)
-    
-    
-    print(list(list_of_all_saved_posts))
-    return render(request,'saved_posts.html',{'tweets':tweets,'list_of_all_saved_posts':list_of_all_saved_posts}) 
+    saved_tweets = {tweet.id: tweet for tweet in feed_queryset(Tweet.objects.filter(id__in=[saved_post.tweet_id for saved_post in page['results']]))}
+    tweets = []
+    for saved_post in page['results']:
+        tweet = saved_tweets.get(saved_post.tweet_id)
+        if tweet:
+            tweet.saved_at = saved_post.saved_at
+            tweets.append(tweet)
+    load_feed(tweets)
+
+    list_of_all_saved_posts = [tweet.id for tweet in tweets]
+    return render(request,template_name,{'tweets':tweets,'list_of_all_saved_posts':list_of_all_saved_posts,'next_cursor':page['next_cursor']}) 
 
 
 # def saved_posts(request):
@@ -361,16 +518,51 @@ def saved_posts(request):
 
 
 
+@staff_member_required
+def tweet_card_cache_stats(request):
+    return JsonResponse(card_stats())
+
+
 @login_required(login_url='/login/') 
-def user_notifications(request):
-    notifications = Notification.objects.filter(notified_user=request.user.profile,is_read=False).order_by('-notify_time')
-    return render(request, "notifications.html", {"notifications": notifications})
+async def user_notifications(request):
+    user = await aio.request_user(request)
+    notifications = [
+        notification async for notification in
+        Notification.objects.filter(notified_user__user_id=user.id,is_read=False)
+        .select_related('notify_by__user','notify_tweet__user')
+        .order_by('-notify_time')
+    ]
+    await sync_to_async(attach_recent_actors)(notifications)
+    # newest row on the page, "mark all as read" leaves anything that arrives after it unread
+    up_to = encode_cursor([notifications[0].notify_time, notifications[0].id]) if notifications else None
+    return await sync_to_async(render)(request, "notifications.html", {"notifications": notifications, "up_to": up_to})
+
+
+async def live_events(request):
+    # an EventSource can't follow the login redirect, and under WSGI the stream would hold a thread forever,
+    # 204 tells the browser to stop reconnecting in both cases
+    user = await request.auser()
+    if not user.is_authenticated or not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    profile_id = await Profile.objects.filter(user=user).values_list('id', flat=True).aget()
+    initial = [{'type': 'notifications', 'unread': await sync_to_async(unread_count)(profile_id)}]
+    tweet_ids = realtime.parse_tweet_ids(request.GET.get('tweets'))   # the tweets on the page, for their like counts
+    response = StreamingHttpResponse(realtime.event_stream(profile_id, initial, tweet_ids), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'   # nginx would otherwise hold the events back in its buffer
+    return response
 
 
 @login_required(login_url='/login/')
 def mark_as_read_notification(request,id):
-    notification = Notification.objects.get(id=id)
-    notification.is_read = True
-    notification.save()
+    mark_read(request.user.profile, id)
 
     return redirect('notification_list') 
+
+
+@login_required(login_url='/login/')
+def mark_all_notifications_read(request):
+    if request.method == "POST":
+        marked = mark_all_read(request.user.profile, request.POST.get('up_to'))
+        messages.success(request, f"{marked} notifications marked as read")
+    return redirect('notification_list')